@@ -9,7 +9,17 @@
 # version 2 of the GNU General Public License.
 #
 # See the LICENSE file in the source distribution for further information.
+import bisect
+import contextlib
+import copy
+import fnmatch
+import functools
+import gzip
+import hashlib
+import io
+import json
 import os
+import queue
 import tarfile
 import shutil
 import logging
@@ -17,11 +27,16 @@ import codecs
 import errno
 import stat
 import re
+import shlex
+import subprocess
+import tempfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from threading import Lock
+from threading import Lock, Thread
 
 from importlib.util import find_spec
-from sos.utilities import sos_get_command_output
 
 try:
     import selinux
@@ -31,11 +46,414 @@ except ImportError:
     # the sos archive
     pass
 
+try:
+    from compression import zstd
+except ImportError:
+    # zstd is only in the standard library of python 3.14 and later
+    zstd = None
+
 P_FILE = "file"
 P_LINK = "link"
 P_NODE = "node"
 P_DIR = "dir"
 
+# the size of the blocks of the tar stream that are compressed independently
+COMPRESS_BLOCK_SIZE = 8 * 1024 * 1024
+# the file extensions used for each compression method
+COMPRESS_SUFFIXES = {'gzip': 'gz', 'xz': 'xz', 'zstd': 'zst'}
+# the member of an indexed archive holding its index, relative to its root
+INDEX_MEMBER = 'sos_reports/archive_index.json'
+# how far from the end of an archive its index is searched for
+INDEX_SCAN_SIZE = 16 * 1024 * 1024
+# how much of each possible start of the index is decompressed to check if
+# it is the index, and in how large steps
+INDEX_PEEK_SIZE = 64 * 1024
+# the bytes each block written by BlockCompressor starts with
+INDEX_BLOCK_MAGIC = {
+    'xz': b'\xfd7zXZ\x00',
+    # gzip members are written without a file name or time
+    'gz': b'\x1f\x8b\x08\x00\x00\x00\x00\x00',
+    'zst': b'\x28\xb5\x2f\xfd',
+}
+
+
+class HashingWriter():
+    """A write-only binary file, computing the checksum of its content as it
+    is written, so that it does not have to be read back to be hashed.
+
+    :param path:        The path of the file to write
+    :type path:         ``str``
+
+    :param hash_name:   The name of the hashlib algorithm to use, or None to
+                        not compute a checksum
+    :type hash_name:    ``str``
+    """
+
+    def __init__(self, path, hash_name=None):
+        self._file = open(path, 'wb')  # pylint: disable=consider-using-with
+        self._digest = hashlib.new(hash_name) if hash_name else None
+        self.closed = False
+
+    def write(self, data):
+        """Write data to the file, adding it to the checksum
+
+        :param data:    The data to write
+        :type data:     ``bytes``
+
+        :returns:   The number of bytes written
+        :rtype:     ``int``
+        """
+        if self._digest is not None:
+            self._digest.update(data)
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self.closed = True
+        self._file.close()
+
+    def hexdigest(self):
+        """Get the checksum of what was written so far
+
+        :returns:   The checksum, or None if no checksum is computed
+        :rtype:     ``str``
+        """
+        if self._digest is None:
+            return None
+        return self._digest.hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BlockCompressor():
+    """A write-only file object compressing what is written to it in blocks
+    of ``COMPRESS_BLOCK_SIZE`` bytes, several blocks at once.
+
+    Each block is compressed on its own into a complete xz stream, gzip
+    member or zstd frame, and the compressed blocks are written to the file
+    in order. All three formats allow those to be concatenated, so the
+    result is read by xz, gzip, zstd and tar as a single compressed file.
+
+    Blocks are compressed by a pool of threads, as the compression modules
+    release the GIL while compressing. At most two blocks per thread are
+    kept in memory at any time.
+
+    The compressed and uncompressed offsets of each block written are kept
+    in ``blocks``, so that a block can later be decompressed on its own.
+
+    :param output:      The binary file to write the compressed blocks to,
+                        which is closed along with the compressor
+    :type output:       ``file``
+
+    :param method:      The compression method, ``xz``, ``gz`` or ``zst``
+    :type method:       ``str``
+
+    :param threads:     The number of blocks to compress at once
+    :type threads:      ``int``
+
+    :param level:       The compression level, or preset for xz
+    :type level:        ``int``
+    """
+
+    def __init__(self, output, method, threads=1, level=None):
+        if method == 'xz':
+            import lzma
+            self._compress = functools.partial(
+                lzma.compress, preset=3 if level is None else level
+            )
+        elif method == 'gz':
+            self._compress = functools.partial(
+                gzip.compress, compresslevel=6 if level is None else level,
+                mtime=0
+            )
+        elif method == 'zst' and zstd is not None:
+            self._compress = functools.partial(
+                zstd.compress, level=3 if level is None else level
+            )
+        else:
+            raise ValueError(f"unsupported compression method '{method}'")
+        self._threads = max(threads or 1, 1)
+        self._file = output
+        self._pool = ThreadPoolExecutor(self._threads,
+                                        thread_name_prefix='sos-compress')
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._offset = 0
+        self._written = 0
+        self.blocks = []
+        self.closed = False
+
+    def _write_block(self):
+        future, offset = self._pending.popleft()
+        data = future.result()
+        self.blocks.append((self._written, offset))
+        self._file.write(data)
+        self._written += len(data)
+
+    def _submit(self, size):
+        block = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        offset = self._offset - len(self._buffer) - len(block)
+        self._pending.append((self._pool.submit(self._compress, block),
+                              offset))
+        # write out compressed blocks in order, waiting for the oldest one
+        # only when too many are in flight
+        while self._pending and (self._pending[0][0].done() or
+                                 len(self._pending) > 2 * self._threads):
+            self._write_block()
+
+    def write(self, data):
+        """Add data to the compressed file
+
+        :param data:    The uncompressed data
+        :type data:     ``bytes``
+
+        :returns:   The number of bytes written
+        :rtype:     ``int``
+        """
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += data
+        self._offset += len(data)
+        while len(self._buffer) >= COMPRESS_BLOCK_SIZE:
+            self._submit(COMPRESS_BLOCK_SIZE)
+        return len(data)
+
+    def tell(self):
+        """The number of uncompressed bytes written so far
+        """
+        return self._offset
+
+    def end_block(self):
+        """Compress what was written since the last block as a block of its
+        own, and write every block out, so that what is written next starts
+        a new block
+
+        :returns:   The compressed and uncompressed offsets the next block
+                    starts at
+        :rtype:     ``tuple``
+        """
+        if self._buffer:
+            self._submit(len(self._buffer))
+        while self._pending:
+            self._write_block()
+        return (self._written, self._offset)
+
+    def close(self):
+        """Compress the last block, write every block out and close the file
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self._buffer or not self._offset:
+                self._submit(len(self._buffer))
+            while self._pending:
+                self._write_block()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _IndexedTarFile(tarfile.TarFile):
+    """A tar file being written, that records where the data of each
+    regular file is in the uncompressed tar stream, and the target of each
+    link
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.data_offsets = {}
+        self.links = {}
+        super().__init__(*args, **kwargs)
+
+    def addfile(self, tarinfo, fileobj=None):
+        super().addfile(tarinfo, fileobj)
+        if tarinfo.isreg():
+            # the data ends where the tar stream now is, padded to a block
+            blocks = -(-tarinfo.size // tarfile.BLOCKSIZE)
+            self.data_offsets[tarinfo.name] = [
+                self.offset - blocks * tarfile.BLOCKSIZE, tarinfo.size
+            ]
+        elif tarinfo.issym():
+            self.links[tarinfo.name] = os.path.normpath(os.path.join(
+                os.path.dirname(tarinfo.name), tarinfo.linkname
+            ))
+        elif tarinfo.islnk():
+            self.links[tarinfo.name] = tarinfo.linkname
+
+    def get_index(self):
+        """Get where the data of every regular file, and of every link to
+        one, is in the uncompressed tar stream
+
+        :returns:   Member names mapped to their data offset and size
+        :rtype:     ``dict``
+        """
+        index = dict(self.data_offsets)
+        for name in self.links:
+            target = name
+            # follow chains of links, but not loops of them
+            for _ in range(len(self.links)):
+                target = self.links.get(target)
+                if target not in self.links:
+                    break
+            if target in self.data_offsets:
+                index[name] = self.data_offsets[target]
+        return index
+
+
+class ArchiveIndexReader():
+    """Reads single files from an archive written by ``TarFileArchive`` with
+    an index, without decompressing the archive from its start.
+
+    Such an archive is compressed in independent blocks, and its last
+    member, ``INDEX_MEMBER``, starts a final block of its own. It maps the
+    path of each file in the archive to the offset of its data in the tar
+    stream, and each block to its offsets in the compressed and the tar
+    stream, so that only the blocks holding a file are read and decompressed
+    to get its content.
+
+    The index is searched for at the end of the archive, by looking for the
+    start of a block that decompresses to it. An archive without an index,
+    or whose index does not match its blocks, has no indexed files.
+
+    :param path:    The path of the compressed archive
+    :type path:     ``str``
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.method = None
+        self._blocks = []
+        self._members = {}
+        try:
+            self._load()
+        except (OSError, ValueError) as err:
+            logging.getLogger('sos').debug(
+                f"could not read the index of '{path}': {err}"
+            )
+
+    def _decompress(self, data):
+        if self.method == 'xz':
+            import lzma
+            return lzma.decompress(data)
+        if self.method == 'gz':
+            return gzip.decompress(data)
+        return zstd.decompress(data)
+
+    def _peek(self, data):
+        # decompress just enough of the data for the first tar header
+        if self.method == 'xz':
+            import lzma
+            decomp = lzma.LZMADecompressor()
+        elif self.method == 'gz':
+            decomp = zlib.decompressobj(wbits=31)
+        else:
+            decomp = zstd.ZstdDecompressor()
+        content = b''
+        for pos in range(0, len(data), INDEX_PEEK_SIZE):
+            content += decomp.decompress(data[pos:pos + INDEX_PEEK_SIZE],
+                                         INDEX_PEEK_SIZE - len(content))
+            if len(content) >= INDEX_PEEK_SIZE or decomp.eof:
+                break
+        return content
+
+    def _load(self):
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as afile:
+            head = afile.read(len(max(INDEX_BLOCK_MAGIC.values(), key=len)))
+            for method, magic in INDEX_BLOCK_MAGIC.items():
+                if head.startswith(magic):
+                    self.method = method
+            if self.method is None or (self.method == 'zst' and zstd is None):
+                return
+            start = max(size - INDEX_SCAN_SIZE, 0)
+            afile.seek(start)
+            tail = afile.read()
+        pos = len(tail)
+        view = memoryview(tail)
+        while pos > 0:
+            pos = tail.rfind(INDEX_BLOCK_MAGIC[self.method], 0, pos)
+            if pos < 0:
+                return
+            if self._read_index(view[pos:], start + pos):
+                return
+
+    def _read_index(self, data, offset):
+        try:
+            # most candidates are not the index, so only decompress all of
+            # the one whose first member is
+            with tarfile.open(fileobj=io.BytesIO(self._peek(data))) as tar:
+                member = tar.next()
+                if member is None or not member.name.endswith(INDEX_MEMBER):
+                    return False
+            content = self._decompress(data)
+            with tarfile.open(fileobj=io.BytesIO(content)) as tar:
+                member = tar.next()
+                index = json.load(tar.extractfile(member))
+        except Exception:
+            # not the start of a block, or not the index
+            return False
+        # the index must end with the block it is in
+        if index['blocks'][-1][0] != offset:
+            return False
+        self._blocks = index['blocks']
+        self._members = index['members']
+        return True
+
+    @property
+    def has_index(self):
+        """True if the index of the archive was found
+        """
+        return bool(self._blocks)
+
+    def __contains__(self, name):
+        return name in self._members
+
+    def get_members(self):
+        """Get the names of the indexed files
+
+        :returns:   The names of the files, as members of the archive
+        :rtype:     ``list``
+        """
+        return list(self._members)
+
+    def read(self, name):
+        """Get the content of an indexed file, decompressing only the blocks
+        that hold it
+
+        :param name:    The name of the file, as a member of the archive
+        :type name:     ``str``
+
+        :returns:   The content of the file
+        :rtype:     ``bytes``
+
+        :raises:    ``KeyError`` if the file is not indexed
+        """
+        offset, size = self._members[name]
+        if not size:
+            return b''
+        uoffsets = [block[1] for block in self._blocks]
+        first = bisect.bisect_right(uoffsets, offset) - 1
+        last = bisect.bisect_left(uoffsets, offset + size)
+        start, end = self._blocks[first][0], self._blocks[last][0]
+        with open(self.path, 'rb') as afile:
+            afile.seek(start)
+            content = self._decompress(afile.read(end - start))
+        offset -= self._blocks[first][1]
+        return content[offset:offset + size]
+
 
 class Archive:
     """Abstract base class for archives."""
@@ -52,6 +470,14 @@ class Archive:
     _debug = False
 
     _path_lock = Lock()
+    # per-path locks serializing substitutions applied to the same file
+    _sub_locks = {}
+    # records the time spent building the archive when set to a Tracer
+    tracer = None
+    # the hashlib algorithm the checksum of the final archive is computed
+    # with while it is written, and that checksum
+    _hash_name = None
+    _checksum = None
 
     def _format_msg(self, msg):
         return f"[archive:{self.archive_type()}] {msg}"
@@ -59,6 +485,29 @@ class Archive:
     def set_debug(self, debug):
         self._debug = debug
 
+    def set_hash_name(self, hash_name):
+        """Compute the checksum of the final archive with a given algorithm
+        while it is written
+
+        :param hash_name:   The name of the hashlib algorithm to use
+        :type hash_name:    ``str``
+        """
+        self._hash_name = hash_name
+
+    def get_checksum(self):
+        """Get the checksum of the archive returned by ``finalize()``, as
+        computed while it was written
+
+        :returns:   The checksum, or None if it was not computed
+        :rtype:     ``str``
+        """
+        return self._checksum
+
+    def _trace(self, name):
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(name, cat='archive')
+
     def log_error(self, msg):
         self.log.error(self._format_msg(msg))
 
@@ -360,30 +809,99 @@ class FileCacheArchive(Archive):
 
             # Handle adding a file from either a string respresenting
             # a path, or a File object open for reading.
-            if not getattr(src, "read", None):
-                # path case
-                try:
-                    shutil.copy(src, dest)
-                except OSError as e:
-                    # Filter out IO errors on virtual file systems.
-                    if src.startswith("/sys/") or src.startswith("/proc/"):
-                        pass
-                    else:
-                        self.log_info(f"File {src} not collected: '{e}'")
-
-                self._copy_attributes(src, dest)
-                file_name = f"'{src}'"
-            else:
+            if getattr(src, "read", None):
                 # Open file case: first rewind the file to obtain
                 # everything written to it.
                 src.seek(0)
                 with open(dest, "w", encoding='utf-8') as f:
                     for line in src:
                         f.write(line)
-                file_name = "open file"
+                self.log_debug("added open file to FileCacheArchive "
+                               f"'{self._archive_root}'")
+                return
 
-            self.log_debug(f"added {file_name} to FileCacheArchive "
-                           f"'{self._archive_root}'")
+            # claim the destination, so that the path lock does not need to
+            # be held while the source, which may be slow or even block, is
+            # read
+            with open(dest, 'wb'):
+                pass
+
+        # path case
+        try:
+            shutil.copy(src, dest)
+        except OSError as e:
+            # do not leave the claimed destination behind if nothing could be
+            # copied to it
+            with contextlib.suppress(OSError):
+                if not os.path.getsize(dest):
+                    os.unlink(dest)
+            # Filter out IO errors on virtual file systems.
+            if src.startswith("/sys/") or src.startswith("/proc/"):
+                pass
+            else:
+                self.log_info(f"File {src} not collected: '{e}'")
+
+        self._copy_attributes(src, dest)
+        self.log_debug(f"added '{src}' to FileCacheArchive "
+                       f"'{self._archive_root}'")
+
+    def make_staging_file(self):
+        """Create an empty file outside of the archive, that a file can be
+        copied to with ``stage_file()`` before it is added to the archive
+
+        :returns: The path of the staging file
+        :rtype: ``str``
+        """
+        staging_dir = f"{self._archive_root}.staging"
+        os.makedirs(staging_dir, 0o700, exist_ok=True)
+        fd, staged = tempfile.mkstemp(dir=staging_dir)
+        os.close(fd)
+        return staged
+
+    def stage_file(self, src, staged):
+        """Copy a file, and its attributes, to a staging file. The archive is
+        left untouched, so that a copy that is abandoned before it finishes
+        leaves nothing behind in it.
+
+        :param src: The path of the file to copy
+        :type src: ``str``
+
+        :param staged: The staging file from ``make_staging_file()``
+        :type staged: ``str``
+
+        :returns: True if the file was copied
+        :rtype: ``bool``
+        """
+        try:
+            shutil.copyfile(src, staged)
+        except OSError as e:
+            # Filter out IO errors on virtual file systems.
+            if not (src.startswith("/sys/") or src.startswith("/proc/")):
+                self.log_info(f"File {src} not collected: '{e}'")
+            return False
+        self._copy_attributes(src, staged)
+        return True
+
+    def add_staged_file(self, staged, dest, force=False):
+        """Move a file copied with ``stage_file()`` into the archive
+
+        :param staged: The staging file the file was copied to
+        :type staged: ``str``
+
+        :param dest: The path of the file in the archive
+        :type dest: ``str``
+
+        :param force: Replace a file already at `dest`
+        :type force: ``bool``
+        """
+        with self._path_lock:
+            dest = self.check_path(dest, P_FILE, force=force)
+            if dest:
+                os.replace(staged, dest)
+                self.log_debug(f"added '{dest}' to FileCacheArchive "
+                               f"'{self._archive_root}'")
+                return
+        os.unlink(staged)
 
     def add_string(self, content, dest, mode='w'):
         with self._path_lock:
@@ -540,6 +1058,8 @@ class FileCacheArchive(Archive):
     def cleanup(self):
         if os.path.isdir(self._archive_root):
             shutil.rmtree(self._archive_root)
+        # copies that were abandoned may have been left staged
+        shutil.rmtree(f"{self._archive_root}.staging", ignore_errors=True)
 
     def add_final_manifest_data(self, method):
         """Adds component-agnostic data to the manifest so that individual
@@ -581,31 +1101,49 @@ class FileCacheArchive(Archive):
         :rtype: ``int``
         """
         common_flags = re.IGNORECASE | re.MULTILINE
-        if hasattr(regexp, "pattern"):
-            pattern = regexp.pattern
-            flags = regexp.flags | common_flags
-        else:
-            pattern = regexp
-            flags = common_flags
-
-        content = ""
-        with self.open_file(path) as readable:
-            content = readable.read()
-        if not isinstance(content, str):
-            content = content.decode('utf8', 'ignore')
-        result, replacements = re.subn(pattern, subst, content,
-                                       flags=flags)
-        if replacements:
-            self.add_string(result, path)
-        else:
-            replacements = 0
+        return self.do_file_subs(path, [(regexp, subst, common_flags)])[0]
+
+    def do_file_subs(self, path, subs):
+        """Apply several regexp substitutions to a file in the archive, in
+        order, reading and rewriting the file only once.
+
+        :param path: Path in the archive where the file can be found
+        :type path: ``str``
+
+        :param subs: The substitutions to apply as (regexp, subst, flags)
+                     tuples, where flags are ``re`` flags to use in addition
+                     to those of a compiled regexp
+        :type subs: ``list`` of ``tuple``
+
+        :returns: Number of replacements made by each substitution
+        :rtype: ``list`` of ``int``
+        """
+        with self._path_lock:
+            sub_lock = self._sub_locks.setdefault(path, Lock())
+
+        replacements = []
+        with sub_lock:
+            content = ""
+            with self.open_file(path) as readable:
+                content = readable.read()
+            if not isinstance(content, str):
+                content = content.decode('utf8', 'ignore')
+            for regexp, subst, flags in subs:
+                if hasattr(regexp, "pattern"):
+                    flags = regexp.flags | flags
+                    regexp = regexp.pattern
+                content, count = re.subn(regexp, subst, content, flags=flags)
+                replacements.append(count)
+            if any(replacements):
+                self.add_string(content, path)
         return replacements
 
     def finalize(self, method):
         self.log_info(f"finalizing archive '{self._archive_root}' using method"
                       f" '{method}'")
         try:
-            res = self._build_archive(method)
+            with self._trace(f"build ({method})"):
+                res = self._build_archive(method)
         except Exception as err:
             self.log_error(f"An error occurred compressing the archive: {err}")
             return self.name()
@@ -616,7 +1154,8 @@ class FileCacheArchive(Archive):
 
         if self.enc_opts['encrypt']:
             try:
-                return self._encrypt(res)
+                with self._trace('encrypt'):
+                    return self._encrypt(res)
             except Exception as e:
                 exp_msg = "An error occurred encrypting the archive:"
                 self.log_error(f"{exp_msg} {e}")
@@ -638,8 +1177,10 @@ class FileCacheArchive(Archive):
         """
         arc_name = archive.replace("sosreport-", "secured-sosreport-")
         arc_name += ".gpg"
-        enc_cmd = f"gpg --batch -o {arc_name} "
-        env = None
+        # gpg writes the encrypted archive to stdout, so that it is hashed as
+        # it is written
+        enc_cmd = "gpg --batch -o - "
+        env = os.environ.copy()
         if self.enc_opts["key"]:
             # need to assume a trusted key here to be able to encrypt the
             # archive non-interactively
@@ -649,22 +1190,35 @@ class FileCacheArchive(Archive):
             # prevent change of gpg options using a long password, but also
             # prevent the addition of quote characters to the passphrase
             passwd = self.enc_opts['password'].replace('\'"', '')
-            env = {"sos_gpg": passwd}
+            env["sos_gpg"] = passwd
             enc_cmd += "-c --passphrase-fd 0 "
             enc_cmd = f"/bin/bash -c \"echo $sos_gpg | {enc_cmd}\""
             enc_cmd += archive
-        r = sos_get_command_output(enc_cmd, timeout=0, env=env)
-        if r["status"] == 0:
+        # gpg's messages are kept from the terminal, and written to a file
+        # rather than a pipe so that gpg cannot block on a full pipe
+        with HashingWriter(arc_name, self._hash_name) as output, \
+                tempfile.TemporaryFile() as errors:
+            with subprocess.Popen(shlex.split(enc_cmd), stdout=subprocess.PIPE,
+                                  stderr=errors, env=env) as proc:
+                shutil.copyfileobj(proc.stdout, output, 1024**2)
+            errors.seek(0)
+            error = errors.read().decode('utf-8', 'ignore').strip()
+        if proc.returncode == 0:
+            if error:
+                self.log_debug(f"gpg: {error}")
+            self._checksum = output.hexdigest()
             return arc_name
-        if r["status"] == 2:
+        with contextlib.suppress(OSError):
+            os.unlink(arc_name)
+        if proc.returncode == 2:
             if self.enc_opts["key"]:
                 msg = "Specified key not in keyring"
             else:
                 msg = "Could not read passphrase"
+            if error:
+                msg += f": {error}"
         else:
-            # TODO: report the actual error from gpg. Currently, we cannot as
-            # sos_get_command_output() does not capture stderr
-            msg = f"gpg exited with code {r['status']}"
+            msg = error or f"gpg exited with code {proc.returncode}"
         raise Exception(msg)
 
     def _build_archive(self, method):  # pylint: disable=unused-argument
@@ -672,7 +1226,19 @@ class FileCacheArchive(Archive):
 
 
 class TarFileArchive(FileCacheArchive):
-    """ archive class using python TarFile to create tar archives"""
+    """ archive class using python TarFile to create tar archives
+
+    The archive is normally built from the cache directory once collection
+    is finished. Alternatively, it can be started early with
+    ``start_stream()``, after which the directories passed to
+    ``stream_dir()`` are appended to the compressed archive, and removed
+    from the cache, while collection goes on, and only the rest of the cache
+    is added when the archive is finalized.
+
+    If ``set_index()`` is used, the archive ends with an index of where the
+    content of each file is in it, which ``ArchiveIndexReader`` uses to read
+    single files without decompressing the whole archive.
+    """
 
     method = None
     _with_selinux_context = False
@@ -685,6 +1251,15 @@ class TarFileArchive(FileCacheArchive):
         self._archive_name = os.path.join(
             tmpdir, self.name()  # lgtm [py/init-calls-subclass]
         )
+        self._stream = None
+        self._stream_hold = []
+        self._stream_queue = None
+        self._stream_thread = None
+        self._stream_error = None
+        self._comp_mode = None
+        self._output = None
+        self._compressor = None
+        self._index = False
 
     def set_tarinfo_from_stat(self, tar_info, fstat, mode=None):
         tar_info.mtime = fstat.st_mtime
@@ -727,34 +1302,313 @@ class TarFileArchive(FileCacheArchive):
     def name(self):
         return f"{self._archive_root}.{self._suffix}"
 
-    def _build_archive(self, method):
+    def _open_tar(self, method):
+        if method == 'zstd' and zstd is None:
+            self.log_warn("zstd compression is not available with this "
+                          "python version, using default compression")
+            method = 'auto'
         if method == 'auto':
             method = 'xz' if find_spec('lzma') is not None else 'gzip'
-        _comp_mode = method.strip('ip')
-        self._archive_name = f"{self._archive_name}.{_comp_mode}"
-        # tarfile does not currently have a consistent way to define comnpress
-        # level for both xz and gzip ('preset' for xz, 'compresslevel' for gz)
-        if method == 'gzip':
-            kwargs = {'compresslevel': 6}
+        self._comp_mode = COMPRESS_SUFFIXES[method]
+        self._archive_name = f"{self._archive_name}.{self._comp_mode}"
+        # the tar stream is compressed in blocks, on as many threads as
+        # plugins are run on, and hashed once compressed
+        self._output = HashingWriter(self._archive_name, self._hash_name)
+        self._compressor = BlockCompressor(self._output, self._comp_mode,
+                                           threads=self._threads)
+        return _IndexedTarFile.open(fileobj=self._compressor, mode='w')
+
+    def set_index(self, index):
+        """Write an index of the archive as its last member, so that single
+        files can be read from it with ``ArchiveIndexReader``
+
+        :param index:   Whether to write the index
+        :type index:    ``bool``
+        """
+        self._index = index
+
+    def _add_index(self, tar):
+        # the index starts a block of its own, whose offsets end the list of
+        # blocks, and that it is looked for from the end of the archive
+        blocks = self._compressor.blocks + [self._compressor.end_block()]
+        index = json.dumps({
+            'blocks': blocks,
+            'members': tar.get_index()
+        }).encode('utf-8')
+        tar_info = tarfile.TarInfo(name=f"{self._name}/{INDEX_MEMBER}")
+        tar_info.size = len(index)
+        tar_info.mtime = int(datetime.now().timestamp())
+        tar_info.mode = 0o600
+        tar.addfile(tar_info, io.BytesIO(index))
+
+    def start_stream(self, method, hold=None):
+        """Open the compressed archive before collection ends, so that
+        content is appended to it as soon as it is passed to ``stream_dir()``
+
+        :param method:  The compression method of the archive
+        :type method:   ``str``
+
+        :param hold:    Patterns of paths, relative to the archive root, that
+                        may still be changed once streamed, and must be kept
+                        in the cache until the archive is finalized
+        :type hold:     ``list``
+        """
+        self._stream = self._open_tar(method)
+        self._stream_hold = list(hold or [])
+        self._stream_queue = queue.SimpleQueue()
+        self._stream_thread = Thread(target=self._stream_worker, daemon=True,
+                                     name='sos-archive-stream')
+        self._stream_thread.start()
+        self.log_info(f"streaming archive to '{self._archive_name}'")
+
+    def stream_dir(self, path):
+        """Append the files under a directory of the archive, whose content
+        will not change anymore, to the archive being streamed, and remove
+        them from the cache
+
+        :param path:    The directory, relative to the archive root
+        :type path:     ``str``
+        """
+        if self._stream is not None:
+            self._stream_queue.put(path)
+
+    def _stream_worker(self):
+        while True:
+            path = self._stream_queue.get()
+            if path is None:
+                return
+            if self._stream_error is not None:
+                # what was not streamed is added when the archive is built
+                continue
+            try:
+                self._stream_path(path)
+            except Exception as err:
+                self.log_error(f"error streaming '{path}' to the archive: "
+                               f"{err}")
+                self._stream_error = err
+
+    def _stream_path(self, path):
+        root = self.dest_path(path)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            # symlinks to directories are members like files are
+            names = sorted(filenames + [
+                d for d in dirnames if os.path.islink(os.path.join(dirpath, d))
+            ])
+            dirnames[:] = [d for d in dirnames if d not in names]
+            for fname in names:
+                fpath = os.path.join(dirpath, fname)
+                relpath = os.path.relpath(fpath, self._archive_root)
+                if any(fnmatch.fnmatch(relpath, hold)
+                       for hold in self._stream_hold):
+                    continue
+                # directories are added along with the rest of the cache
+                self._stream.add(fpath, arcname=f"{self._name}/{relpath}",
+                                 recursive=False,
+                                 filter=self.copy_permissions_filter)
+                os.unlink(fpath)
+
+    def _add_cache(self, tar):
+        # Add commonly reviewed files first, so that they can be more
+        # easily read from memory without needing to extract
+        # the whole archive
+        for _content in ['version.txt', 'sos_reports', 'sos_logs']:
+            if os.path.exists(os.path.join(self._archive_root, _content)):
+                tar.add(
+                    os.path.join(self._archive_root, _content),
+                    arcname=f"{self._name}/{_content}"
+                )
+        # we need to pass the absolute path to the archive root but we
+        # want the names used in the archive to be relative.
+        tar.add(self._archive_root, arcname=self._name,
+                filter=self.copy_permissions_filter)
+
+    def _build_archive(self, method):
+        if self._stream is not None:
+            self._stream_queue.put(None)
+            self._stream_thread.join()
+            tar, self._stream = self._stream, None
+            if self._stream_error is not None:
+                tar.close()
+                self._compressor.close()
+                raise self._stream_error
         else:
-            kwargs = {'preset': 3}
-        with tarfile.open(self._archive_name, mode=f"w:{_comp_mode}",
-                          **kwargs) as tar:
-            # Add commonly reviewed files first, so that they can be more
-            # easily read from memory without needing to extract
-            # the whole archive
-            for _content in ['version.txt', 'sos_reports', 'sos_logs']:
-                if os.path.exists(os.path.join(self._archive_root, _content)):
-                    tar.add(
-                        os.path.join(self._archive_root, _content),
-                        arcname=f"{self._name}/{_content}"
-                    )
-            # we need to pass the absolute path to the archive root but we
-            # want the names used in the archive to be relative.
-            tar.add(self._archive_root, arcname=self._name,
-                    filter=self.copy_permissions_filter)
-        self._suffix += f".{_comp_mode}"
+            tar = self._open_tar(method)
+        with self._compressor, tar:
+            self._add_cache(tar)
+            if self._index:
+                self._add_index(tar)
+        self._checksum = self._output.hexdigest()
+        self._suffix += f".{self._comp_mode}"
         return self.name()
 
 
+class EstimateArchive(FileCacheArchive):
+    """ archive class used by --estimate-only, that tallies the size of the
+    content plugins add to it instead of keeping it.
+
+    Each plugin is expected to add its content through its own view of the
+    archive, as returned by ``for_plugin()``, so that sizes are accounted to
+    the plugin that collected them even while plugins run concurrently. An
+    empty placeholder is left at each collected path so that paths collected
+    by more than one plugin are only accounted once. Content added through
+    the archive itself, such as logs and reports, is kept as normal.
+
+    Plugins may also write files into the archive directly, after reserving
+    their path with ``check_path()``, e.g. for command output written to
+    disk as it is produced. Those files are measured and emptied when the
+    sizes of the plugin are retrieved with ``get_sizes()``.
+    """
+
+    def __init__(self, name, tmpdir, policy, threads, enc_opts, sysroot,
+                 manifest=None):
+        super().__init__(name, tmpdir, policy, threads, enc_opts, sysroot,
+                         manifest)
+        self._owner = None
+        # destination path -> [plugin, size or None if not measured yet]
+        self._sizes = {}
+        self._size_lock = Lock()
+
+    def for_plugin(self, plugname):
+        """Get a view of the archive that accounts content to a plugin
+
+        :param plugname:    The name of the plugin
+        :type plugname:     ``str``
+
+        :returns:   A view sharing the state of this archive
+        :rtype:     ``EstimateArchive``
+        """
+        view = copy.copy(self)
+        view._owner = plugname
+        return view
+
+    def _tally(self, dest, size, append=False):
+        with self._size_lock:
+            entry = self._sizes.setdefault(dest, [self._owner, 0])
+            if append:
+                entry[1] = (entry[1] or 0) + size
+            else:
+                entry[1] = size
+
+    @staticmethod
+    def _get_src_size(src):
+        try:
+            # files in /proc and /sys report a size that does not match
+            # their content, so those have to be read
+            if src.startswith("/proc/") or src.startswith("/sys/"):
+                size = 0
+                with open(src, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024**2), b''):
+                        size += len(chunk)
+                return size
+            return os.stat(src).st_size
+        except OSError:
+            return 0
+
+    def check_path(self, src, path_type, dest=None, force=False):
+        dest = super().check_path(src, path_type, dest=dest, force=force)
+        if dest and self._owner and path_type == P_FILE:
+            with self._size_lock:
+                self._sizes.setdefault(dest, [self._owner, None])
+        return dest
+
+    def add_file(self, src, dest=None, force=False):
+        if not self._owner:
+            super().add_file(src, dest=dest, force=force)
+            return
+        with self._path_lock:
+            dest = self.check_path(dest or src, P_FILE, force=force)
+            if not dest:
+                return
+            # claim the destination, so that the path lock does not need to
+            # be held while the source, which may be slow or even block, is
+            # measured
+            with open(dest, 'w', encoding='utf-8'):
+                pass
+        if getattr(src, "read", None):
+            src.seek(0)
+            size = sum(len(line.encode('utf-8')) for line in src)
+        else:
+            size = self._get_src_size(src)
+        self._tally(dest, size)
+
+    def stage_file(self, src, staged):
+        if not self._owner:
+            return super().stage_file(src, staged)
+        # a sparse file of the size of the source stands in for its content,
+        # and is measured once it was added to the archive
+        os.truncate(staged, self._get_src_size(src))
+        return True
+
+    def add_string(self, content, dest, mode='w'):
+        if not self._owner:
+            super().add_string(content, dest, mode=mode)
+            return
+        with self._path_lock:
+            dest = self.check_path(dest, P_FILE, force=True)
+            if isinstance(content, bytes):
+                content = content.decode('utf8', 'ignore')
+            with open(dest, 'a', encoding='utf-8'):
+                pass
+            self._tally(dest, len(content.encode('utf-8')),
+                        append=mode.startswith('a'))
+
+    def add_binary(self, content, dest):
+        if not self._owner:
+            super().add_binary(content, dest)
+            return
+        with self._path_lock:
+            dest = self.check_path(dest, P_FILE)
+            if not dest:
+                return
+            with open(dest, 'wb'):
+                pass
+            self._tally(dest, len(content))
+
+    def get_sizes(self, plugname):
+        """Get the size of everything a plugin added to the archive, emptying
+        any file the plugin wrote into the archive directly once measured
+
+        :param plugname:    The name of the plugin
+        :type plugname:     ``str``
+
+        :returns:   The size in bytes of each path, relative to the archive
+                    root
+        :rtype:     ``dict``
+        """
+        with self._size_lock:
+            entries = [
+                (dest, entry) for dest, entry in self._sizes.items()
+                if entry[0] == plugname
+            ]
+        sizes = {}
+        for dest, entry in entries:
+            if entry[1] is None:
+                try:
+                    entry[1] = os.lstat(dest).st_size
+                    os.truncate(dest, 0)
+                except OSError:
+                    entry[1] = 0
+            sizes[os.path.relpath(dest, self._archive_root)] = entry[1]
+        return sizes
+
+    def discard_collected(self):
+        """Remove the placeholders of all content accounted to plugins, and
+        the directories left empty
+        """
+        with self._size_lock:
+            dests = list(self._sizes)
+        for dest in dests:
+            try:
+                os.unlink(dest)
+            except OSError:
+                pass
+        for root, _, _ in os.walk(self._archive_root, topdown=False):
+            if root != self._archive_root and not os.listdir(root):
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+
 # vim: set et ts=4 sw=4 :
@@ -536,6 +536,10 @@ third party.
         """Calculate a new checksum for the obfuscated archive, as the previous
         checksum will no longer be valid
         """
+        # archives re-compressed by the cleaner are hashed as they are written
+        for arc in self.completed_reports:
+            if arc.final_archive_path == archive_path and arc.checksum:
+                return arc.checksum + '\n'
         try:
             hash_size = 1024**2  # Hash 1MiB of content at a time.
             with open(archive_path, 'rb') as archive_fp:
@@ -722,7 +726,7 @@ third party.
                         archive.rename_top_dir(
                             self.obfuscate_string(archive.archive_name)
                         )
-                        archive.compress(method)
+                        archive.compress(method, self.hash_name)
                     except Exception as err:
                         self.log_debug(f"Archive {archive.archive_name} failed"
                                        f" to compress: {err}")
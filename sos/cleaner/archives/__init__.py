@@ -16,6 +16,8 @@ import tarfile
 import re
 
 from concurrent.futures import ProcessPoolExecutor
+from sos.archive import (BlockCompressor, HashingWriter, ArchiveIndexReader,
+                         INDEX_MEMBER)
 from sos.utilities import file_is_binary
 
 
@@ -61,10 +63,12 @@ class SoSObfuscationArchive():
     description = 'undetermined'
     is_nested = False
     prep_files = {}
+    index = None
 
     def __init__(self, archive_path, tmpdir):
         self.archive_path = archive_path
         self.final_archive_path = self.archive_path
+        self.checksum = None
         self.tmpdir = tmpdir
         self.archive_name = self.archive_path.split('/')[-1].split('.tar')[0]
         self.ui_name = self.archive_name
@@ -95,6 +99,9 @@ class SoSObfuscationArchive():
         if self.is_tarfile:
             # pylint: disable=consider-using-with
             self.tarobj = tarfile.open(self.archive_path)
+            # archives written with an index let single files be read
+            # without decompressing everything before them
+            self.index = ArchiveIndexReader(self.archive_path)
 
     def get_nested_archives(self):
         """Return a list of ObfuscationArchives that represent additional
@@ -180,6 +187,8 @@ class SoSObfuscationArchive():
         if self.is_extracted is False and self.is_tarfile:
             filename = self.format_file_name(fname)
             try:
+                if filename in self.index:
+                    return self.index.read(filename).decode('utf-8')
                 return self.tarobj.extractfile(filename).read().decode('utf-8')
             except KeyError:
                 self.log_debug(
@@ -201,6 +210,11 @@ class SoSObfuscationArchive():
                 self.report_msg("Extracting...")
             self.extracted_path = self.extract_self()
             self.is_extracted = True
+            # the index of the archive lists unobfuscated paths, and would not
+            # match the re-compressed archive
+            index = os.path.join(self.extracted_path, INDEX_MEMBER)
+            if os.path.isfile(index):
+                os.remove(index)
         else:
             self.extracted_path = self.archive_path
         # if we're running as non-root (e.g. collector), then we can have a
@@ -250,34 +264,52 @@ class SoSObfuscationArchive():
         if self.is_tarfile:
             if self.archive_path.endswith('xz'):
                 return 'xz'
+            if self.archive_path.endswith('zst'):
+                return 'zst'
             return 'gz'
         return None
 
-    def build_tar_file(self, method):
+    def build_tar_file(self, method, hash_name=None):
         """Pack the extracted archive as a tarfile to then be re-compressed
+
+        If `hash_name` is set, the checksum of the new archive is computed
+        with that algorithm while it is written, and saved as `checksum`.
         """
         mode = 'w'
         tarpath = self.extracted_path + '-obfuscated.tar'
-        compr_args = {}
         if method:
-            mode += f":{method}"
             tarpath += f".{method}"
+        output = HashingWriter(tarpath, hash_name)
+        compr_args = {'fileobj': output}
+        comp = None
+        if method == 'zst':
+            # compress the tar stream in blocks, on several threads
+            comp = BlockCompressor(output, method, threads=os.cpu_count())
+            compr_args = {'fileobj': comp}
+        elif method:
+            mode += f":{method}"
             if method == 'xz':
-                compr_args = {'preset': 3}
+                compr_args['preset'] = 3
             else:
-                compr_args = {'compresslevel': 6}
+                compr_args['compresslevel'] = 6
         self.log_debug(f"Building tar file {tarpath}")
-        with tarfile.open(tarpath, mode=mode, **compr_args) as tar:
-            tar.add(self.extracted_path,
-                    arcname=os.path.split(self.archive_name)[1])
+        try:
+            with tarfile.open(tarpath, mode=mode, **compr_args) as tar:
+                tar.add(self.extracted_path,
+                        arcname=os.path.split(self.archive_name)[1])
+        finally:
+            if comp is not None:
+                comp.close()
+            output.close()
+        self.checksum = output.hexdigest()
         return tarpath
 
-    def compress(self, method):
+    def compress(self, method, hash_name=None):
         """Execute the compression command, and set the appropriate final
         archive path for later reference by SoSCleaner on a per-archive basis
         """
         try:
-            self.final_archive_path = self.build_tar_file(method)
+            self.final_archive_path = self.build_tar_file(method, hash_name)
         except Exception as err:
             self.log_debug(f"Exception while re-compressing archive: {err}")
             raise
@@ -391,6 +423,7 @@ class SoSObfuscationArchive():
         obvious_removes = [
             r'.*\.gz$',  # TODO: support flat gz/xz extraction
             r'.*\.xz$',
+            r'.*\.zst$',
             r'.*\.bzip2$',
             r'.*\.tar\..*',  # TODO: support archive unpacking
             r'.*\.txz$',
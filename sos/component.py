@@ -87,6 +87,7 @@ class SoSComponent():
         self.tmpdir = None
         self.tempfile_util = None
         self.manifest = None
+        self.policy_load_time = None
 
         try:
             import signal
@@ -137,8 +138,10 @@ class SoSComponent():
     def load_local_policy(self):
         try:
             import sos.policies
+            start = time.perf_counter()
             self.policy = sos.policies.load(sysroot=self.opts.sysroot,
                                             probe_runtime=self.load_probe)
+            self.policy_load_time = (start, time.perf_counter())
             self.sysroot = self.policy.sysroot
         except KeyboardInterrupt:
             self._exit(0)
@@ -349,7 +352,7 @@ class SoSComponent():
         else:
             self._set_encrypt_from_env_vars()
 
-    def setup_archive(self, name=''):
+    def setup_archive(self, name='', archive_class=None):
         if self.opts.encrypt:
             self._get_encryption_method()
         enc_opts = {
@@ -360,20 +363,17 @@ class SoSComponent():
         if not name:
             name = self.policy.get_archive_name()
         archive_name = os.path.join(self.tmpdir, name)
-        if self.opts.compression_type == 'auto':
-            auto_archive = self.policy.get_preferred_archive()
-            self.archive = auto_archive(archive_name, self.tmpdir,
-                                        self.policy, self.opts.threads,
-                                        enc_opts, self.sysroot,
-                                        self.manifest)
-
-        else:
-            self.archive = TarFileArchive(archive_name, self.tmpdir,
-                                          self.policy, self.opts.threads,
-                                          enc_opts, self.sysroot,
-                                          self.manifest)
+        if archive_class is None:
+            if self.opts.compression_type == 'auto':
+                archive_class = self.policy.get_preferred_archive()
+            else:
+                archive_class = TarFileArchive
+        self.archive = archive_class(archive_name, self.tmpdir, self.policy,
+                                     self.opts.threads, enc_opts, self.sysroot,
+                                     self.manifest)
 
         self.archive.set_debug(self.opts.verbosity > 2)
+        self.archive.set_hash_name(self.policy.get_preferred_hash_name())
 
     def _obfuscate_upload_passwords(self):
         # obfuscate strings like:
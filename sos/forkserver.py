@@ -0,0 +1,536 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" A small helper process that spawns the commands run by sos.
+
+Forking sos itself to run a command gets more expensive the more memory sos
+holds, and sos holds a lot by the end of a report. Commands are instead
+spawned by a separate, small, Python process that is started early, and that
+only ever imports modules of the standard library, so that it can be run as
+a script in isolated mode.
+
+Requests are sent to the helper over a UNIX socket, along with the file
+descriptors the command should write its output to. The helper replies with
+the pid of the command, and later reports its exit status and resource
+usage once it has reaped it.
+"""
+
+import array
+import errno
+import json
+import logging
+import os
+import pwd
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+# largest message exchanged with the helper
+MAX_MSG_SIZE = 1024 * 1024
+# seconds to wait for the helper to report a command as spawned
+SPAWN_TIMEOUT = 30
+
+# namespace type of network namespaces, from <sched.h>
+CLONE_NEWNET = 0x40000000
+
+
+def read_proc_io(pid):
+    """Read the storage I/O counters of a process from /proc/<pid>/io, which
+    for an exited but not yet reaped process include those of its reaped
+    descendants
+    """
+    usage = {'read_bytes': None, 'write_bytes': None}
+    try:
+        with open(f"/proc/{pid}/io", 'r', encoding='utf-8') as iofile:
+            for line in iofile:
+                key, _, val = line.partition(':')
+                if key in usage:
+                    usage[key] = int(val)
+    except (OSError, ValueError):
+        pass
+    return usage
+
+
+def setns(fd, nstype=0):
+    """Move the calling thread into the namespace referred to by `fd`, using
+    ``os.setns()`` where available, or the C library otherwise
+
+    :raises:    ``OSError`` if the namespace could not be entered
+    """
+    if hasattr(os, 'setns'):
+        os.setns(fd, nstype)
+        return
+    import ctypes  # pylint: disable=import-outside-toplevel
+    libc = ctypes.CDLL(None, use_errno=True)
+    if not hasattr(libc, 'setns'):
+        raise OSError(errno.ENOSYS, 'setns is not available')
+    if libc.setns(fd, nstype) != 0:
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+
+
+def enter_netns(path):
+    """Move the calling thread into the network namespace at `path`, e.g. a
+    namespace bind-mounted under /run/netns by ``ip netns add``, or the
+    /proc/<pid>/ns/net link of a process in it
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        setns(fd, CLONE_NEWNET)
+    finally:
+        os.close(fd)
+
+
+def wait_child(pid=-1, options=0):
+    """Wait for a child process to exit, then reap it and collect its
+    resource usage, including that of its reaped descendants
+
+    :param pid:     The pid of the child, or -1 for any child
+    :type pid:      ``int``
+
+    :param options: Additional options for ``os.waitid()``, e.g.
+                    ``os.WNOHANG``
+    :type options:  ``int``
+
+    :returns:   The pid and exit code of the child, and the user and system
+                CPU seconds, maximum resident set size in KiB and bytes read
+                from and written to storage by it, or ``None`` if no child
+                has exited and `options` includes ``os.WNOHANG``
+    :rtype:     ``tuple`` of (``int``, ``int``, ``dict``) or ``None``
+    """
+    idtype = os.P_PID if pid > 0 else os.P_ALL
+    info = os.waitid(idtype, max(pid, 0), os.WEXITED | os.WNOWAIT | options)
+    if info is None:
+        return None
+    usage = read_proc_io(info.si_pid)
+    pid, status, rusage = os.wait4(info.si_pid, 0)
+    if os.WIFSIGNALED(status):
+        code = -os.WTERMSIG(status)
+    else:
+        code = os.WEXITSTATUS(status)
+    usage.update({
+        'utime': round(rusage.ru_utime, 6),
+        'stime': round(rusage.ru_stime, 6),
+        'maxrss': rusage.ru_maxrss
+    })
+    return pid, code, usage
+
+
+def _send(sock, msg, fds=None):
+    data = json.dumps(msg).encode('utf-8')
+    if fds:
+        sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                               array.array('i', fds))])
+    else:
+        sock.sendmsg([data])
+
+
+def _recv(sock, maxfds=0):
+    fds = array.array('i')
+    anc_size = socket.CMSG_LEN(maxfds * fds.itemsize) if maxfds else 0
+    data, ancdata, _, _ = sock.recvmsg(MAX_MSG_SIZE, anc_size)
+    for level, ctype, cdata in ancdata:
+        if level == socket.SOL_SOCKET and ctype == socket.SCM_RIGHTS:
+            cdata = cdata[:len(cdata) - (len(cdata) % fds.itemsize)]
+            fds.frombytes(cdata)
+    for fd in fds:
+        os.set_inheritable(fd, False)
+    if not data:
+        return None, list(fds)
+    return json.loads(data.decode('utf-8')), list(fds)
+
+
+class ForkServerError(Exception):
+    """Raised when a command cannot be spawned because the helper process is
+    not available
+    """
+
+
+class ForkServerProcess():
+    """A command spawned by the helper process, providing the parts of the
+    ``subprocess.Popen`` interface sos uses.
+
+    As the command is not a child of sos, its exit status and resource usage
+    are reported by the helper process, and are available once ``wait()``
+    returns.
+    """
+
+    def __init__(self, pid, stdout=None):
+        self.pid = pid
+        self.stdout = stdout
+        self.returncode = None
+        self.rusage = None
+        self._exited = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set_exit(self, returncode, rusage):
+        """Record the exit of the command, as reported by the helper"""
+        with self._lock:
+            self.returncode = returncode
+            self.rusage = rusage
+            self._exited.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_exit_callback(self, callback):
+        """Call `callback` once the command has exited, immediately if it has
+        already exited
+        """
+        with self._lock:
+            if not self._exited.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(str(self.pid), timeout)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, value, traceback):
+        if self.stdout:
+            self.stdout.close()
+        self.wait()
+
+
+class ForkServer():
+    """The client side of the helper process that spawns commands for sos.
+
+    Use ``ForkServer.start()`` to start the shared helper, after which
+    ``ForkServer.get()`` returns it until it is stopped or exits.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.soslog = logging.getLogger('sos')
+        self.running = False
+        self._sock = None
+        self._helper = None
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._procs = {}
+
+    @classmethod
+    def start(cls):
+        """Start the shared helper process, if it is not already running
+
+        :returns:   The helper, or ``None`` if it could not be started
+        :rtype:     ``ForkServer`` or ``None``
+        """
+        with cls._instance_lock:
+            if cls._instance is None or not cls._instance.running:
+                server = cls()
+                try:
+                    server._start()
+                except Exception as err:
+                    server.soslog.debug(f"Unable to start fork server: {err}")
+                    return None
+                cls._instance = server
+            return cls._instance
+
+    @classmethod
+    def get(cls):
+        """Get the shared helper process, if it is running
+
+        :returns:   The helper, or ``None``
+        :rtype:     ``ForkServer`` or ``None``
+        """
+        server = cls._instance
+        if server is not None and server.running:
+            return server
+        return None
+
+    @classmethod
+    def stop(cls):
+        """Stop the shared helper process. Commands it already spawned are
+        left running.
+        """
+        with cls._instance_lock:
+            server, cls._instance = cls._instance, None
+        if server is not None:
+            server._stop()
+
+    def _start(self):
+        if not sys.executable:
+            raise ForkServerError('no Python interpreter to run')
+        self._sock, helper_sock = socket.socketpair(socket.AF_UNIX,
+                                                    socket.SOCK_SEQPACKET)
+        try:
+            # pylint: disable=consider-using-with
+            self._helper = subprocess.Popen(
+                [sys.executable, '-I', os.path.abspath(__file__),
+                 str(helper_sock.fileno())],
+                pass_fds=[helper_sock.fileno()], close_fds=True,
+                stdout=subprocess.DEVNULL
+            )
+        finally:
+            helper_sock.close()
+        self.running = True
+        threading.Thread(target=self._read, daemon=True,
+                         name='sos-forkserver').start()
+
+    def _stop(self):
+        self.running = False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if self._helper is not None:
+            self._helper.wait()
+
+    def _read(self):
+        while True:
+            try:
+                msg, _ = _recv(self._sock)
+            except OSError:
+                msg = None
+            if msg is None:
+                break
+            if 'id' in msg:
+                with self._lock:
+                    pending = self._pending.pop(msg['id'], None)
+                    # register the command before its exit can be reported
+                    if 'pid' in msg:
+                        self._procs[msg['pid']] = ForkServerProcess(
+                            msg['pid']
+                        )
+                        msg['proc'] = self._procs[msg['pid']]
+                if pending is not None:
+                    pending[1] = msg
+                    pending[0].set()
+                elif 'pid' in msg:
+                    # the request was given up on and the command run some
+                    # other way, so it must not run twice
+                    with self._lock:
+                        msg['proc'] = self._procs.pop(msg['pid'], None)
+                    msg['proc'].kill()
+            elif 'exited' in msg:
+                with self._lock:
+                    proc = self._procs.pop(msg['exited'], None)
+                if proc is not None:
+                    proc.set_exit(msg['returncode'], msg['rusage'])
+        # the helper is gone, so nothing more will be reported about the
+        # commands it spawned, or about pending requests
+        self.running = False
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            procs, self._procs = self._procs, {}
+        for event, _ in pending.values():
+            event.set()
+        for proc in procs.values():
+            proc.set_exit(-1, None)
+        self._sock.close()
+
+    def spawn(self, argv, env, stdout, stderr, chroot=None, cwd=None,
+              runas=None, setpgid=True, netns=None):
+        """Spawn a command through the helper process
+
+        :param argv:    The command and its arguments
+        :type argv:     ``list``
+
+        :param env:     The environment of the command
+        :type env:      ``dict``
+
+        :param stdout:  The file descriptor standard output is written to
+        :type stdout:   ``int``
+
+        :param stderr:  The file descriptor standard error is written to
+        :type stderr:   ``int``
+
+        :param chroot:  The directory to chroot to before running the command
+        :type chroot:   ``str``
+
+        :param cwd:     The directory to run the command in
+        :type cwd:      ``str``
+
+        :param runas:   The user to run the command as
+        :type runas:    ``str``
+
+        :param setpgid: Run the command in a new process group
+        :type setpgid:  ``bool``
+
+        :param netns:   The network namespace to run the command in
+        :type netns:    ``str``
+
+        :returns:   The spawned command
+        :rtype:     ``ForkServerProcess``
+
+        :raises:    ``OSError`` if the command could not be executed, or
+                    ``ForkServerError`` if the helper is not available or
+                    does not answer within ``SPAWN_TIMEOUT`` seconds
+        """
+        event = threading.Event()
+        pending = [event, None]
+        with self._lock:
+            if not self.running:
+                raise ForkServerError('fork server is not running')
+            self._seq += 1
+            req_id = self._seq
+            self._pending[req_id] = pending
+        request = {
+            'id': req_id, 'argv': argv, 'env': env, 'chroot': chroot,
+            'cwd': cwd, 'runas': runas, 'setpgid': setpgid, 'netns': netns
+        }
+        try:
+            _send(self._sock, request, [stdout, stderr])
+        except OSError as err:
+            with self._lock:
+                self._pending.pop(req_id, None)
+            raise ForkServerError(f"unable to send request: {err}") from err
+        if not event.wait(SPAWN_TIMEOUT):
+            with self._lock:
+                abandoned = self._pending.pop(req_id, None) is not None
+            if abandoned:
+                # the helper is stalled, so stop sending it commands
+                self.running = False
+                raise ForkServerError('fork server did not answer in time')
+        reply = pending[1]
+        if reply is None:
+            raise ForkServerError('fork server exited')
+        if 'errno' in reply:
+            raise OSError(reply['errno'], os.strerror(reply['errno']),
+                          argv[0])
+        return reply['proc']
+
+
+def _exec_child(request, stdout, stderr, err_w):
+    """Prepare and execute a command in a freshly forked child of the helper,
+    reporting any failure to do so through `err_w`
+    """
+    try:
+        for sig in ('SIGPIPE', 'SIGXFZ', 'SIGXFSZ', 'SIGCHLD'):
+            if hasattr(signal, sig):
+                signal.signal(getattr(signal, sig), signal.SIG_DFL)
+        signal.set_wakeup_fd(-1)
+        if request['setpgid']:
+            os.setpgid(0, 0)
+        if request.get('netns'):
+            enter_netns(request['netns'])
+        if request['chroot'] and request['chroot'] != '/':
+            os.chroot(request['chroot'])
+        if request['runas']:
+            pw_user = pwd.getpwnam(request['runas'])
+            os.setgid(pw_user.pw_gid)
+            os.setuid(pw_user.pw_uid)
+            os.chdir(pw_user.pw_dir)
+        if request['cwd']:
+            os.chdir(request['cwd'])
+        os.dup2(stdout, 1)
+        os.dup2(stderr, 2)
+        os.execvpe(request['argv'][0], request['argv'], request['env'])
+    except BaseException as err:  # pylint: disable=broad-except
+        code = getattr(err, 'errno', None) or errno.EINVAL
+        os.write(err_w, str(code).encode())
+    finally:
+        os._exit(127)
+
+
+def _serve(sock):
+    """Serve spawn requests from sos until it closes the socket"""
+    sig_r, sig_w = os.pipe()
+    os.set_blocking(sig_r, False)
+    os.set_blocking(sig_w, False)
+    signal.set_wakeup_fd(sig_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(sig_r, selectors.EVENT_READ)
+    children = set()
+    failed = set()
+
+    def _reap():
+        reaped = {}
+        while True:
+            try:
+                res = wait_child(options=os.WNOHANG)
+            except ChildProcessError:
+                break
+            if res is None:
+                break
+            pid, code, usage = res
+            if pid in failed:
+                failed.discard(pid)
+            elif pid in children:
+                children.discard(pid)
+                reaped[pid] = (code, usage)
+        return reaped
+
+    while True:
+        for key, _ in selector.select():
+            if key.fileobj is sock:
+                request, fds = _recv(sock, maxfds=2)
+                if request is None:
+                    return
+                reply = {'id': request['id']}
+                err_r, err_w = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(err_r)
+                    _exec_child(request, fds[0], fds[1], err_w)
+                os.close(err_w)
+                for fd in fds:
+                    os.close(fd)
+                with os.fdopen(err_r, 'rb') as err_file:
+                    err = err_file.read()
+                if err:
+                    failed.add(pid)
+                    reply['errno'] = int(err)
+                else:
+                    children.add(pid)
+                    reply['pid'] = pid
+                _send(sock, reply)
+            else:
+                try:
+                    while os.read(sig_r, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            for pid, (code, usage) in _reap().items():
+                _send(sock, {'exited': pid, 'returncode': code,
+                             'rusage': usage})
+
+
+if __name__ == '__main__':
+    with socket.socket(fileno=int(sys.argv[1])) as _sock:
+        # the socket was inherited from sos, but must not be by the commands
+        # the helper spawns, which may run as an unprivileged user
+        _sock.set_inheritable(False)
+        try:
+            _serve(_sock)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+# vim: set et ts=4 sw=4 :
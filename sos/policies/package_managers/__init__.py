@@ -8,11 +8,16 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
+import os
 import re
 import fnmatch
+import shlex
 
 from sos.utilities import sos_get_command_output
 
+# most paths queried in a single invocation of `query_paths_command`
+QUERY_PATHS_MAX = 256
+
 
 class PackageManager():
     """Encapsulates a package manager. If you provide a query_command to the
@@ -37,6 +42,11 @@ class PackageManager():
     :cvar files_command: The command to use for getting file lists for packages
     :vartype files_command: ``str`` or ``None``
 
+    :cvar query_paths_command: The command to use for getting the packages
+                               that own a list of paths, which are appended
+                               to it, in a single invocation
+    :vartype query_paths_command: ``str`` or ``None``
+
     :cvar chroot: Perform a chroot when executing `files_command`
     :vartype chroot: ``bool``
 
@@ -50,6 +60,7 @@ class PackageManager():
     verify_filter = None
     files_command = None
     query_path_command = None
+    query_paths_command = None
     chroot = None
     files = None
 
@@ -63,16 +74,23 @@ class PackageManager():
 
     @property
     def packages(self):
+        self.load_packages()
+        return self._packages
+
+    def load_packages(self):
+        """
+        Generate the list of installed packages if it was not yet, e.g. before
+        several threads may query it at once.
+        """
         if self._packages is None:
             self._generate_pkg_list()
-        return self._packages
 
     @property
     def manager_name(self):
         return self.__class__.__name__.lower().split('package', maxsplit=1)[0]
 
     def exec_cmd(self, command, timeout=30, need_root=False, env=None,
-                 use_shell=False, chroot=None):
+                 use_shell=False, chroot=None, any_status=False):
         """
         Runs a package manager command, either via sos_get_command_output() if
         local, or via a SoSTransport's run_command() if this needs to be run
@@ -97,6 +115,10 @@ class PackageManager():
         :param chroot:      If necessary, chroot command execution to here
         :type chroot:       ``None`` or ``str``
 
+        :param any_status:  Return the output even if the command failed,
+                            e.g. when it failed for only some of its arguments
+        :type any_status:   ``bool``
+
         :returns:   The output of the command
         :rtype:     ``str``
         """
@@ -105,7 +127,7 @@ class PackageManager():
         else:
             ret = sos_get_command_output(command, timeout, chroot=chroot,
                                          env=env)
-        if ret['status'] == 0:
+        if ret['status'] == 0 or (any_status and ret['status'] is not None):
             return ret['output']
         # In the case of package managers, we don't want to potentially iterate
         # over stderr, so prevent the package methods from doing anything at
@@ -240,6 +262,60 @@ class PackageManager():
         except Exception:
             return 'unknown'
 
+    def _parse_path_owners(self, output):
+        """
+        Using the output of `query_paths_command`, find the packages owning
+        each path.
+
+        This should be overridden by package managers that define
+        `query_paths_command`, and be a generator yielding a tuple of path and
+        owner for each owner of a path, with the owner as ``pkg_by_path()``
+        reports it.
+
+        :param output: The output of `query_paths_command`
+        :type output:  ``str``
+        """
+        raise NotImplementedError
+
+    def pkgs_by_paths(self, paths):
+        """Given a list of paths, return the packages that own each path,
+        querying the package manager for many paths at once when it can.
+
+        :param paths:   The filepaths to check for package ownership
+        :type paths:    ``list``
+
+        :returns:       The result of ``pkg_by_path()`` for each path
+        :rtype:         ``dict``
+        """
+        paths = list(dict.fromkeys(paths))
+        if not self.query_paths_command:
+            return {path: self.pkg_by_path(path) for path in paths}
+        owners = {}
+        # package managers resolve symlinked directories, e.g. /bin on
+        # merged /usr systems, and report the path as it is packaged
+        aliases = {}
+        for path in paths:
+            aliases.setdefault(path, []).append(path)
+            real = os.path.join(os.path.realpath(os.path.dirname(path)),
+                                os.path.basename(path))
+            if real != path:
+                aliases.setdefault(real, []).append(path)
+        for idx in range(0, len(paths), QUERY_PATHS_MAX):
+            quoted = ' '.join(
+                shlex.quote(p) for p in paths[idx:idx + QUERY_PATHS_MAX]
+            )
+            try:
+                out = self.exec_cmd(f"{self.query_paths_command} {quoted}",
+                                    timeout=60, chroot=self.chroot,
+                                    any_status=True)
+            except Exception:
+                continue
+            for path, owner in self._parse_path_owners(out):
+                for _path in aliases.get(path, []):
+                    if owner not in owners.setdefault(_path, []):
+                        owners[_path].append(owner)
+        return {path: owners.get(path) or 'unknown' for path in paths}
+
     def build_verify_command(self, packages):
         """build_verify_command(self, packages) -> str
             Generate a command to verify the list of packages given
@@ -358,6 +434,17 @@ class MultiPackageManager(PackageManager):
                 self.files.extend(pm.all_files())
         return self.files
 
+    def pkgs_by_paths(self, paths):
+        owners = {}
+        for pm in self._managers:
+            remaining = [p for p in paths if p not in owners]
+            if not remaining:
+                break
+            for path, pkg in pm.pkgs_by_paths(remaining).items():
+                if pkg and pkg != 'unknown':
+                    owners[path] = pkg
+        return {path: owners.get(path, 'unknown') for path in paths}
+
     def _generate_pkg_list(self):
         if self._packages is None:
             self._packages = {}
@@ -398,7 +485,8 @@ class MultiPackageManager(PackageManager):
         # which case we only want to use the one actually defined here, or
         # _pm_wrapper, which we need to avoid this override for to not hit
         # recursion hell.
-        if item in ['_generate_pkg_list', '_pm_wrapper', 'all_files']:
+        if item in ['_generate_pkg_list', '_pm_wrapper', 'all_files',
+                    'pkgs_by_paths']:
             return super().__getattribute__(item)
         attr = super().__getattribute__(item)
         if hasattr(attr, '__call__'):
@@ -17,6 +17,7 @@ class DpkgPackageManager(PackageManager):
 
     query_command = "dpkg-query -W -f='${Package}|${Version}|${Status}\\n'"
     query_path_command = "dpkg -S"
+    query_paths_command = "dpkg -S"
     verify_command = "dpkg --verify"
     verify_filter = ""
 
@@ -29,4 +30,11 @@ class DpkgPackageManager(PackageManager):
                 continue
             yield (name, version, None)
 
+    def _parse_path_owners(self, output):
+        for line in output.splitlines():
+            # "pkg1, pkg2: /path", reported as is, as by pkg_by_path()
+            if line.startswith('diversion ') or ': /' not in line:
+                continue
+            yield ('/' + line.partition(': /')[2], line)
+
 # vim: set et ts=4 sw=4 :
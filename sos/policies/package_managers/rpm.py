@@ -17,6 +17,11 @@ class RpmPackageManager(PackageManager):
 
     query_command = 'rpm -qa --queryformat "%{NAME}|%{VERSION}|%{RELEASE}\\n"'
     query_path_command = 'rpm -qf'
+    # list the files of each package owning a path along with the package,
+    # formatted as `rpm -qf` reports it, since rpm does not report which of
+    # its arguments each package owns
+    query_paths_command = ('rpm -qf --queryformat "[%{FILENAMES}|%{=NAME}-'
+                           '%{=VERSION}-%{=RELEASE}.%{=ARCH}\\n]"')
     files_command = 'rpm -qal'
     verify_command = 'rpm -V'
     verify_filter = ["debuginfo", "-devel"]
@@ -28,4 +33,10 @@ class RpmPackageManager(PackageManager):
             name, version, release = pkg.split('|')
             yield (name, version, release)
 
+    def _parse_path_owners(self, output):
+        for line in output.splitlines():
+            path, sep, pkg = line.rpartition('|')
+            if sep and path.startswith('/'):
+                yield (path, pkg)
+
 # vim: set et ts=4 sw=4 :
@@ -19,6 +19,7 @@ import hashlib
 import pdb
 from datetime import datetime
 import glob
+import itertools
 
 from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures import TimeoutError as FuturesTimeoutError
@@ -27,15 +28,27 @@ from shutil import rmtree
 import sos.report.plugins
 from sos.utilities import (ImporterHelper, SoSTimeoutError, bold,
                            sos_get_command_output, TIMEOUT_DEFAULT, listdir,
-                           is_executable)
+                           is_executable, get_netns_devices, get_netns_path)
 
 from sos import _sos as _
 from sos import __version__
+from sos.archive import EstimateArchive, TarFileArchive
 from sos.component import SoSComponent
+from sos.forkserver import ForkServer
 import sos.policies
 from sos.report.reporting import (Report, Section, Command, CopiedFile,
                                   CreatedFile, Alert, Note, PlainTextReport,
                                   JSONReport, HTMLReport)
+from sos.report.executor import CommandExecutor
+from sos.report.breaker import HangBreaker
+from sos.report.cmdcache import CommandCache
+from sos.report.copier import FileCopier
+from sos.report.governor import ConcurrencyLimit, LoadGovernor
+from sos.report.plugin_index import PluginIndex
+from sos.report.procsnap import ProcessTable
+from sos.report.scheduler import PluginScheduler
+from sos.report.tracer import Tracer
+from sos.report.triggers import TriggerResolver
 from sos.cleaner import SoSCleaner
 
 # file system errors that should terminate a run
@@ -87,6 +100,7 @@ class SoSReport(SoSComponent):
         'case_id': '',
         'chroot': 'auto',
         'clean': False,
+        'cmd_threads': 8,
         'container_runtime': 'auto',
         'keep_binary_files': False,
         'desc': '',
@@ -96,10 +110,12 @@ class SoSReport(SoSComponent):
         'dry_run': False,
         'estimate_only': False,
         'experimental': False,
+        'file_timeout': 30,
         'enable_plugins': [],
         'journal_size': 100,
         'keywords': [],
         'keyword_file': None,
+        'adaptive_threads': False,
         'plugopts': [],
         'label': '',
         'list_plugins': False,
@@ -108,6 +124,7 @@ class SoSReport(SoSComponent):
         'log_size': 25,
         'low_priority': False,
         'map_file': '/etc/sos/cleaner/default_mapping',
+        'min_threads': 1,
         'skip_commands': [],
         'skip_files': [],
         'skip_plugins': [],
@@ -123,6 +140,9 @@ class SoSReport(SoSComponent):
         'cmd_timeout': TIMEOUT_DEFAULT,
         'profiles': [],
         'since': None,
+        'stream_archive': False,
+        'archive_index': False,
+        'trace_file': None,
         'verify': False,
         'allow_system_changes': False,
         'usernames': [],
@@ -146,6 +166,9 @@ class SoSReport(SoSComponent):
 
     def __init__(self, parser, args, cmdline):
         super().__init__(parser, args, cmdline)
+        # spawn commands from a small helper process, started while sos is
+        # still small itself
+        ForkServer.start()
         self.loaded_plugins = []
         self.skipped_plugins = []
         self.all_options = []
@@ -153,6 +176,19 @@ class SoSReport(SoSComponent):
         self._args = args
         self.sysroot = "/"
         self.estimated_plugsizes = {}
+        self.cmd_executor = CommandExecutor()
+        self.trigger_resolver = None
+        self.hang_breaker = HangBreaker(tmpdir=self.tmpdir)
+        self.cmd_cache = CommandCache()
+        self.file_copier = FileCopier(self.opts.file_timeout)
+        self.plugin_limit = None
+        # plugins post-processed as soon as they were done, and whether their
+        # output is streamed to the archive
+        self._postprocessed = set()
+        self._streaming = False
+        self.tracer = Tracer(self.opts.trace_file)
+        if self.policy_load_time:
+            self.tracer.add_span('policy load', *self.policy_load_time)
 
         self.print_header()
         self._set_debug()
@@ -161,6 +197,19 @@ class SoSReport(SoSComponent):
 
         # add a manifest section for report
         self.report_md = self.manifest.components.add_section('report')
+        self.report_md.add_section('hang_breaker')
+        self.report_md.hang_breaker.add_list('tripped',
+                                             self.hang_breaker.tripped)
+        self.report_md.hang_breaker.add_list('skipped',
+                                             self.hang_breaker.skipped)
+        self.report_md.add_section('file_copies')
+        self.report_md.file_copies.add_field('timeout',
+                                             self.opts.file_timeout)
+        self.report_md.file_copies.add_list('slow', self.file_copier.slow)
+        self.report_md.file_copies.add_list('timed_out',
+                                            self.file_copier.timed_out)
+        self.report_md.file_copies.add_list('skip_list',
+                                            self.file_copier.skip_list)
 
         self._set_directories()
 
@@ -172,6 +221,7 @@ class SoSReport(SoSComponent):
         elif self.policy.in_container() and self.sysroot != os.sep:
             msg = "policy"
         self.soslog.debug(f"set sysroot to '{self.sysroot}' ({msg})")
+        self.process_table = ProcessTable(os.path.join(self.sysroot, 'proc'))
 
         if self.opts.chroot not in chroot_modes:
             self.soslog.error(f"invalid chroot mode: {self.opts.chroot}")
@@ -222,8 +272,7 @@ class SoSReport(SoSComponent):
         report_grp.add_argument("--estimate-only", action="store_true",
                                 help="Approximate disk space requirements for "
                                      "a real sos run; disables --clean and "
-                                     "--collect, sets --threads=1 and "
-                                     "--no-postproc")
+                                     "--collect, sets --no-postproc")
         report_grp.add_argument("--experimental", action="store_true",
                                 dest="experimental", default=False,
                                 help="enable experimental plugins")
@@ -286,6 +335,40 @@ class SoSReport(SoSComponent):
                                 help="set a timeout for all plugins")
         report_grp.add_argument("--cmd-timeout", default=None,
                                 help="set a command timeout for all plugins")
+        report_grp.add_argument("--cmd-threads", type=int, default=8,
+                                dest="cmd_threads",
+                                help="number of commands to run concurrently "
+                                     "across all plugins, 0 to run each "
+                                     "plugin's commands serially")
+        report_grp.add_argument("--adaptive-threads", action="store_true",
+                                dest="adaptive_threads", default=False,
+                                help="scale the number of concurrently "
+                                     "running plugins and commands with the "
+                                     "load of the host")
+        report_grp.add_argument("--min-threads", type=int, default=1,
+                                dest="min_threads",
+                                help="lowest number of concurrently running "
+                                     "plugins and commands with "
+                                     "--adaptive-threads")
+        report_grp.add_argument("--file-timeout", type=int, default=30,
+                                dest="file_timeout",
+                                help="seconds a file copy may make no "
+                                     "progress for before it is abandoned, "
+                                     "0 to never abandon copies")
+        report_grp.add_argument("--stream-archive", action="store_true",
+                                dest="stream_archive", default=False,
+                                help="compress the output of each plugin "
+                                     "into the archive as soon as the plugin "
+                                     "is done")
+        report_grp.add_argument("--archive-index", action="store_true",
+                                dest="archive_index", default=False,
+                                help="end the archive with an index that "
+                                     "lets single files be read without "
+                                     "decompressing the whole archive")
+        report_grp.add_argument("--trace-file", type=str, default=None,
+                                dest="trace_file",
+                                help="write a timeline of the execution to "
+                                     "this file, in the Trace Event Format")
         report_grp.add_argument("-p", "--profile", "--profiles",
                                 action="extend", dest="profiles", type=str,
                                 default=[],
@@ -575,10 +658,18 @@ class SoSReport(SoSComponent):
         namespace that exists on the system
         """
         _nmdevs = {}
-        for nmsp in self.namespaces['network']:
-            _nmdevs[nmsp] = {
-                'ethernet': self._get_eth_devs(nmsp)
-            }
+        _namespaces = self.namespaces['network']
+        if not _namespaces:
+            return _nmdevs
+        # namespaces are inspected concurrently, as there may be thousands of
+        # them on e.g. OpenStack network nodes
+        with ThreadPoolExecutor(self.opts.threads) as executor:
+            for nmsp, _devs in zip(_namespaces,
+                                   executor.map(self._get_eth_devs,
+                                                _namespaces)):
+                _nmdevs[nmsp] = {
+                    'ethernet': _devs
+                }
         return _nmdevs
 
     def _get_nmcli_devs(self):
@@ -633,18 +724,34 @@ class SoSReport(SoSComponent):
                     f'Failed to manually determine network devices: {err}'
                 )
         else:
-            try:
-                _nscmd = f"ip netns exec {namespace} ls /sys/class/net"
-                _nsout = sos_get_command_output(_nscmd)
-                if _nsout['status'] == 0:
-                    for _nseth in _nsout['output'].split():
-                        if _nseth not in filt_devs:
-                            _eth_devs.append(_nseth)
-            except Exception as err:
-                self.soslog.warning(
-                    f"Could not determine network namespace '{namespace}' "
-                    f"devices: {err}"
-                )
+            # read the devices from within the namespace when it can be
+            # entered directly, instead of spawning `ip netns exec`
+            _nspath = get_netns_path(namespace)
+            if _nspath:
+                try:
+                    _eth_devs = [
+                        dev for dev in sorted(get_netns_devices(_nspath))
+                        if dev not in filt_devs
+                    ]
+                except OSError as err:
+                    self.soslog.debug(
+                        f"Unable to enter network namespace '{namespace}': "
+                        f"{err}"
+                    )
+                    _nspath = None
+            if not _nspath:
+                try:
+                    _nscmd = f"ip netns exec {namespace} ls /sys/class/net"
+                    _nsout = sos_get_command_output(_nscmd)
+                    if _nsout['status'] == 0:
+                        for _nseth in _nsout['output'].split():
+                            if _nseth not in filt_devs:
+                                _eth_devs.append(_nseth)
+                except Exception as err:
+                    self.soslog.warning(
+                        f"Could not determine network namespace "
+                        f"'{namespace}' devices: {err}"
+                    )
         return {
             'ethernet': _eth_devs,
             'bond': [bd for bd in _eth_devs if bd.startswith('bond')],
@@ -716,7 +823,14 @@ class SoSReport(SoSComponent):
             'verbosity': self.opts.verbosity,
             'cmdlineopts': self.opts,
             'devices': self.devices,
-            'namespaces': self.namespaces
+            'namespaces': self.namespaces,
+            'cmd_executor': self.cmd_executor,
+            'trigger_resolver': self.trigger_resolver,
+            'hang_breaker': self.hang_breaker,
+            'cmd_cache': self.cmd_cache,
+            'file_copier': self.file_copier,
+            'process_table': self.process_table,
+            'tracer': self.tracer
         }
 
     def get_temp_file(self):
@@ -818,10 +932,33 @@ class SoSReport(SoSComponent):
             plugin_class(self.get_commons())
         ))
 
+    def _needs_import(self, plugin_name, index_entries):
+        """Decide from the plugin index if a plugin module needs to be
+        imported, which is the case unless every plugin class it defines would
+        be skipped regardless of the state of the system, and we are not
+        listing plugins or profiles.
+        """
+        if self.opts.list_plugins or self.opts.list_profiles:
+            return True
+        if self._is_skipped(plugin_name):
+            return False
+        using_profiles = len(self.opts.profiles)
+        for entry in index_entries:
+            if not self._is_in_profile(entry):
+                continue
+            if not using_profiles and self._is_not_specified(plugin_name):
+                continue
+            return True
+        return False
+
     def load_plugins(self):
         import_plugin = sos.report.plugins.import_plugin
         helper = ImporterHelper(sos.report.plugins)
         plugins = helper.get_modules()
+        index = PluginIndex(sos.report.plugins, plugins)
+        # resolve enablement triggers shared between plugins only once while
+        # deciding which plugins to load
+        self.trigger_resolver = TriggerResolver(self.policy, self.sysroot)
         self.plugin_names = []
         self.profiles = set()
         using_profiles = len(self.opts.profiles)
@@ -838,7 +975,25 @@ class SoSReport(SoSComponent):
         for plug in plugins:
             plugbase, __ = os.path.splitext(plug)
             try:
-                plugin_classes = import_plugin(plugbase, valid_plugin_classes)
+                index_entries = index.get(plugbase)
+                if index_entries is not None:
+                    index_entries = [
+                        e for e in index_entries
+                        if e.is_subclass(valid_plugin_classes)
+                    ]
+                    if not index_entries:
+                        # no valid plugin classes for this policy
+                        continue
+                    if not self._needs_import(plugbase, index_entries):
+                        self.plugin_names.append(plugbase)
+                        continue
+
+                plugin_classes = import_plugin(plugbase)
+                index.add(plugbase, plugin_classes)
+                plugin_classes = [
+                    c for c in plugin_classes
+                    if issubclass(c, valid_plugin_classes)
+                ]
                 if not plugin_classes:
                     # no valid plugin classes for this policy
                     continue
@@ -891,6 +1046,8 @@ class SoSReport(SoSComponent):
                 self.soslog.warning(_(f"plugin {plug} does not install, "
                                       f"skipping: {e}"))
                 self.handle_exception()
+        index.save()
+        self.trigger_resolver.close()
         if len(remaining_profiles) > 0:
             self.soslog.error(_('Unknown or inactive profile(s) provided:'
                                 f' {", ".join(remaining_profiles)}'))
@@ -988,9 +1145,6 @@ class SoSReport(SoSComponent):
         # and return a corresponding log messages string
         msg = "\nEstimate-only mode enabled"
         ext_msg = []
-        if self.opts.threads > 1:
-            ext_msg += [f"--threads={self.opts.threads} overriden to 1", ]
-            self.opts.threads = 1
         if not self.opts.build:
             ext_msg += ["--build enabled", ]
             self.opts.build = True
@@ -1217,7 +1371,13 @@ class SoSReport(SoSComponent):
         self.policy.pre_work()
         try:
             self.ui_log.info(_(" Setting up archive ..."))
-            self.setup_archive()
+            if self.opts.estimate_only:
+                self.setup_archive(archive_class=EstimateArchive)
+            else:
+                self.setup_archive()
+            self.archive.tracer = self.tracer
+            if isinstance(self.archive, TarFileArchive):
+                self.archive.set_index(self.opts.archive_index)
             self._make_archive_paths()
             return
         except (OSError, IOError) as e:
@@ -1240,34 +1400,63 @@ class SoSReport(SoSComponent):
 
     def setup(self):
         self.ui_log.info(_(" Setting up plugins ..."))
+        parallel = []
+        # create the manifest sections up front so that they are kept in
+        # plugin load order regardless of when each plugin finishes setup
         for plugname, plug in self.loaded_plugins:
-            try:
-                self.report_md.plugins.add_section(plugname)
-                plug.set_plugin_manifest(getattr(self.report_md.plugins,
-                                                 plugname))
-                start = datetime.now()
-                plug.manifest.add_field('setup_start', start)
+            self.report_md.plugins.add_section(plugname)
+            plug.set_plugin_manifest(getattr(self.report_md.plugins,
+                                             plugname))
+            if self.opts.estimate_only:
+                plug.archive = self.archive.for_plugin(plugname)
+            else:
                 plug.archive = self.archive
+        for plugname, plug in self.loaded_plugins:
+            if plug.serial_setup:
+                self._setup_plugin(plugname, plug)
+            else:
+                parallel.append((plugname, plug))
+        # make sure the package list is generated before plugins may query it
+        # concurrently
+        self.policy.package_manager.load_packages()
+        with ThreadPoolExecutor(self.opts.threads) as executor:
+            futures = [
+                executor.submit(self._setup_plugin, plugname, plug)
+                for plugname, plug in parallel
+            ]
+            for future in futures:
+                # re-raise any SystemExit from a fatal error during setup
+                future.result()
+        for _plugname, plug in self.loaded_plugins:
+            self.env_vars.update(plug._env_vars)
+
+    def _setup_plugin(self, plugname, plug):
+        """Run the setup phase for a single plugin, recording how long it took
+        in the plugin's manifest section
+        """
+        try:
+            start = datetime.now()
+            plug.manifest.add_field('setup_start', start)
+            with self.tracer.span('setup', cat=plugname):
                 plug.add_default_collections()
                 plug.setup()
-                self.env_vars.update(plug._env_vars)
                 if self.opts.verify:
                     plug.setup_verify()
-                end = datetime.now()
-                plug.manifest.add_field('setup_end', end)
-                plug.manifest.add_field('setup_time', end - start)
-            except KeyboardInterrupt:
-                raise KeyboardInterrupt  # pylint: disable=raise-missing-from
-            except (OSError, IOError) as e:
-                if e.errno in fatal_fs_errors:
-                    self.ui_log.error("")
-                    self.ui_log.error(
-                        f" {e.strerror} while setting up plugins")
-                    self.ui_log.error("")
-                    self._exit(1)
-                self.handle_exception(plugname, "setup")
-            except Exception:
-                self.handle_exception(plugname, "setup")
+            end = datetime.now()
+            plug.manifest.add_field('setup_end', end)
+            plug.manifest.add_field('setup_time', end - start)
+        except KeyboardInterrupt:
+            raise KeyboardInterrupt  # pylint: disable=raise-missing-from
+        except (OSError, IOError) as e:
+            if e.errno in fatal_fs_errors:
+                self.ui_log.error("")
+                self.ui_log.error(
+                    f" {e.strerror} while setting up plugins")
+                self.ui_log.error("")
+                self._exit(1)
+            self.handle_exception(plugname, "setup")
+        except Exception:
+            self.handle_exception(plugname, "setup")
 
     def version(self):
         """Fetch version information from all plugins and store in the report
@@ -1286,9 +1475,15 @@ class SoSReport(SoSComponent):
         plugruncount = 0
         self.pluglist = []
         self.running_plugs = []
+        self._plugstartcount = itertools.count(1)
         for i in self.loaded_plugins:
             plugruncount += 1
             self.pluglist.append((plugruncount, i[0]))
+        self._schedule_plugins()
+        self._start_archive_stream()
+        if self.opts.cmd_threads > 0:
+            self.cmd_executor.start(self.opts.cmd_threads)
+        governor = self._start_governor()
         try:
             results = []
             with ThreadPoolExecutor(self.opts.threads) as executor:
@@ -1302,10 +1497,126 @@ class SoSReport(SoSComponent):
             # We may not be at a newline when the user issues Ctrl-C
             self.ui_log.error("\nExiting on user cancel\n")
             os._exit(1)
+        finally:
+            if governor:
+                governor.stop()
+            self.cmd_executor.shutdown()
+        if self.opts.estimate_only:
+            self.archive.discard_collected()
+        if self.file_copier.skip_list:
+            self.soslog.warning(
+                "Some files could not be copied in time. They can be skipped "
+                "in later runs with: --skip-files "
+                f"{','.join(self.file_copier.skip_list)}"
+            )
+        self.report_md.add_field('cmd_cache_hits', self.cmd_cache.hits)
+        self._record_plugin_run_times()
+
+    def _start_archive_stream(self):
+        """If requested, start writing the compressed archive now, so that
+        the output of each plugin is compressed while other plugins still
+        run, and does not need to stay in the temporary directory
+        """
+        if not self.opts.stream_archive:
+            return
+        if self.opts.build or self.opts.estimate_only or self.opts.clean:
+            self.soslog.info("--stream-archive is ignored with --build, "
+                             "--estimate-only and --clean")
+            return
+        if not isinstance(self.archive, TarFileArchive):
+            return
+        # the files that get their upload credentials obfuscated at the end
+        # of the execution are kept until then
+        self.archive.start_stream(self.opts.compression_type,
+                                  hold=self.files_with_upload_passwd)
+        self._streaming = True
+
+    def _stream_plugin(self, plugname, plug):
+        """Post-process the data a plugin collected as soon as it is done,
+        then append its command output, which no other plugin changes, to
+        the archive. Files copied from the host are kept until the archive
+        is finalized, as another plugin may collect and post-process the same
+        file later.
+        """
+        if not self.opts.no_postproc:
+            self._postproc_plugin(plugname, plug)
+        self._postprocessed.add(plugname)
+        self.archive.stream_dir(os.path.join(self.cmddir, plug.name()))
+
+    def _start_governor(self):
+        """If requested, start scaling the number of concurrently running
+        plugins and commands with the load of the host, between
+        --min-threads and --threads or --cmd-threads respectively
+        """
+        self.report_md.add_section('governor')
+        self.report_md.governor.add_field('enabled',
+                                          self.opts.adaptive_threads)
+        if not self.opts.adaptive_threads:
+            return None
+        self.plugin_limit = ConcurrencyLimit(self.opts.min_threads,
+                                             self.opts.threads)
+        limits = {'plugins': self.plugin_limit}
+        if self.cmd_executor.running:
+            self.cmd_executor.limit = ConcurrencyLimit(self.opts.min_threads,
+                                                       self.opts.cmd_threads)
+            limits['commands'] = self.cmd_executor.limit
+        for name, limit in limits.items():
+            self.report_md.governor.add_field(
+                name, {'floor': limit.floor, 'ceiling': limit.ceiling}
+            )
+        self.report_md.governor.add_list('decisions', [])
+        governor = LoadGovernor(limits, self.report_md.governor.decisions)
+        governor.start()
+        return governor
+
+    def _schedule_plugins(self):
+        """Reorder the plugin list so that the plugins expected to run the
+        longest are started first, based on the run times of previous
+        executions or the plugins' cost hints, and record the schedule used
+        in the manifest
+        """
+        self.scheduler = PluginScheduler()
+        plugs = {
+            plugname: plug for plugname, plug in self.loaded_plugins
+        }
+        schedule = self.scheduler.order(
+            [(plugname, plugs[plugname]) for _, plugname in self.pluglist]
+        )
+        order = {plugname: idx for idx, (plugname, _) in enumerate(schedule)}
+        self.pluglist.sort(key=lambda p: order[p[1]])
+        self.report_md.add_section('schedule')
+        self.report_md.schedule.add_field('history', self.scheduler.path)
+        self.report_md.schedule.add_list(
+            'order', [plugname for _, plugname in self.pluglist]
+        )
+        for plugname, plug in schedule:
+            expected, source = self.scheduler.expected_run_time(plugname,
+                                                                plug)
+            plug.manifest.add_field('expected_run_time', expected)
+            plug.manifest.add_field('expected_run_time_source', source)
+
+    def _record_plugin_run_times(self):
+        """Save the run times of this execution's plugins to the history used
+        to schedule plugins in subsequent executions
+        """
+        if self.opts.dry_run:
+            return
+        for plugname, plug in self.loaded_plugins:
+            if plug.manifest.timeout_hit:
+                self.scheduler.record(plugname, plug.timeout)
+            elif plug.manifest.run_time:
+                self.scheduler.record(plugname, plug.manifest.run_time)
+        self.scheduler.save()
 
     def _collect_plugin(self, plugin):
         """Wraps the collect_plugin() method so we can apply a timeout
         against the plugin as a whole"""
+        if self.plugin_limit:
+            with self.plugin_limit.slot():
+                return self._collect_plugin_timed(plugin)
+        return self._collect_plugin_timed(plugin)
+
+    def _collect_plugin_timed(self, plugin):
         with ThreadPoolExecutor(1) as pool:
             try:
                 _plug = self.loaded_plugins[plugin[0]-1][1]
@@ -1319,6 +1630,8 @@ class SoSReport(SoSComponent):
                 end = datetime.now()
                 _plug.manifest.add_field('end_time', end)
                 _plug.manifest.add_field('run_time', end - start)
+                if self._streaming:
+                    self._stream_plugin(plugin[1], _plug)
             except FuturesTimeoutError:
                 msg = f"Plugin {plugin[1]} timed out"
                 # log to ui_log.error to show the user, log to soslog.info
@@ -1330,26 +1643,14 @@ class SoSReport(SoSComponent):
                 self.loaded_plugins[plugin[0]-1][1].set_timeout_hit()
                 pool.shutdown(wait=True)
                 pool._threads.clear()
+            _plug.manifest.add_field('resource_usage',
+                                     _plug.get_cmd_resource_usage())
         if self.opts.estimate_only:
-            # call "du -s -B1" for the tmp dir to get the disk usage of the
-            # data collected by the plugin - if the command fails, count with 0
-            tmpdir = self.archive.get_tmp_dir()
-            try:
-                du = sos_get_command_output(f'du -sB1 {tmpdir}')
-                self.estimated_plugsizes[plugin[1]] = \
-                    int(du['output'].split()[0])
-            except Exception:
-                self.estimated_plugsizes[plugin[1]] = 0
-            # remove whole tmp_dir content - including "sos_commands" and
-            # similar dirs that will be re-created on demand by next plugin
-            # if needed; it is less error-prone approach than skipping
-            # deletion of some dirs but deleting their content
-            for f in os.listdir(tmpdir):
-                f = os.path.join(tmpdir, f)
-                if os.path.isdir(f) and not os.path.islink(f):
-                    rmtree(f)
-                else:
-                    os.unlink(f)
+            # the archive only tallied the size of what the plugin collected
+            sizes = self.archive.get_sizes(plugin[1])
+            self.estimated_plugsizes[plugin[1]] = sum(sizes.values())
+            _plug.manifest.add_field('estimated_size',
+                                     self.estimated_plugsizes[plugin[1]])
         return True
 
     def collect_plugin(self, plugin):
@@ -1360,11 +1661,14 @@ class SoSReport(SoSComponent):
         except Exception:
             return False
         numplugs = len(self.loaded_plugins)
-        status_line = (f"  Starting {f'{count}/{numplugs}':<5} {plugname:<15} "
+        started = next(self._plugstartcount)
+        status_line = (f"  Starting {f'{started}/{numplugs}':<5} "
+                       f"{plugname:<15} "
                        f"[Running: {' '.join(p for p in self.running_plugs)}]")
         self.ui_progress(status_line)
         try:
-            plug.collect_plugin()
+            with self.tracer.span('collect', cat=plugname):
+                plug.collect_plugin()
             # certain exceptions can cause either of these lists to no
             # longer contain the plugin, which will result in sos hanging
             # so we can't blindly call remove() on these two.
@@ -1481,27 +1785,46 @@ class SoSReport(SoSComponent):
                     self._exit(1)
 
     def postproc(self):
-        for plugname, plug in self.loaded_plugins:
-            try:
-                if plug.get_option('postproc'):
+        with ThreadPoolExecutor(self.opts.threads) as executor:
+            futures = [
+                executor.submit(self._postproc_plugin, plugname, plug)
+                for plugname, plug in self.loaded_plugins
+                if plugname not in self._postprocessed
+            ]
+            for future in futures:
+                # re-raise any SystemExit from a fatal error during postproc
+                future.result()
+
+    def _postproc_plugin(self, plugname, plug):
+        """Run the postproc phase for a single plugin, applying the
+        substitutions it requests to each archived file in a single pass
+        """
+        try:
+            if plug.get_option('postproc'):
+                with self.tracer.span('postproc', cat=plugname), \
+                        plug.batch_file_subs():
                     plug.postproc()
-                else:
-                    self.soslog.info(
-                        f"Skipping postproc for plugin {plugname}")
-            except (OSError, IOError) as e:
-                if e.errno in fatal_fs_errors:
-                    self.ui_log.error("")
-                    self.ui_log.error(
-                        f" {e.strerror} while post-processing plugin data")
-                    self.ui_log.error("")
-                    self._exit(1)
-                self.handle_exception(plugname, "postproc")
-            except Exception:
-                self.handle_exception(plugname, "postproc")
+            else:
+                self.soslog.info(
+                    f"Skipping postproc for plugin {plugname}")
+        except (OSError, IOError) as e:
+            if e.errno in fatal_fs_errors:
+                self.ui_log.error("")
+                self.ui_log.error(
+                    f" {e.strerror} while post-processing plugin data")
+                self.ui_log.error("")
+                self._exit(1)
+            self.handle_exception(plugname, "postproc")
+        except Exception:
+            self.handle_exception(plugname, "postproc")
 
     def _create_checksum(self, archive, hash_name):
         if not archive:
             return False
+        # the checksum is normally computed while the archive is written, so
+        # only read the archive back if it was not
+        if self.archive.get_checksum():
+            return self.archive.get_checksum()
 
         try:
             hash_size = 1024**2  # Hash 1MiB of content at a time.
@@ -1608,8 +1931,9 @@ class SoSReport(SoSComponent):
             try:
                 if do_clean:
                     self.archive.rename_archive_root(cleaner)
-                archive = self.archive.finalize(
-                    self.opts.compression_type)
+                with self.tracer.span('archive finalize'):
+                    archive = self.archive.finalize(
+                        self.opts.compression_type)
             except (OSError, IOError) as e:
                 print("")
                 print(_(f" {e.strerror} while finalizing archive "
@@ -1652,7 +1976,8 @@ class SoSReport(SoSComponent):
                 try:
                     # compute and store the archive checksum
                     hash_name = self.policy.get_preferred_hash_name()
-                    checksum = self._create_checksum(archive, hash_name)
+                    with self.tracer.span('checksum', hash=hash_name):
+                        checksum = self._create_checksum(archive, hash_name)
                 except Exception:
                     print(_("Error generating archive checksum after "
                             "archive creation.\n"))
@@ -1810,7 +2135,8 @@ class SoSReport(SoSComponent):
     def execute(self):
         try:
             self.policy.set_commons(self.get_commons())
-            self.load_plugins()
+            with self.tracer.span('load_plugins'):
+                self.load_plugins()
             self._set_all_options()
             self._merge_preset_options()
             self._set_tunables()
@@ -1839,18 +2165,23 @@ class SoSReport(SoSComponent):
             self.batch()
             self.prework()
             self.add_manifest_data()
-            self.setup()
-            self.collect()
+            with self.tracer.span('setup'):
+                self.setup()
+            with self.tracer.span('collect'):
+                self.collect()
             if not self.opts.no_env_vars:
                 self.collect_env_vars()
             if not self.opts.no_report:
-                self.generate_reports()
+                with self.tracer.span('generate_reports'):
+                    self.generate_reports()
             if not self.opts.no_postproc:
-                self.postproc()
+                with self.tracer.span('postproc'):
+                    self.postproc()
             else:
                 self.ui_log.info("Skipping postprocessing of collected data")
             self.version()
-            return self.final_work()
+            with self.tracer.span('final_work'):
+                return self.final_work()
 
         except OSError:
             if self.opts.debug:
@@ -1865,6 +2196,9 @@ class SoSReport(SoSComponent):
             if not os.getenv('SOS_TEST_LOGS', None) == 'keep':
                 self.cleanup()
             sys.exit(e.code)
+        finally:
+            ForkServer.stop()
+            self.tracer.save()
 
         self._exit(1)
         # Never gets here. This is to fix "inconsistent-return-statements
@@ -0,0 +1,409 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Circuit breaker for hung subsystems during sos report """
+
+import logging
+import os
+import shlex
+import threading
+import time
+
+from datetime import datetime
+
+MOUNTINFO_PATH = '/proc/self/mountinfo'
+
+# seconds a process must stay in uninterruptible sleep without doing any I/O
+# before the command it belongs to is considered hung
+HANG_THRESHOLD = 30
+
+# seconds between two checks of the processes of a running command
+HANG_CHECK_INTERVAL = 1
+
+# prefixes of the kernel functions a process may be found waiting in, by the
+# subsystem they belong to, and the filesystem types of that subsystem
+WCHAN_SUBSYSTEMS = {
+    'nfs': (('nfs', 'rpc_', 'xprt_'), ('nfs', 'nfs4')),
+    'cifs': (('cifs', 'smb'), ('cifs', 'smb3')),
+    'fuse': (('fuse',), ('fuse', 'fuseblk')),
+    'ceph': (('ceph',), ('ceph',)),
+    'gfs2': (('gfs2', 'dlm_'), ('gfs2',)),
+    'block': (('blk_', 'bio_', 'io_schedule', 'folio_wait', 'wait_on_page'),
+              ()),
+}
+
+# commands that look at every mounted filesystem, regardless of their
+# arguments
+MOUNT_WIDE_COMMANDS = ('df', 'lsof', 'fuser', 'quota', 'repquota')
+
+# pseudo filesystems that the paths of a hung process are never attributed to
+IGNORED_PATHS = ('/dev', '/proc', '/sys')
+
+
+def _read_proc(pid, name):
+    try:
+        with open(f"/proc/{pid}/{name}", 'r', encoding='utf-8',
+                  errors='replace') as pfile:
+            return pfile.read()
+    except OSError:
+        return ''
+
+
+def get_process_state(pid):
+    """Get the scheduler state of a process, and the kernel function it is
+    waiting in
+
+    :param pid:     The pid of the process
+    :type pid:      ``int``
+
+    :returns:   The state, e.g. 'D' for uninterruptible sleep, and the wait
+                channel, either of which is empty if the process is gone
+    :rtype:     ``tuple`` of (``str``, ``str``)
+    """
+    stat = _read_proc(pid, 'stat')
+    # the command name may contain spaces and parentheses, but is always
+    # followed by the last closing parenthesis of the line
+    fields = stat[stat.rfind(')') + 1:].split()
+    state = fields[0] if fields else ''
+    wchan = _read_proc(pid, 'wchan').strip()
+    if wchan == '0':
+        wchan = ''
+    return state, wchan
+
+
+def get_descendants(pid):
+    """Get a process and all of its descendants
+
+    :param pid:     The pid of the process
+    :type pid:      ``int``
+
+    :returns:   The pids of the process and its descendants
+    :rtype:     ``list`` of ``int``
+    """
+    pids = [pid]
+    for _pid in pids:
+        for child in _read_proc(_pid, f"task/{_pid}/children").split():
+            pids.append(int(child))
+    return pids
+
+
+def _get_io_counters(pid):
+    counters = {}
+    for line in _read_proc(pid, 'io').splitlines():
+        key, _, val = line.partition(':')
+        if key in ('rchar', 'wchar'):
+            counters[key] = val.strip()
+    return counters
+
+
+def _unescape_mount(path):
+    # mountinfo escapes spaces, tabs, newlines and backslashes as octal
+    for esc, char in (('\\040', ' '), ('\\011', '\t'), ('\\012', '\n'),
+                      ('\\134', '\\')):
+        path = path.replace(esc, char)
+    return path
+
+
+class _HangWatch():
+    """Checks the processes of a running command for a hang, for use as the
+    watchdog of ``sos_get_command_output()``
+    """
+
+    def __init__(self, breaker, cmd, root):
+        self.breaker = breaker
+        self.cmd = cmd
+        self.root = root
+        self.last_check = 0
+        # when each process was first seen in uninterruptible sleep, and its
+        # I/O counters then
+        self.sleeping = {}
+
+    def __call__(self, proc):
+        now = time.monotonic()
+        if now - self.last_check < HANG_CHECK_INTERVAL:
+            return None
+        self.last_check = now
+        for pid in get_descendants(proc.pid):
+            state, wchan = get_process_state(pid)
+            if state != 'D':
+                self.sleeping.pop(pid, None)
+                continue
+            counters = _get_io_counters(pid)
+            since = self.sleeping.get(pid)
+            if since is None or since[1] != counters:
+                self.sleeping[pid] = (now, counters)
+                continue
+            if now - since[0] >= self.breaker.threshold:
+                return self.breaker.trip(pid, self.cmd, wchan, self.root)
+        return None
+
+
+class HangBreaker():
+    """Detects commands that hang in uninterruptible sleep, typically on an
+    unresponsive NFS server or storage path, attributes each hang to the
+    mounts or the subsystem it happened in, and then fails any later command
+    or file copy that targets the same mount without running it.
+
+    Every hang is appended to `tripped`, and every command or file that was
+    skipped because of one to `skipped`, which are expected to be lists in
+    the sos manifest.
+
+    :param threshold:   Seconds a process must stay in uninterruptible sleep
+                        without doing any I/O to be considered hung
+    :type threshold:    ``int`` or ``float``
+
+    :param tmpdir:      The temporary directory of sos, which the output of
+                        commands is written to
+    :type tmpdir:       ``str``
+    """
+
+    def __init__(self, threshold=HANG_THRESHOLD, tmpdir=None):
+        self.threshold = threshold
+        self.tmpdir = tmpdir
+        self.tripped = []
+        self.skipped = []
+        self.soslog = logging.getLogger('sos')
+        self._mounts = []
+        self._hung_mounts = {}
+        self._hung_cmds = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_mounts():
+        """Read the mounts of the system, longest mountpoint first
+
+        :returns:   The mountpoint and filesystem type of each mount
+        :rtype:     ``list`` of ``tuple``
+        """
+        mounts = []
+        try:
+            with open(MOUNTINFO_PATH, 'r', encoding='utf-8') as mfile:
+                for line in mfile:
+                    fields = line.split()
+                    try:
+                        sep = fields.index('-')
+                        mounts.append((_unescape_mount(fields[4]),
+                                       fields[sep + 1]))
+                    except (ValueError, IndexError):
+                        continue
+        except OSError:
+            pass
+        return sorted(mounts, key=lambda m: len(m[0]), reverse=True)
+
+    def _get_mount(self, path):
+        return self._get_mount_type(path)[0]
+
+    def _get_mount_type(self, path):
+        for mount, fstype in self._mounts:
+            if mount == '/' or path == mount or path.startswith(mount + '/'):
+                return mount, fstype
+        return None, None
+
+    def watch(self, cmd, root=None):
+        """Get a watchdog that detects if a command hangs, and trips the
+        breaker if it does
+
+        :param cmd:     The command that is run
+        :type cmd:      ``str``
+
+        :param root:    The root directory the command is run in
+        :type root:     ``str``
+
+        :returns:   A callable to pass as the `watchdog` of
+                    ``sos_get_command_output()``
+        :rtype:     ``_HangWatch``
+        """
+        return _HangWatch(self, cmd, root)
+
+    @staticmethod
+    def _get_subsystem(wchan):
+        for subsys, (prefixes, _) in WCHAN_SUBSYSTEMS.items():
+            if any(wchan.startswith(p) for p in prefixes):
+                return subsys
+        return None
+
+    @staticmethod
+    def _split_cmd(cmd):
+        try:
+            return shlex.split(cmd)
+        except ValueError:
+            return cmd.split()
+
+    @staticmethod
+    def _get_arg_paths(args, root):
+        paths = []
+        for arg in args[1:]:
+            if not arg.startswith('/'):
+                continue
+            if root and root != '/':
+                arg = os.path.join(root, arg.lstrip('/'))
+            paths.append(os.path.normpath(arg))
+        return paths
+
+    def _is_ignored_path(self, path):
+        ignored = IGNORED_PATHS + ((self.tmpdir,) if self.tmpdir else ())
+        return any(path == i or path.startswith(i + '/') for i in ignored)
+
+    def _get_process_paths(self, pid, root):
+        """Get the paths a process is working on: the paths given in its
+        arguments, its working directory and the files it has open, leaving
+        out pseudo filesystems and the output files sos gave it
+        """
+        args = _read_proc(pid, 'cmdline').split('\0')
+        paths = self._get_arg_paths([a for a in args if a], root)
+        links = [f"/proc/{pid}/cwd"]
+        try:
+            # stdin, stdout and stderr are set up by sos, not the command
+            links.extend(
+                f"/proc/{pid}/fd/{fd}" for fd in os.listdir(f"/proc/{pid}/fd")
+                if fd.isdigit() and int(fd) > 2
+            )
+        except OSError:
+            pass
+        for link in links:
+            try:
+                # the target of these links is resolved by the kernel from
+                # its cache, without accessing the filesystem, and is not a
+                # path for pipes, sockets and the like
+                target = os.readlink(link)
+            except OSError:
+                continue
+            if target.startswith('/'):
+                paths.append(target)
+        return [p for p in paths if not self._is_ignored_path(p)]
+
+    def trip(self, pid, cmd, wchan, root=None):
+        """Record that a process of a command hangs, and fail later commands
+        and copies that target the mounts it hangs on
+
+        :param pid:     The pid of the hung process
+        :type pid:      ``int``
+
+        :param cmd:     The command the process belongs to
+        :type cmd:      ``str``
+
+        :param wchan:   The kernel function the process is waiting in
+        :type wchan:    ``str``
+
+        :param root:    The root directory the command is run in
+        :type root:     ``str``
+
+        :returns:   The reason later commands and copies are skipped for
+        :rtype:     ``str``
+        """
+        mounts = self.get_mounts()
+        with self._lock:
+            self._mounts = mounts
+        subsys = self._get_subsystem(wchan)
+        fstypes = WCHAN_SUBSYSTEMS[subsys][1] if subsys else ()
+        hung = set()
+        for path in self._get_process_paths(pid, root):
+            mount, fstype = self._get_mount_type(path)
+            if not mount or mount == '/':
+                continue
+            # when the process waits in a filesystem, only its paths on that
+            # filesystem are what it hangs on
+            if not fstypes or fstype in fstypes:
+                hung.add(mount)
+        if not hung and fstypes:
+            hung = {m for m, fstype in mounts if fstype in fstypes}
+        hung = sorted(hung)
+
+        reason = f"'{cmd}' hung in {wchan or 'uninterruptible sleep'}"
+        if hung:
+            reason += f" on {', '.join(hung)}"
+        elif subsys:
+            reason += f" ({subsys})"
+        cmdname = os.path.basename(self._split_cmd(cmd)[0])
+        with self._lock:
+            for mount in hung:
+                self._hung_mounts.setdefault(mount, reason)
+            if not hung:
+                self._hung_cmds.setdefault(cmdname, reason)
+            self.tripped.append({
+                'time': datetime.now(),
+                'command': cmd,
+                'pid': pid,
+                'wchan': wchan,
+                'subsystem': subsys,
+                'mounts': hung
+            })
+        self.soslog.warning(f"Command {reason}, skipping anything else "
+                            f"that targets {', '.join(hung) or cmdname}")
+        return reason
+
+    def check_path(self, path):
+        """Check if a path is on a mount that was found to hang
+
+        :param path:    The path to check
+        :type path:     ``str``
+
+        :returns:   The reason the path must be skipped, if any
+        :rtype:     ``str`` or ``None``
+        """
+        with self._lock:
+            if not self._hung_mounts:
+                return None
+            return self._hung_mounts.get(
+                self._get_mount(os.path.normpath(path))
+            )
+
+    def check_command(self, cmd, root=None):
+        """Check if a command targets a mount that was found to hang, or is a
+        command that was found to hang by itself
+
+        :param cmd:     The command to check
+        :type cmd:      ``str``
+
+        :param root:    The root directory the command is run in
+        :type root:     ``str``
+
+        :returns:   The reason the command must be skipped, if any
+        :rtype:     ``str`` or ``None``
+        """
+        if not self._hung_mounts and not self._hung_cmds:
+            return None
+        args = self._split_cmd(cmd)
+        if not args:
+            return None
+        cmdname = os.path.basename(args[0])
+        with self._lock:
+            if cmdname in self._hung_cmds:
+                return self._hung_cmds[cmdname]
+            if cmdname in MOUNT_WIDE_COMMANDS and self._hung_mounts:
+                return next(iter(self._hung_mounts.values()))
+        for path in self._get_arg_paths(args, root):
+            reason = self.check_path(path)
+            if reason:
+                return reason
+        return None
+
+    def skip(self, kind, item, reason, plugin):
+        """Record that a command or file was skipped because of a hang
+
+        :param kind:    What was skipped, i.e. 'command' or 'file'
+        :type kind:     ``str``
+
+        :param item:    The command or path that was skipped
+        :type item:     ``str``
+
+        :param reason:  The reason it was skipped for
+        :type reason:   ``str``
+
+        :param plugin:  The plugin that was collecting it
+        :type plugin:   ``str``
+        """
+        with self._lock:
+            self.skipped.append({
+                'type': kind,
+                'item': item,
+                'reason': reason,
+                'plugin': plugin
+            })
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,206 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Run-wide cache of command results for sos report """
+
+import os
+import shlex
+import shutil
+import threading
+
+from sos.utilities import (sos_get_command_output, SoSTimeoutError,
+                           POLLER_INTERVAL)
+
+# the largest output, in bytes, that is kept in memory to be reused
+CACHE_MAX_OUTPUT = 1048576
+
+# statuses of commands that did not finish on their own, i.e. that timed out
+# or were killed, besides those killed by a signal directly
+UNFINISHED_STATUSES = (None, 124, 137)
+
+
+class _CacheEntry():
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        # the file the output was written to, and its size then, if it was
+        # not kept in memory
+        self.path = None
+        self.size = None
+
+
+class CommandCache():
+    """Runs each distinct command once per sos report execution, and serves
+    every later request for the same command, be it from ``exec_cmd()``,
+    ``collect_cmd_output()``, ``add_cmd_output()`` or a predicate, from the
+    result of that first run.
+
+    Commands are the same if they have the same arguments and are run in the
+    same root, network namespace and working directory, with the same
+    environment, as the same user, with the same handling of stderr, binary
+    output and size limit.
+    Commands run in a container are distinguished by the container command
+    they are wrapped in.
+
+    Output up to ``CACHE_MAX_OUTPUT`` bytes is kept in memory. Output that is
+    written straight to a file in the archive is reused from that file, for
+    as long as the file is left as it was written.
+
+    A command that may change the system is never served from the cache, and
+    clears the cache once it has run. A command that is run repeatedly on
+    purpose, e.g. to sample its output, can bypass the cache. The result of
+    a command that timed out or was killed is not kept, as it may well finish
+    when run again.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(cmd, chroot=None, chdir=None, env=None, runas=None,
+                stderr=False, binary=False, sizelimit=None, netns=None,
+                **kwargs):
+        """Get the key of a command in the cache, from the parameters it is
+        run with by ``sos_get_command_output()``
+        """
+        try:
+            argv = tuple(shlex.split(cmd))
+        except ValueError:
+            argv = (cmd, )
+        return (
+            argv, chroot or None, chdir or None,
+            frozenset((env or {}).items()), runas or None, bool(stderr),
+            bool(binary), sizelimit or None, netns or None
+        )
+
+    def invalidate(self):
+        """Drop every cached result, e.g. after the system was changed
+        """
+        with self._lock:
+            self._entries = {}
+
+    def _serve(self, entry, to_file, binary):
+        result = dict(entry.result)
+        result['rusage'] = None
+        result['cached'] = True
+        if entry.path is not None:
+            try:
+                if os.path.getsize(entry.path) != entry.size:
+                    return None
+                if to_file:
+                    shutil.copyfile(entry.path, to_file)
+                else:
+                    with open(entry.path, 'rb') as ofile:
+                        result['output'] = ofile.read()
+                    if not binary:
+                        result['output'] = result['output'].decode(
+                            'utf-8', 'ignore'
+                        )
+            except OSError:
+                return None
+        elif to_file:
+            output = result['output']
+            if not binary:
+                output = output.encode('utf-8')
+            with open(to_file, 'wb') as ofile:
+                ofile.write(output)
+            result['output'] = b'' if binary else ''
+        return result
+
+    def _store(self, entry, result, to_file):
+        status = result.get('status')
+        if (result.get('timed_out') or status in UNFINISHED_STATUSES or
+                status < 0):
+            return False
+        if to_file:
+            try:
+                entry.path = to_file
+                entry.size = os.path.getsize(to_file)
+            except OSError:
+                return False
+        elif len(result['output']) > CACHE_MAX_OUTPUT:
+            return False
+        entry.result = result
+        return True
+
+    def _wait(self, entry, poller):
+        while not entry.done.wait(POLLER_INTERVAL if poller else None):
+            if poller():
+                raise SoSTimeoutError
+
+    def run(self, cmd, changes=False, cache=True, **kwargs):
+        """Get the result of a command, running it with
+        ``sos_get_command_output()`` only if it did not run yet
+
+        :param cmd:     The command to run
+        :type cmd:      ``str``
+
+        :param changes: Can the command change the system
+        :type changes:  ``bool``
+
+        :param cache:   Can the result of an earlier run be served, and the
+                        result of this run be kept
+        :type cache:    ``bool``
+
+        Any other keyword argument is passed to ``sos_get_command_output()``.
+
+        :returns:   The result of the command, with `cached` set if it was
+                    served from the cache
+        :rtype:     ``dict``
+        """
+        if changes:
+            try:
+                return sos_get_command_output(cmd, **kwargs)
+            finally:
+                self.invalidate()
+        if not cache:
+            return sos_get_command_output(cmd, **kwargs)
+
+        key = self.get_key(cmd, **kwargs)
+        to_file = kwargs.get('to_file')
+        binary = kwargs.get('binary', False)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = _CacheEntry()
+                    break
+            # another request ran, or is running, the same command
+            self._wait(entry, kwargs.get('poller'))
+            result = self._serve(entry, to_file, binary) if entry.result \
+                else None
+            if result is not None:
+                with self._lock:
+                    self.hits += 1
+                return result
+            with self._lock:
+                # the result cannot be reused, so run the command again
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+
+        try:
+            result = sos_get_command_output(cmd, **kwargs)
+            if self._store(entry, result, to_file):
+                result = dict(result)
+            else:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+            return result
+        except BaseException:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        finally:
+            entry.done.set()
+
+# vim: set et ts=4 sw=4 :
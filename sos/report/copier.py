@@ -0,0 +1,168 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Deadline-protected file copies for sos report """
+
+import fnmatch
+import logging
+import os
+import queue
+import threading
+import time
+
+# seconds a copy that takes longer than this is recorded as slow
+SLOW_COPY = 1
+
+# seconds between two checks of the progress of a copy
+PROGRESS_INTERVAL = 0.5
+
+# number of copies that must time out in a directory for the rest of the
+# directory to be skipped
+SKIP_DIR_AFTER = 2
+
+
+class _CopyJob():
+
+    def __init__(self, func):
+        self.func = func
+        self.done = threading.Event()
+        self.error = None
+
+
+class FileCopier():
+    """Runs the file copies of every plugin of a sos report execution in a
+    pool of worker threads, so that a copy that blocks, e.g. reading a sysfs
+    or debugfs attribute or a file on a hung NFS or FUSE mount, is abandoned
+    once it has made no progress for `timeout` seconds, and the plugin goes on
+    with the rest of its collection.
+
+    A worker blocked in an abandoned copy is left behind and replaced. A path
+    that timed out, and any directory in which ``SKIP_DIR_AFTER`` copies timed
+    out, is added to `skip_list` as a pattern in the format of
+    ``--skip-files``, and copies of paths matching the skip list are failed
+    without being attempted.
+
+    Every copy that took longer than ``SLOW_COPY`` seconds is appended to
+    `slow`, and every abandoned copy to `timed_out`, which are expected to be
+    lists in the sos manifest.
+
+    :param timeout:     Seconds a copy may make no progress for, or 0 to copy
+                        files in the calling thread without a deadline
+    :type timeout:      ``int`` or ``float``
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.slow = []
+        self.timed_out = []
+        self.skip_list = []
+        self.soslog = logging.getLogger('sos')
+        self._queue = queue.SimpleQueue()
+        self._idle = 0
+        self._nworkers = 0
+        self._dir_timeouts = {}
+        self._lock = threading.Lock()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.func()
+            except Exception as err:
+                job.error = err
+            job.done.set()
+            with self._lock:
+                self._idle += 1
+
+    def _submit(self, job):
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+            else:
+                self._nworkers += 1
+                threading.Thread(target=self._worker, daemon=True,
+                                 name=f"sos-copy-{self._nworkers}").start()
+        self._queue.put(job)
+
+    def check_path(self, path):
+        """Check if a path matches the skip list
+
+        :param path:    The path to check
+        :type path:     ``str``
+
+        :returns:   True if the path must be skipped
+        :rtype:     ``bool``
+        """
+        with self._lock:
+            return any(fnmatch.fnmatch(path, skip) for skip in self.skip_list)
+
+    def _add_timeout(self, path, plugin, elapsed):
+        self.soslog.warning(f"[plugin:{plugin}] abandoned copy of '{path}' "
+                            f"after it made no progress for {self.timeout}s")
+        pdir = os.path.dirname(path)
+        with self._lock:
+            self.timed_out.append({
+                'path': path, 'plugin': plugin, 'time': round(elapsed, 3)
+            })
+            self.skip_list.append(path)
+            self._dir_timeouts[pdir] = self._dir_timeouts.get(pdir, 0) + 1
+            if self._dir_timeouts[pdir] == SKIP_DIR_AFTER:
+                self.soslog.warning(f"[plugin:{plugin}] skipping any other "
+                                    f"file under '{pdir}'")
+                self.skip_list.append(os.path.join(pdir, '*'))
+
+    def copy(self, path, func, plugin, progress=None):
+        """Copy a file by calling `func`, and wait for it as long as it keeps
+        making progress
+
+        :param path:        The path that is copied
+        :type path:         ``str``
+
+        :param func:        The callable that copies the file, which must
+                            not write into the archive itself, as it may
+                            still finish after the copy was abandoned
+        :type func:         ``callable``
+
+        :param plugin:      The name of the plugin copying the file
+        :type plugin:       ``str``
+
+        :param progress:    A callable returning a value that changes as long
+                            as the copy makes progress, e.g. the size copied
+        :type progress:     ``callable``
+
+        :returns:   True if the file was copied, False if the copy was
+                    abandoned
+        :rtype:     ``bool``
+        """
+        start = time.monotonic()
+        if not self.timeout:
+            func()
+        else:
+            job = _CopyJob(func)
+            self._submit(job)
+            last_change = start
+            last = progress() if progress else None
+            while not job.done.wait(PROGRESS_INTERVAL):
+                now = time.monotonic()
+                current = progress() if progress else None
+                if current != last:
+                    last, last_change = current, now
+                elif now - last_change >= self.timeout:
+                    self._add_timeout(path, plugin, now - start)
+                    return False
+            if job.error:
+                raise job.error
+        elapsed = time.monotonic() - start
+        if elapsed >= SLOW_COPY:
+            with self._lock:
+                self.slow.append({
+                    'path': path, 'plugin': plugin, 'time': round(elapsed, 3)
+                })
+        return True
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,129 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Run-wide command execution pool for sos report """
+
+import contextlib
+import itertools
+import queue
+import threading
+
+from concurrent.futures import Future
+
+
+class CommandExecutor():
+    """A bounded pool of worker threads shared by every plugin of a sos report
+    execution, used to run the commands plugins collect the output of.
+
+    Without this, each plugin runs its commands one at a time in the thread
+    it is collected in, so the number of concurrently running commands is
+    capped at the number of plugins being collected. With it, the commands of
+    every running plugin are queued to the same pool and executed in order
+    of their priority across all plugins, and then in the order they were
+    submitted.
+
+    The pool does not start any worker thread until ``start()`` is called, and
+    plugins are expected to run their commands themselves when the pool is
+    not running.
+
+    If ``limit`` is set to a ``ConcurrencyLimit``, workers also wait for a
+    slot under that limit before running each call, which allows the number
+    of concurrently running commands to be lowered below the number of
+    workers while the pool is running.
+    """
+
+    def __init__(self):
+        self.workers = 0
+        self.limit = None
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    @property
+    def running(self):
+        """Is the pool accepting and running commands
+        """
+        return bool(self._threads) and not self._shutdown
+
+    def start(self, workers):
+        """Start the worker threads of the pool
+
+        :param workers:     The number of commands to run concurrently
+        :type workers:      ``int``
+        """
+        with self._lock:
+            self.workers = int(workers)
+            while len(self._threads) < self.workers:
+                _thread = threading.Thread(
+                    target=self._worker, daemon=True,
+                    name=f"sos-cmd-{len(self._threads)}"
+                )
+                _thread.start()
+                self._threads.append(_thread)
+
+    def submit(self, priority, func, *args, **kwargs):
+        """Queue a call to be run by the pool
+
+        :param priority:    The priority of the call, lower values are run
+                            first
+        :type priority:     ``int``
+
+        :param func:        The callable to run
+        :type func:         ``callable``
+
+        :returns:   A future for the result of the call
+        :rtype:     ``concurrent.futures.Future``
+        """
+        future = Future()
+        with self._lock:
+            if not self.running:
+                raise RuntimeError('command executor is not running')
+            self._queue.put(
+                (priority, next(self._seq), future, func, args, kwargs)
+            )
+        return future
+
+    def _worker(self):
+        while True:
+            _, _, future, func, args, kwargs = self._queue.get()
+            if future is None:
+                return
+            slot = contextlib.nullcontext()
+            if self.limit:
+                slot = self.limit.slot()
+            with slot:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as err:
+                    future.set_exception(err)
+
+    def shutdown(self, wait=False):
+        """Stop the pool once all queued calls have been run. Worker threads
+        are daemonic, so a command that never returns will not prevent sos
+        from exiting.
+
+        :param wait:    Wait for the worker threads to exit before returning
+        :type wait:     ``bool``
+        """
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            for _ in self._threads:
+                self._queue.put(
+                    (float('inf'), next(self._seq), None, None, None, None)
+                )
+        if wait:
+            for _thread in self._threads:
+                _thread.join()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,227 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Load-adaptive concurrency control for sos report """
+
+import contextlib
+import logging
+import os
+import threading
+
+from datetime import datetime
+
+PRESSURE_PATH = '/proc/pressure'
+LOADAVG_PATH = '/proc/loadavg'
+
+# "some" avg10 pressure percentages above which the host is considered
+# stressed, and below which it is considered idle
+PRESSURE_HIGH = {'cpu': 40.0, 'io': 30.0, 'memory': 10.0}
+PRESSURE_LOW = {'cpu': 10.0, 'io': 5.0, 'memory': 1.0}
+
+# 1 minute load average per online CPU above which the host is considered
+# stressed, and below which it is considered idle
+LOAD_HIGH = 1.5
+LOAD_LOW = 0.7
+
+
+class ConcurrencyLimit():
+    """A limit on the number of tasks that may run concurrently, which can be
+    changed at any time between a floor and a ceiling. Lowering the limit
+    does not interrupt running tasks, but no new task is started until the
+    number of running tasks drops below the new limit.
+
+    :param floor:   The lowest value the limit may be set to
+    :type floor:    ``int``
+
+    :param ceiling: The highest value the limit may be set to, and the limit
+                    initially in effect
+    :type ceiling:  ``int``
+    """
+
+    def __init__(self, floor, ceiling):
+        self.ceiling = max(int(ceiling), 1)
+        self.floor = min(max(int(floor), 1), self.ceiling)
+        self.limit = self.ceiling
+        self.running = 0
+        self._cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Wait until a task may be started under the current limit, and hold
+        a slot for it while the context is active
+        """
+        with self._cond:
+            while self.running >= self.limit:
+                self._cond.wait()
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.running -= 1
+                self._cond.notify_all()
+
+    def set_limit(self, limit):
+        """Change the limit, bounded by the floor and ceiling
+
+        :param limit:   The new limit
+        :type limit:    ``int``
+
+        :returns:   The limit now in effect
+        :rtype:     ``int``
+        """
+        with self._cond:
+            self.limit = max(self.floor, min(self.ceiling, int(limit)))
+            self._cond.notify_all()
+            return self.limit
+
+
+class LoadGovernor():
+    """Periodically samples the pressure stall information and load average
+    of the host, and scales a set of ``ConcurrencyLimit``s down while the host
+    is stressed and back up while it is idle.
+
+    Every adjustment is appended to `decisions`, which is expected to be a
+    list in the sos manifest.
+
+    :param limits:      The limits to adjust, by name
+    :type limits:       ``dict`` of ``ConcurrencyLimit``
+
+    :param decisions:   The list adjustments are recorded to
+    :type decisions:    ``list``
+
+    :param interval:    Seconds between samples
+    :type interval:     ``int`` or ``float``
+    """
+
+    def __init__(self, limits, decisions, interval=2):
+        self.limits = limits
+        self.decisions = decisions
+        self.interval = interval
+        self.soslog = logging.getLogger('sos')
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            self.ncpus = len(os.sched_getaffinity(0))
+        except (AttributeError, OSError):
+            self.ncpus = os.cpu_count() or 1
+
+    def start(self):
+        """Start sampling in a background thread
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='sos-governor')
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, leaving the limits as they currently are
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.adjust(self.sample())
+            except Exception as err:
+                self.soslog.debug(f"Unable to adjust concurrency: {err}")
+
+    def _read_pressure(self, resource):
+        try:
+            with open(os.path.join(PRESSURE_PATH, resource), 'r',
+                      encoding='utf-8') as pfile:
+                for line in pfile:
+                    fields = line.split()
+                    if fields and fields[0] == 'some':
+                        for field in fields[1:]:
+                            key, val = field.split('=', 1)
+                            if key == 'avg10':
+                                return float(val)
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def sample(self):
+        """Sample the current load of the host
+
+        :returns:   The "some" avg10 pressure of cpu, io and memory, if
+                    available, and the 1 minute load average per CPU
+        :rtype:     ``dict``
+        """
+        sample = {
+            res: self._read_pressure(res) for res in PRESSURE_HIGH
+        }
+        try:
+            with open(LOADAVG_PATH, 'r', encoding='utf-8') as lfile:
+                sample['load'] = round(
+                    float(lfile.read().split()[0]) / self.ncpus, 2
+                )
+        except (OSError, ValueError, IndexError):
+            sample['load'] = None
+        return sample
+
+    @staticmethod
+    def evaluate(sample):
+        """Decide from a sample if concurrency should go down, up, or stay as
+        it is
+
+        :param sample:  A sample as returned by ``sample()``
+        :type sample:   ``dict``
+
+        :returns:   -1 to scale down, 1 to scale up or 0, and the reason
+        :rtype:     ``tuple`` of (``int``, ``str``)
+        """
+        stressed = [
+            f"{res} pressure {sample[res]}" for res in PRESSURE_HIGH
+            if sample.get(res) is not None and sample[res] > PRESSURE_HIGH[res]
+        ]
+        if sample.get('load') is not None and sample['load'] > LOAD_HIGH:
+            stressed.append(f"load {sample['load']} per cpu")
+        if stressed:
+            return -1, ', '.join(stressed)
+
+        known = [res for res in PRESSURE_LOW if sample.get(res) is not None]
+        if sample.get('load') is None and not known:
+            return 0, 'no load information available'
+        idle = (
+            all(sample[res] < PRESSURE_LOW[res] for res in known) and
+            (sample.get('load') is None or sample['load'] < LOAD_LOW)
+        )
+        if idle:
+            return 1, 'host is idle'
+        return 0, 'host is busy'
+
+    def adjust(self, sample):
+        """Adjust the limits based on a sample, and record the adjustment
+
+        :param sample:  A sample as returned by ``sample()``
+        :type sample:   ``dict``
+        """
+        step, reason = self.evaluate(sample)
+        if not step:
+            return
+        changes = {}
+        for name, limit in self.limits.items():
+            previous = limit.limit
+            current = limit.set_limit(previous + step)
+            if current != previous:
+                changes[name] = {'from': previous, 'to': current}
+        if not changes:
+            return
+        self.soslog.info(f"Adjusting concurrency ({reason}): " + ', '.join(
+            f"{name} {c['from']} -> {c['to']}" for name, c in changes.items()
+        ))
+        self.decisions.append({
+            'time': datetime.now(),
+            'reason': reason,
+            'sample': sample,
+            'limits': changes
+        })
+
+# vim: set et ts=4 sw=4 :
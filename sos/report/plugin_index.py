@@ -0,0 +1,208 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" On-disk index of the plugins shipped with sos report """
+
+import hashlib
+import json
+import logging
+import os
+
+from sos import __version__
+
+PLUGIN_INDEX_PATH = '/var/cache/sos/plugin_index.json'
+
+# class attributes that decide if a plugin is enabled on a given system
+TRIGGER_ATTRS = ('files', 'packages', 'commands', 'kernel_mods', 'services',
+                 'containers', 'architectures')
+
+
+def _class_path(class_):
+    return f"{class_.__module__}.{class_.__qualname__}"
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class PluginIndexEntry():
+    """Describes a single plugin class as recorded in the index, in a form
+    that can stand in for the class itself when deciding if a plugin module
+    needs to be imported at all.
+
+    :param data:    The recorded description of the plugin class
+    :type data:     ``dict``
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.profiles = tuple(data.get('profiles', ()))
+
+    def name(self):
+        """Get the name of the plugin
+
+        :returns: The name of the plugin, as returned by `Plugin.name()`
+        :rtype: ``str``
+        """
+        return self.data['plugin_name']
+
+    def is_subclass(self, classes):
+        """Check if the recorded plugin class subclasses any of `classes`,
+        e.g. the tagging classes that are valid for the loaded policy
+
+        :param classes: The classes to check against
+        :type classes:  ``tuple`` of classes
+
+        :returns: ``True`` if the plugin class subclasses any of `classes`
+        :rtype: ``bool``
+        """
+        return any(_class_path(c) in self.data['mro'] for c in classes)
+
+    @classmethod
+    def from_class(cls, plugin_class):
+        """Build an index entry from an imported plugin class
+
+        :param plugin_class: The plugin class to describe
+        :type plugin_class:  A subclass of ``Plugin``
+        """
+        data = {
+            'class': plugin_class.__name__,
+            'plugin_name': plugin_class.name(),
+            'mro': [
+                _class_path(c) for c in plugin_class.__mro__
+                if c is not object
+            ],
+            'profiles': _as_list(plugin_class.profiles) or [],
+            'short_desc': plugin_class.short_desc,
+            'options': [opt.name for opt in plugin_class.option_list]
+        }
+        for attr in TRIGGER_ATTRS:
+            data[attr] = _as_list(getattr(plugin_class, attr, None))
+        return cls(data)
+
+
+class PluginIndex():
+    """A cached record of the plugin classes defined by each plugin module of
+    sos report, so that sos does not need to import every plugin module on
+    each execution only to find out which ones are relevant.
+
+    The index is keyed by the sos version and by the modification times and
+    sizes of the plugin files, so any change to the installed plugins causes
+    it to be rebuilt. A module that is not in the index, for example because
+    it failed to import when the index was built, is always imported.
+
+    :param package:     The package plugins are loaded from
+    :type package:      ``module``
+
+    :param modules:     The names of the plugin modules in `package`
+    :type modules:      ``list``
+
+    :param path:        The file the index is cached in
+    :type path:         ``str``
+    """
+
+    def __init__(self, package, modules, path=PLUGIN_INDEX_PATH):
+        self.package = package
+        self.modules = modules
+        self.path = path
+        self.soslog = logging.getLogger('sos')
+        self.key = self._get_key()
+        self.entries = {}
+        self.changed = False
+        self.load()
+
+    def _get_key(self):
+        digest = hashlib.sha256(__version__.encode())
+        for module in self.modules:
+            for pkgpath in self.package.__path__:
+                fname = os.path.join(pkgpath, f"{module}.py")
+                try:
+                    fstat = os.stat(fname)
+                except OSError:
+                    continue
+                digest.update(
+                    f"{module}:{fstat.st_mtime_ns}:{fstat.st_size}".encode()
+                )
+                break
+        return digest.hexdigest()
+
+    def load(self):
+        """Load the cached index, if it exists and matches the installed
+        plugins
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as ifile:
+                index = json.load(ifile)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            self.soslog.debug(f"Unable to load plugin index from {self.path}:"
+                              f" {err}")
+            return
+        if not isinstance(index, dict) or index.get('key') != self.key:
+            return
+        self.entries = {
+            module: [PluginIndexEntry(c) for c in classes]
+            for module, classes in index.get('modules', {}).items()
+        }
+
+    def save(self):
+        """Write the index to disk if it was changed during this execution
+        """
+        if not self.changed:
+            return
+        index = {
+            'key': self.key,
+            'modules': {
+                module: [e.data for e in entries]
+                for module, entries in self.entries.items()
+            }
+        }
+        _tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(_tmp, 'w', encoding='utf-8') as ifile:
+                json.dump(index, ifile)
+            os.replace(_tmp, self.path)
+        except OSError as err:
+            self.soslog.debug(f"Unable to save plugin index to {self.path}: "
+                              f"{err}")
+
+    def get(self, module):
+        """Get the recorded plugin classes of a plugin module
+
+        :param module:  The name of the plugin module
+        :type module:   ``str``
+
+        :returns:   The recorded plugin classes, or ``None`` if the module is
+                    not in the index and must be imported
+        :rtype:     ``list`` of ``PluginIndexEntry`` or ``None``
+        """
+        return self.entries.get(module)
+
+    def add(self, module, plugin_classes):
+        """Record the plugin classes of an imported plugin module
+
+        :param module:          The name of the plugin module
+        :type module:           ``str``
+
+        :param plugin_classes:  All plugin classes defined by the module
+        :type plugin_classes:   ``list``
+        """
+        if module in self.entries:
+            return
+        self.entries[module] = [
+            PluginIndexEntry.from_class(c) for c in plugin_classes
+        ]
+        self.changed = True
+
+# vim: set et ts=4 sw=4 :
@@ -22,16 +22,20 @@ import logging
 import fnmatch
 import errno
 import textwrap
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
 from datetime import datetime
 
 from sos.utilities import (sos_get_command_output, import_module, grep,
                            fileobj, tail, is_executable, TIMEOUT_DEFAULT,
                            path_exists, path_isdir, path_isfile, path_islink,
                            listdir, path_join, bold, file_is_binary,
-                           recursive_dict_values_by_key)
+                           recursive_dict_values_by_key, get_netns_path)
 
 from sos.archive import P_FILE, P_LINK
+from sos.report.procsnap import ProcessTable, PROC_WORKERS
 
 
 def regex_findall(regex, fname):
@@ -51,6 +55,19 @@ def _mangle_command(command, name_max):
     return mangledname
 
 
+def _split_netns_command(command):
+    """Split a command run through `ip netns exec <namespace>` into the path
+    of the namespace, if it can be entered directly, and the command run in it
+    """
+    match = re.match(r"^ip\s+netns\s+exec\s+(\S+)\s+(\S.*)$", command)
+    if not match:
+        return None, command
+    netns = get_netns_path(match.group(1))
+    if not netns:
+        return None, command
+    return netns, match.group(2)
+
+
 def _node_type(st):
     """ return a string indicating the type of special node represented by
     the stat buffer st (block, character, fifo, socket).
@@ -251,7 +268,7 @@ class SoSPredicate:
         """Does 'cmd' output contain string 'output'?"""
         if 'cmd' not in cmd_output or 'output' not in cmd_output:
             return False
-        result = sos_get_command_output(cmd_output['cmd'])
+        result = self._owner.get_command_output(cmd_output['cmd'])
         if result['status'] != 0:
             return False
         for line in result['output'].splitlines():
@@ -522,6 +539,20 @@ class Plugin():
 
     :cvar cmd_timeout:  Timeout in seconds for individual commands
     :vartype cmd_timeout:   ``int``
+
+    :cvar cost_hint:    Expected run time in seconds for this plugin, used to
+                        schedule longer running plugins first when there is
+                        no run time history for the plugin on this host
+    :vartype cost_hint: ``int``
+
+    :cvar serial_cmds:  Run this plugin's commands one at a time in the order
+                        they were added, instead of in the run-wide command
+                        pool
+    :vartype serial_cmds: ``bool``
+
+    :cvar serial_setup: Run this plugin's ``setup()`` on its own before the
+                        setup of other plugins, instead of concurrently
+    :vartype serial_setup: ``bool``
     """
 
     plugin_name = None
@@ -537,6 +568,9 @@ class Plugin():
     sysroot = '/'
     plugin_timeout = TIMEOUT_DEFAULT
     cmd_timeout = TIMEOUT_DEFAULT
+    cost_hint = 1
+    serial_cmds = False
+    serial_setup = False
     _timeout_hit = False
     cmdtags = {}
     filetags = {}
@@ -558,6 +592,7 @@ class Plugin():
         self.commons = commons
         self.forbidden_paths = []
         self.copy_paths = set()
+        self.process_files = []
         self.container_copy_paths = []
         self.copy_strings = []
         self.collect_cmds = []
@@ -570,6 +605,9 @@ class Plugin():
         self.skip_commands = commons['cmdlineopts'].skip_commands
         self.default_environment = {}
         self._tail_files_list = []
+        self._cmd_fn_lock = threading.Lock()
+        self._cmd_fns = set()
+        self._file_subs = None
 
         self.soslog = self.commons['soslog'] if 'soslog' in self.commons \
             else logging.getLogger('sos')
@@ -624,6 +662,7 @@ class Plugin():
         self.manifest.add_field('timeout_hit', False)
         self.manifest.add_field('command_timeout', self.cmdtimeout)
         self.manifest.add_list('commands', [])
+        self.manifest.add_field('resource_usage', {})
         self.manifest.add_list('files', [])
         self.manifest.add_field('strings', {})
         self.manifest.add_field('containers', {})
@@ -744,6 +783,29 @@ class Plugin():
         self.manifest.add_field('end_time', datetime.now())
         self.manifest.add_field('timeout_hit', True)
 
+    def get_cmd_resource_usage(self):
+        """Sum up the resource usage of every command collected by the plugin
+        so far, as recorded in the manifest
+
+        :returns:   The total user and system CPU seconds, bytes read from and
+                    written to storage, and the highest maximum resident set
+                    size in KiB of the commands
+        :rtype:     ``dict``
+        """
+        usage = {'commands': 0, 'utime': 0.0, 'stime': 0.0, 'maxrss': 0,
+                 'read_bytes': 0, 'write_bytes': 0}
+        for cmd in list(self.manifest.commands):
+            rusage = cmd.get('rusage')
+            if not rusage:
+                continue
+            usage['commands'] += 1
+            for key in ('utime', 'stime', 'read_bytes', 'write_bytes'):
+                usage[key] += rusage.get(key) or 0
+            usage['maxrss'] = max(usage['maxrss'], rusage.get('maxrss') or 0)
+        usage['utime'] = round(usage['utime'], 6)
+        usage['stime'] = round(usage['stime'], 6)
+        return usage
+
     def check_timeout(self):
         """
         Checks to see if the plugin has hit its timeout.
@@ -957,6 +1019,90 @@ class Plugin():
     def _log_debug(self, msg):
         self.soslog.debug(self._format_msg(msg))
 
+    def _trace(self, name, **args):
+        """Record the time spent in a context as a span of the execution
+        timeline, when tracing is enabled
+        """
+        tracer = self.commons.get('tracer')
+        if tracer is None:
+            return contextlib.nullcontext()
+        return tracer.span(name, cat=self.name(), **args)
+
+    def _check_hang_breaker(self, kind, item, root=None):
+        """Check if a command or file targets a mount that was found to hang
+        earlier in the execution, and record it as skipped if it does
+
+        :param kind:    What is checked, i.e. 'command' or 'file'
+        :type kind:     ``str``
+
+        :param item:    The command or path to check
+        :type item:     ``str``
+
+        :param root:    The root directory a command is run in
+        :type root:     ``str``
+
+        :returns:   True if the command or file must be skipped
+        :rtype:     ``bool``
+        """
+        breaker = self.commons.get('hang_breaker')
+        if breaker is None:
+            return False
+        if kind == 'command':
+            reason = breaker.check_command(item, root)
+        else:
+            reason = breaker.check_path(item)
+        if not reason:
+            return False
+        self._log_warn(f"skipping {kind} '{item}': {reason}")
+        breaker.skip(kind, item, reason, self.name())
+        return True
+
+    def get_command_output(self, cmd, changes=False, cache=True, **kwargs):
+        """Run a command with ``sos_get_command_output()``, or get its result
+        from the run-wide command cache if the same command already ran
+
+        :param cmd:     The command to run
+        :type cmd:      ``str``
+
+        :param changes: Can the command change the system, in which case it
+                        is always run and the cache is cleared afterwards
+        :type changes:  ``bool``
+
+        :param cache:   Can the result of an earlier run of the command be
+                        used, or be kept for later ones
+        :type cache:    ``bool``
+
+        A command run through `ip netns exec <namespace>` on the host is run
+        by entering the namespace directly, which spares spawning `ip` and
+        the mounts it sets up for every command.
+
+        Any other keyword argument is passed to ``sos_get_command_output()``.
+
+        :returns:   The result of the command
+        :rtype:     ``dict``
+        """
+        _cmd = cmd
+        if kwargs.get('chroot') in (None, False, '/'):
+            netns, _cmd = _split_netns_command(cmd)
+            if netns:
+                kwargs['netns'] = netns
+        cmd_cache = self.commons.get('cmd_cache')
+        if cmd_cache is None:
+            return sos_get_command_output(_cmd, **kwargs)
+        result = cmd_cache.run(_cmd, changes=changes, cache=cache, **kwargs)
+        if result.get('cached'):
+            self._log_debug(f"reused the result of an earlier run of '{cmd}'")
+        return result
+
+    def _get_hang_watchdog(self, cmd, root=None):
+        """Get the watchdog that detects if a command hangs, if the hang
+        breaker is in use
+        """
+        breaker = self.commons.get('hang_breaker')
+        if breaker is None:
+            return None
+        return breaker.watch(cmd, root)
+
     def strip_sysroot(self, path):
         """Remove the configured sysroot from a filesystem path
 
@@ -1236,6 +1382,10 @@ class Plugin():
                     continue
                 if fnmatch.fnmatch(called['cmd'], globstr):
                     path = os.path.join(self.commons['cmddir'], called['file'])
+                    if self._file_subs is not None:
+                        self._queue_file_sub(path, regexp, subst, 0)
+                        replacements = 0
+                        continue
                     self._log_debug(f"applying substitution to '{path}'")
                     readable = self.archive.open_file(path)
                     result, replacements = re.subn(
@@ -1289,7 +1439,8 @@ class Plugin():
                       within the file
         :type subst: ``str``
 
-        :returns: Number of replacements made
+        :returns: Number of replacements made. Substitutions queued while
+                  ``batch_file_subs()`` is active are reported as ``0``
         :rtype: ``int``
         """
         try:
@@ -1300,6 +1451,10 @@ class Plugin():
                             else regexp)
             if not path:
                 return 0
+            if self._file_subs is not None:
+                self._queue_file_sub(path, regexp, subst,
+                                     re.IGNORECASE | re.MULTILINE)
+                return 0
             replacements = self.archive.do_file_sub(path, regexp, subst)
         except (OSError, IOError) as e:
             # if trying to regexp a nonexisting file, dont log it as an
@@ -1313,6 +1468,45 @@ class Plugin():
             replacements = 0
         return replacements
 
+    def _queue_file_sub(self, path, regexp, subst, flags):
+        """Queue a substitution to be applied to an archived file once the
+        current ``batch_file_subs()`` block exits
+        """
+        self._file_subs.setdefault(path, []).append((regexp, subst, flags))
+
+    @contextlib.contextmanager
+    def batch_file_subs(self):
+        """Queue the substitutions requested by ``do_file_sub()`` and the
+        methods built on it, as well as ``do_cmd_output_sub()``, while this
+        context is active. When it exits, every archived file with queued
+        substitutions is read and rewritten once with all of them applied in
+        the order they were requested.
+
+        This is used by sos around each plugin's ``postproc()``, where plugins
+        commonly apply many substitutions to the same files.
+        """
+        self._file_subs = {}
+        try:
+            yield
+        finally:
+            file_subs = self._file_subs
+            self._file_subs = None
+            for path, subs in file_subs.items():
+                self._log_debug(f"applying {len(subs)} substitution(s) to "
+                                f"'{path}'")
+                try:
+                    self.archive.do_file_subs(path, subs)
+                except (OSError, IOError) as e:
+                    if e.errno == errno.ENOENT:
+                        msg = "file '%s' not collected, substitution skipped"
+                        self._log_debug(msg % path)
+                    else:
+                        msg = "regex substitution failed for '%s' with: '%s'"
+                        self._log_error(msg % (path, e))
+                except Exception as e:
+                    msg = "regex substitution failed for '%s' with: '%s'"
+                    self._log_error(msg % (path, e))
+
     def do_path_regex_sub(self, pathexp, regexp, subst):
         """Apply a regexp substituation to a set of files archived by
         sos. The set of files to be substituted is generated by matching
@@ -1399,6 +1593,48 @@ class Plugin():
             self._log_debug(f"link '{linkdest}' points to itself, skipping "
                             "target...")
 
+    def _copy_file(self, srcpath, dest, force=False):
+        """Copy a regular file into the archive. When the copy worker pool is
+        in use, the copy is run by a worker and abandoned if it stops making
+        progress, so that a read that blocks does not hold up the plugin.
+        The worker copies the file to a staging file outside of the archive,
+        which is only moved into the archive once the copy finished, so that
+        a worker that finishes an abandoned copy later never touches the
+        archive.
+
+        :returns:   False if the copy was abandoned
+        :rtype:     ``bool``
+        """
+        copier = self.commons.get('file_copier')
+        if copier is None:
+            self.archive.add_file(srcpath, dest, force=force)
+            return True
+        staged = self.archive.make_staging_file()
+        copied = []
+
+        def _copy():
+            copied.append(self.archive.stage_file(srcpath, staged))
+
+        def _progress():
+            try:
+                return os.path.getsize(staged)
+            except OSError:
+                return None
+
+        try:
+            done = copier.copy(srcpath, _copy, self.name(),
+                               progress=_progress)
+        except Exception:
+            with contextlib.suppress(OSError):
+                os.unlink(staged)
+            raise
+        if done and copied[0]:
+            self.archive.add_staged_file(staged, dest, force=force)
+        else:
+            with contextlib.suppress(OSError):
+                os.unlink(staged)
+        return done
+
     def _copy_dir(self, srcpath):
         try:
             for name in self.listdir(srcpath):
@@ -1468,6 +1704,15 @@ class Plugin():
             self._log_debug(f"skipping forbidden path '{srcpath}'")
             return None
 
+        if self._check_hang_breaker('file', srcpath):
+            return None
+
+        copier = self.commons.get('file_copier')
+        if copier is not None and copier.check_path(srcpath):
+            self._log_info(f"skipping '{srcpath}' as copying it or other "
+                           "files in its directory timed out earlier")
+            return None
+
         if not dest:
             dest = srcpath
 
@@ -1505,8 +1750,8 @@ class Plugin():
         if not st.st_mode & 0o444:
             # FIXME: reflect permissions in archive
             self.archive.add_string("", dest)
-        else:
-            self.archive.add_file(srcpath, dest, force=force)
+        elif not self._copy_file(srcpath, dest, force=force):
+            return None
 
         self.copied_files.append({
             'srcpath': srcpath,
@@ -1593,6 +1838,44 @@ class Plugin():
     def _add_copy_paths(self, copy_paths):
         self.copy_paths.update(copy_paths)
 
+    def add_process_files(self, names, pids=None):
+        """Add files of running processes under /proc, such as `status` or
+        `limits`, to the archive
+
+        Unlike ``add_copy_spec()``, the paths are neither globbed nor checked
+        when they are added, and the files are copied from a pool of threads
+        during collection, so that the files of many thousands of processes
+        can be collected in reasonable time.
+
+        :param names:   The names of the files to collect for each process
+        :type names:    ``str`` or a ``list`` of strings
+
+        :param pids:    The PIDs of the processes to collect the files of, or
+                        all processes in the /proc snapshot if not set
+        :type pids:     ``list``
+        """
+        if isinstance(names, str):
+            names = [names]
+        if pids is None:
+            pids = self.get_process_table().pids
+        proc_dir = self.path_join('/proc') if self.use_sysroot() else '/proc'
+        for name in names:
+            _manifest_files = []
+            for pid in pids:
+                _file = f"{proc_dir}/{pid}/{name}"
+                if (self._is_forbidden_path(_file) or
+                        self._is_policy_forbidden_path(_file) or
+                        self._is_skipped_path(_file)):
+                    continue
+                self.process_files.append(_file)
+                _manifest_files.append(_file.lstrip('/'))
+            if self.manifest:
+                self.manifest.files.append({
+                    'specification': f"/proc/[0-9]*/{name}",
+                    'files_copied': _manifest_files,
+                    'tags': []
+                })
+
     def add_file_tags(self, tagdict):
         """Apply a tag to a file matching a given regex, for use when a file
         is copied by a more generic copyspec.
@@ -2007,9 +2290,13 @@ class Plugin():
             kwargs['priority'] = 10
         if 'changes' not in kwargs:
             kwargs['changes'] = False
-        if (not getattr(SoSCommand(**kwargs), "snap_cmd", False) and
-           (self.get_option('all_logs') or kwargs['sizelimit'] == 0)):
+        if not getattr(SoSCommand(**kwargs), "snap_cmd", False):
+            # the output of commands added here is never handed back to the
+            # plugin, so stream it into the archive instead of holding it in
+            # memory
             kwargs['to_file'] = True
+            if self.get_option('all_logs'):
+                kwargs['sizelimit'] = 0
         if "snap_cmd" in kwargs:
             kwargs.pop("snap_cmd")
         soscmd = SoSCommand(**kwargs)
@@ -2080,7 +2367,8 @@ class Plugin():
                        sizelimit=None, pred=None, subdir=None,
                        changes=False, foreground=False, tags=[],
                        priority=10, cmd_as_tag=False, container=None,
-                       to_file=False, runas=None, snap_cmd=False):
+                       to_file=False, runas=None, snap_cmd=False,
+                       cache=True):
         """Run a program or a list of programs and collect the output
 
         Output will be limited to `sizelimit`, collecting the last X amount
@@ -2151,7 +2439,8 @@ class Plugin():
         :type container:  ``str``
 
         :param to_file: Should command output be written directly to a new
-                        file rather than stored in memory?
+                        file rather than stored in memory? Output is always
+                        streamed into the archive, unless `snap_cmd` is set
         :type to_file:  ``bool``
 
         :param runas: Run the `cmd` as the `runas` user
@@ -2159,6 +2448,12 @@ class Plugin():
 
         :param snap_cmd: Are the commands being run from a snap?
         :type snap_cmd: ``bool``
+
+        :param cache: Can the output of an earlier run of the same command be
+                      reused, or be kept for later ones? Unset it for
+                      commands that are run repeatedly on purpose, to see
+                      if their output changes
+        :type cache: ``bool``
         """
         if isinstance(cmds, str):
             cmds = [cmds]
@@ -2187,7 +2482,7 @@ class Plugin():
                                  changes=changes, foreground=foreground,
                                  priority=priority, cmd_as_tag=cmd_as_tag,
                                  to_file=to_file, container_cmd=container_cmd,
-                                 runas=runas, snap_cmd=snap_cmd)
+                                 runas=runas, snap_cmd=snap_cmd, cache=cache)
 
     def add_cmd_tags(self, tagdict):
         """Retroactively add tags to any commands that have been run by this
@@ -2269,22 +2564,30 @@ class Plugin():
         outdir = os.path.join(self.commons['cmddir'], plugin_dir)
         outfn = self._mangle_command(exe)
 
-        # check for collisions
-        if os.path.exists(os.path.join(self.archive.get_tmp_dir(),
-                                       outdir, outfn)):
-            inc = 1
-            name_max = self.archive.name_max()
-            while True:
-                suffix = f".{inc}"
-                newfn = outfn
-                if name_max < len(newfn)+len(suffix):
-                    newfn = newfn[:(name_max-len(newfn)-len(suffix))]
-                newfn = newfn + suffix
-                if not os.path.exists(os.path.join(self.archive.get_tmp_dir(),
-                                                   outdir, newfn)):
-                    outfn = newfn
-                    break
-                inc += 1
+        def _in_use(fname):
+            _path = os.path.join(outdir, fname)
+            return _path in self._cmd_fns or os.path.exists(
+                os.path.join(self.archive.get_tmp_dir(), _path)
+            )
+
+        # commands may be run concurrently, so reserve the filename before
+        # releasing the lock rather than relying on the file existing yet
+        with self._cmd_fn_lock:
+            # check for collisions
+            if _in_use(outfn):
+                inc = 1
+                name_max = self.archive.name_max()
+                while True:
+                    suffix = f".{inc}"
+                    newfn = outfn
+                    if name_max < len(newfn)+len(suffix):
+                        newfn = newfn[:(name_max-len(newfn)-len(suffix))]
+                    newfn = newfn + suffix
+                    if not _in_use(newfn):
+                        outfn = newfn
+                        break
+                    inc += 1
+            self._cmd_fns.add(os.path.join(outdir, outfn))
 
         return os.path.join(outdir, outfn)
 
@@ -2349,7 +2652,7 @@ class Plugin():
                             binary=False, sizelimit=None, subdir=None,
                             changes=False, foreground=False, tags=[],
                             priority=10, cmd_as_tag=False, to_file=False,
-                            container_cmd=False, runas=None):
+                            container_cmd=False, runas=None, cache=True):
         """Execute a command and save the output to a file for inclusion in the
         report.
 
@@ -2376,8 +2679,11 @@ class Plugin():
             :param tags:                Add tags in the archive manifest
             :param cmd_as_tag:          Format command string to tag
             :param to_file:             Write output directly to file instead
-                                        of saving in memory
+                                        of saving in memory, keeping only the
+                                        last `sizelimit` MB of it
             :param runas:               Run the `cmd` as the `runas` user
+            :param cache:               Can the output of an earlier run of
+                                        the cmd be reused?
 
         :returns:       dict containing status, output, and filename in the
                         archive for the executed cmd
@@ -2408,6 +2714,11 @@ class Plugin():
         else:
             root = None
 
+        if self._check_hang_breaker('command', cmd, root):
+            return {'status': None, 'output': '', 'truncated': False,
+                    'timed_out': False, 'hung': None, 'rusage': None,
+                    'filename': ''}
+
         if suggest_filename:
             outfn = self._make_command_filename(suggest_filename, subdir)
         else:
@@ -2424,23 +2735,26 @@ class Plugin():
 
         start = time()
 
-        result = sos_get_command_output(
-            cmd, timeout=timeout, stderr=stderr, chroot=root,
-            chdir=runat, env=_env, binary=binary, sizelimit=sizelimit,
-            poller=self.check_timeout, foreground=foreground,
-            to_file=out_file, runas=runas
+        result = self.get_command_output(
+            cmd, changes=changes, cache=cache, timeout=timeout,
+            stderr=stderr, chroot=root, chdir=runat, env=_env, binary=binary,
+            sizelimit=sizelimit, poller=self.check_timeout,
+            foreground=foreground, to_file=out_file, runas=runas,
+            watchdog=self._get_hang_watchdog(cmd, root)
         )
 
         end = time()
         run_time = end - start
 
-        if result['status'] == 124:
+        if result.get('timed_out'):
             warn = f"command '{cmd}' timed out after {timeout}s"
             self._log_warn(warn)
             if to_file:
                 msg = (" - output up until the timeout may be available at "
                        f"{outfn}")
                 self._log_debug(f"{warn}{msg}")
+        elif result.get('hung'):
+            self._log_warn(f"command '{cmd}' was stopped: {result['hung']}")
 
         manifest_cmd = {
             'command': cmd.split(' ')[0],
@@ -2449,10 +2763,14 @@ class Plugin():
             'filepath': outfn if to_file else None,
             'truncated': result['truncated'],
             'return_code': result['status'],
+            'timed_out': result.get('timed_out', False),
+            'hung': result.get('hung'),
             'priority': priority,
             'start_time': start,
             'end_time': end,
             'run_time': run_time,
+            'rusage': result.get('rusage'),
+            'cached': result.get('cached', False),
             'tags': _tags
         }
 
@@ -2463,16 +2781,21 @@ class Plugin():
                 if self.commons['cmdlineopts'].chroot != 'always':
                     self._log_info(f"command '{cmd.split()[0]}' not found in "
                                    f"{root} - re-trying in host root")
-                    result = sos_get_command_output(
-                        cmd, timeout=timeout, chroot=False, chdir=runat,
-                        env=env, binary=binary, sizelimit=sizelimit,
-                        poller=self.check_timeout, to_file=out_file
+                    result = self.get_command_output(
+                        cmd, changes=changes, cache=cache, timeout=timeout,
+                        chroot=False,
+                        chdir=runat, env=env, binary=binary,
+                        sizelimit=sizelimit, poller=self.check_timeout,
+                        to_file=out_file
                     )
                     run_time = time() - start
+                    manifest_cmd['timed_out'] = result.get('timed_out', False)
+                    manifest_cmd['rusage'] = result.get('rusage')
             self._log_debug(f"could not run '{cmd}': command not found")
             # Exit here if the command was not found in the chroot check above
             # as otherwise we will create a blank file in the archive
             if result['status'] in [126, 127]:
+                manifest_cmd['filepath'] = None
                 if self.manifest:
                     self.manifest.commands.append(manifest_cmd)
                     return result
@@ -2485,6 +2808,12 @@ class Plugin():
                            "truncated")
             linkfn = outfn
             outfn = outfn.replace('sos_commands', 'sos_strings') + '.tailed'
+            if to_file:
+                # the tail of the output was streamed to the original path
+                self.archive.check_path(outfn, P_FILE, force=True)
+                os.rename(out_file, os.path.join(
+                    self.archive.get_archive_path(), outfn
+                ))
 
         if not to_file:
             if binary:
@@ -2594,13 +2923,13 @@ class Plugin():
             cmd, suggest_filename=suggest_filename, root_symlink=root_symlink,
             timeout=timeout, stderr=stderr, chroot=chroot, runat=runat,
             env=env, binary=binary, sizelimit=sizelimit, foreground=foreground,
-            subdir=subdir, tags=tags, runas=runas
+            subdir=subdir, tags=tags, runas=runas, changes=changes
         )
 
     def exec_cmd(self, cmd, timeout=None, stderr=True, chroot=True,
                  runat=None, env=None, binary=False, pred=None,
                  foreground=False, container=False, quotecmd=False,
-                 runas=None):
+                 runas=None, changes=False):
         """Execute a command right now and return the output and status, but
         do not save the output within the archive.
 
@@ -2645,6 +2974,10 @@ class Plugin():
         :param runas:               Run the `cmd` as the `runas` user
         :type runas: ``str``
 
+        :param changes:             Does this cmd potentially make a change
+                                    on the system?
+        :type changes: ``bool``
+
         :returns:                   Command exit status and output
         :rtype: ``dict``
         """
@@ -2673,10 +3006,14 @@ class Plugin():
                 self._log_info(f"Cannot run cmd '{cmd}' in container "
                                f"{container}: no such container is running.")
 
-        return sos_get_command_output(cmd, timeout=timeout, chroot=root,
-                                      chdir=runat, binary=binary, env=_env,
-                                      foreground=foreground, stderr=stderr,
-                                      runas=runas)
+        if self._check_hang_breaker('command', cmd, root):
+            return _default
+
+        return self.get_command_output(
+            cmd, changes=changes, timeout=timeout, chroot=root, chdir=runat,
+            binary=binary, env=_env, foreground=foreground, stderr=stderr,
+            runas=runas, watchdog=self._get_hang_watchdog(cmd, root)
+        )
 
     def _add_container_file_to_manifest(self, container, path, arcpath, tags):
         """Adds a file collection to the manifest for a particular container
@@ -3112,9 +3449,24 @@ class Plugin():
     def _collect_copy_specs(self):
         for path in sorted(self.copy_paths, reverse=True):
             self._log_info(f"collecting path '{path}'")
-            self._do_copy_path(path)
+            with self._trace('copy', path=path):
+                self._do_copy_path(path)
+        self._collect_process_files()
         self.generate_copyspec_tags()
 
+    def _collect_process_files(self):
+        """Copy the files added by ``add_process_files()`` from a pool of
+        threads, as most of the time copying them is spent in reading the
+        files from /proc
+        """
+        if not self.process_files:
+            return
+        self._log_info(f"collecting {len(self.process_files)} process files")
+        with self._trace('copy', path='/proc'):
+            with ThreadPoolExecutor(PROC_WORKERS) as pool:
+                list(pool.map(self._do_copy_path, self.process_files,
+                              chunksize=64))
+
     def _collect_container_copy_specs(self):
         """Copy any requested files from containers here. This is done
         separately from normal file collection as this requires the use of
@@ -3157,15 +3509,53 @@ class Plugin():
                 self._log_info(f"error copying '{path}' from container "
                                f"'{con}': {cpret['output']}")
 
+    def _collect_cmd(self, soscmd):
+        self._log_debug(f"unpacked command: {str(soscmd)}")
+        user = ""
+        if getattr(soscmd, "runas", None) is not None:
+            user = f", as the {soscmd.runas} user"
+        self._log_info(f"collecting output of '{soscmd.cmd}'{user}")
+        with self._trace('command', cmd=soscmd.cmd):
+            return self._collect_cmd_output(**soscmd.__dict__)
+
+    def _get_cmd_tiers(self):
+        """Split the commands to collect into groups that may be run
+        concurrently. Commands of a given priority are only started once all
+        of the plugin's commands with a lower priority have finished, and a
+        command that may change the system, or that bypasses the command
+        cache to sample its output, is always run on its own.
+
+        :returns:   Groups of commands, in the order they must be run
+        :rtype:     ``list`` of ``list``s of ``SoSCommand``
+        """
+        def _alone(soscmd):
+            return soscmd.changes or not getattr(soscmd, 'cache', True)
+
+        tiers = []
+        for soscmd in self.collect_cmds:
+            if (not tiers or _alone(soscmd) or _alone(tiers[-1][-1]) or
+                    soscmd.priority != tiers[-1][-1].priority):
+                tiers.append([])
+            tiers[-1].append(soscmd)
+        return tiers
+
     def _collect_cmds(self):
         self.collect_cmds.sort(key=lambda x: x.priority)
-        for soscmd in self.collect_cmds:
-            self._log_debug(f"unpacked command: {str(soscmd)}")
-            user = ""
-            if getattr(soscmd, "runas", None) is not None:
-                user = f", as the {soscmd.runas} user"
-            self._log_info(f"collecting output of '{soscmd.cmd}'{user}")
-            self._collect_cmd_output(**soscmd.__dict__)
+        executor = self.commons.get('cmd_executor')
+        if self.serial_cmds or executor is None or not executor.running:
+            for soscmd in self.collect_cmds:
+                self._collect_cmd(soscmd)
+            return
+        for tier in self._get_cmd_tiers():
+            futures = [
+                executor.submit(soscmd.priority, self._collect_cmd, soscmd)
+                for soscmd in tier
+            ]
+            wait_futures(futures)
+            for future in futures:
+                # re-raise the first failure, as we would have when running
+                # the commands serially
+                future.result()
 
     def _collect_tailed_files(self):
         for _file, _size in self._tail_files_list:
@@ -3329,6 +3719,20 @@ class Plugin():
             # no checks beyond architecture restrictions
             return self.check_is_architecture()
 
+        resolver = self.commons.get('trigger_resolver')
+        if resolver is not None and resolver.active:
+            # triggers are shared by many plugins, so use the answers already
+            # resolved for other plugins during this execution
+            return ((any(resolver.path_exists(f) for f in files) or
+                    any(resolver.is_installed(pkg) for pkg in packages) or
+                    any(resolver.is_executable(cmd) for cmd in commands) or
+                    any(resolver.is_module_loaded(mod)
+                        for mod in self.kernel_mods) or
+                    any(resolver.is_service(svc) for svc in services) or
+                    any(resolver.container_exists(cntr, self.container_exists)
+                        for cntr in containers)) and
+                    self.check_is_architecture())
+
         return ((any(self.path_exists(fname) for fname in files) or
                 any(self.is_installed(pkg) for pkg in packages) or
                 any(is_executable(cmd, self.sysroot) for cmd in commands) or
@@ -3499,19 +3903,7 @@ class Plugin():
         :returns: ``True`` if the process exists, else ``False``
         :rtype: ``bool``
         """
-        status = False
-        cmd_line_glob = "/proc/[0-9]*/cmdline"
-        try:
-            cmd_line_paths = glob.glob(cmd_line_glob)
-            for path in cmd_line_paths:
-                with open(self.path_join(path), 'r',
-                          encoding='utf-8') as pfile:
-                    cmd_line = pfile.read().strip()
-                    if process in cmd_line:
-                        status = True
-        except IOError:
-            return False
-        return status
+        return self.get_process_table().check_process(process)
 
     def get_process_pids(self, process):
         """Get a list of all PIDs that match a specified name
@@ -3522,18 +3914,19 @@ class Plugin():
         :returns: A list of PIDs
         :rtype: ``list``
         """
-        pids = []
-        cmd_line_glob = "/proc/[0-9]*/cmdline"
-        cmd_line_paths = glob.glob(cmd_line_glob)
-        for path in cmd_line_paths:
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    cmd_line = f.read().strip()
-                    if process in cmd_line:
-                        pids.append(path.split("/")[2])
-            except IOError:
-                continue
-        return pids
+        return self.get_process_table().get_pids(process)
+
+    def get_process_table(self):
+        """Get the snapshot of the processes running on the system, taken
+        once per sos report execution
+
+        :returns: The table of processes
+        :rtype: ``ProcessTable``
+        """
+        table = self.commons.get('process_table')
+        if table is None:
+            table = ProcessTable(self.path_join('/proc'))
+        return table
 
     def get_network_namespaces(self, ns_pattern=None, ns_max=None):
         if ns_max is None and self.commons['cmdlineopts'].namespaces:
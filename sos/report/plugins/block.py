@@ -15,6 +15,7 @@ class Block(Plugin, IndependentPlugin):
 
     plugin_name = 'block'
     profiles = ('storage', 'hardware')
+    cost_hint = 10
     verify_packages = ('util-linux',)
     files = ('/sys/block',)
 
@@ -35,7 +35,7 @@ class Corosync(Plugin):
         ])
         self.add_cmd_output("corosync-cmapctl",
                             tags="corosync_cmapctl")
-        self.exec_cmd("killall -USR2 corosync")
+        self.exec_cmd("killall -USR2 corosync", changes=True)
 
         corosync_conf = "/etc/corosync/corosync.conf"
         if not self.path_exists(corosync_conf):
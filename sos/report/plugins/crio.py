@@ -111,7 +111,7 @@ class CRIO(Plugin, RedHatPlugin, UbuntuPlugin, CosPlugin):
         if result['status'] != 0:
             return
         pid = result['output'].strip()
-        result = self.exec_cmd("kill -USR1 " + pid)
+        result = self.exec_cmd("kill -USR1 " + pid, changes=True)
         if result['status'] == 0:
             self.add_copy_spec("/tmp/crio-goroutine-stacks*.log")
 
@@ -28,6 +28,7 @@ class DNFPlugin(Plugin, RedHatPlugin):
     short_desc = 'dnf package manager'
     plugin_name = "dnf"
     profiles = ('system', 'packagemanager', 'sysmgmt')
+    cost_hint = 30
 
     files = ('/etc/dnf/dnf.conf',)
     packages = ('dnf',)
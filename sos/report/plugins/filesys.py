@@ -25,6 +25,7 @@ class Filesys(Plugin, DebianPlugin, UbuntuPlugin, CosPlugin):
 
     plugin_name = 'filesys'
     profiles = ('storage',)
+    cost_hint = 20
 
     option_list = [
         PluginOpt('lsof', default=False,
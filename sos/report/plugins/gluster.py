@@ -93,7 +93,7 @@ class Gluster(Plugin, RedHatPlugin):
         if self.get_option("dump"):
             if self.path_exists(self.statedump_dir):
                 statedump_cmd = "killall -USR1 glusterfs glusterfsd glusterd"
-                if self.exec_cmd(statedump_cmd)['status'] == 0:
+                if self.exec_cmd(statedump_cmd, changes=True)['status'] == 0:
                     # let all the processes catch the signal and create
                     # statedump file entries.
                     time.sleep(1)
@@ -105,7 +105,7 @@ class Gluster(Plugin, RedHatPlugin):
             else:
                 self.soslog.warning("Unable to generate statedumps, no such "
                                     "directory: %s", self.statedump_dir)
-            state = self.exec_cmd("gluster get-state")
+            state = self.exec_cmd("gluster get-state", changes=True)
             if state['status'] == 0:
                 state_file = state['output'].split()[-1]
                 self.add_copy_spec(state_file)
@@ -31,6 +31,7 @@ class Kernel(Plugin, IndependentPlugin):
 
     plugin_name = 'kernel'
     profiles = ('system', 'hardware', 'kernel')
+    cost_hint = 20
     verify_packages = ('kernel$',)
 
     sys_module = '/sys/module'
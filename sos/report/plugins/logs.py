@@ -16,6 +16,7 @@ class LogsBase(Plugin):
 
     plugin_name = "logs"
     profiles = ('system', 'hardware', 'storage')
+    cost_hint = 60
 
     def setup(self):
         rsyslog = 'etc/rsyslog.conf'
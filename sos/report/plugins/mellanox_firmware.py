@@ -45,11 +45,11 @@ class MellanoxFirmware(Plugin, IndependentPlugin):
         if cout['status'] != 0:
             return
 
-        cout = self.collect_cmd_output('mst start')
+        cout = self.collect_cmd_output('mst start', changes=True)
         if cout['status'] != 0:
             return
 
-        self.collect_cmd_output('mst cable add')
+        self.collect_cmd_output('mst cable add', changes=True)
         self.collect_cmd_output("mst status -v", timeout=10)
         self.collect_cmd_output("mlxcables", timeout=10)
         cout = os.listdir("/dev/mst")
@@ -120,7 +120,7 @@ class MellanoxFirmware(Plugin, IndependentPlugin):
             # waiting for one second. This output is useful to check
             # if certain registers changed
             for _ in range(3):
-                self.add_cmd_output(f"mstdump {device}")
+                self.add_cmd_output(f"mstdump {device}", cache=False)
                 time.sleep(1)
 
 # vim: set et ts=4 sw=4 :
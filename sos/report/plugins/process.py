@@ -7,7 +7,6 @@
 # See the LICENSE file in the source distribution for further information.
 
 import json
-import re
 
 from sos.report.plugins import Plugin, IndependentPlugin, PluginOpt
 
@@ -18,6 +17,7 @@ class Process(Plugin, IndependentPlugin):
 
     plugin_name = 'process'
     profiles = ('system',)
+    cost_hint = 30
 
     option_list = [
         PluginOpt('lsof', default=True, desc='collect info on all open files'),
@@ -44,18 +44,19 @@ class Process(Plugin, IndependentPlugin):
             "/sys/kernel/debug/sched/features"
         ])
 
-        procs = [p for p in self.listdir("/proc") if re.match("[0-9]", p)]
+        procs = self.get_process_table().pids
         if self.get_option("numprocs"):
             procs = procs[:self.get_option("numprocs")]
 
-        for proc in procs:
-            self.add_copy_spec([
-                f"/proc/{proc}/status",
-                f"/proc/{proc}/cpuset",
-                f"/proc/{proc}/oom_*",
-                f"/proc/{proc}/stack",
-                f"/proc/{proc}/limits",
-            ])
+        self.add_process_files([
+            "status",
+            "cpuset",
+            "oom_adj",
+            "oom_score",
+            "oom_score_adj",
+            "stack",
+            "limits",
+        ], pids=procs)
 
         if self.get_option("smaps"):
             self.add_copy_spec("/proc/[0-9]*/smaps")
@@ -99,8 +100,7 @@ class Process(Plugin, IndependentPlugin):
                 pfile.write('Package manager not configured for path queries')
                 return
             _ps = self.exec_cmd('ps --no-headers aex')
-            pidpkg = {}
-            paths = {}
+            pidpaths = {}
             if not _ps['status'] == 0:
                 pfile.write(f"Unable to get process list: {_ps['output']}")
                 return
@@ -110,9 +110,16 @@ class Process(Plugin, IndependentPlugin):
                 path = proc[4]
                 if not self.path_exists(path):
                     continue
-                if path not in paths:
-                    paths[path] = self.policy.package_manager.pkg_by_path(path)
-                pidpkg[pid] = {'path': path, 'package': paths[path]}
+                pidpaths[pid] = path
+            # resolve the packages of all paths at once, rather than with a
+            # package manager query for each
+            paths = self.policy.package_manager.pkgs_by_paths(
+                list(pidpaths.values())
+            )
+            pidpkg = {
+                pid: {'path': path, 'package': paths[path]}
+                for pid, path in pidpaths.items()
+            }
 
             pfile.write(json.dumps(pidpkg, indent=4))
 
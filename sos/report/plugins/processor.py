@@ -16,6 +16,7 @@ class Processor(Plugin, IndependentPlugin):
 
     plugin_name = 'processor'
     profiles = ('system', 'hardware', 'memory')
+    cost_hint = 10
     files = ('/proc/cpuinfo',)
     packages = ('cpufreq-utils', 'cpuid')
 
@@ -15,6 +15,7 @@ class Rpm(Plugin, RedHatPlugin):
 
     plugin_name = 'rpm'
     profiles = ('system', 'packagemanager')
+    cost_hint = 60
 
     option_list = [
         PluginOpt('rpmq', default=True,
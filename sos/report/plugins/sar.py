@@ -42,6 +42,7 @@ class Sar(Plugin):
 
     plugin_name = 'sar'
     profiles = ('system', 'performance')
+    cost_hint = 20
 
     packages = ('sysstat',)
     sa_path = '/var/log/sa'
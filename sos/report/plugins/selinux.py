@@ -15,6 +15,7 @@ class SELinux(Plugin, RedHatPlugin, UbuntuPlugin):
 
     plugin_name = 'selinux'
     profiles = ('container', 'system', 'security', 'openshift')
+    cost_hint = 20
 
     option_list = [
         PluginOpt('fixfiles', default=False,
@@ -17,6 +17,7 @@ class Systemd(Plugin, IndependentPlugin):
 
     plugin_name = "systemd"
     profiles = ('system', 'services', 'boot')
+    cost_hint = 10
 
     packages = ('systemd',)
     files = ('/run/systemd/system',)
@@ -0,0 +1,138 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Run-wide snapshot of the processes found under /proc for sos report """
+
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+# number of threads reading /proc in parallel
+PROC_WORKERS = 8
+
+
+class ProcessTable():
+    """A table of the processes running on the system, read from /proc once
+    per sos report execution, the first time it is queried, so that plugins
+    looking for processes do not each glob and read every
+    /proc/<pid>/cmdline again.
+
+    The name and command line of every process are read in parallel. The
+    table is indexed by name, and the result of each lookup by command line
+    is kept, as many plugins look for the same processes.
+
+    A process that starts after the table was read is not found in it.
+
+    :param proc_dir:    The path /proc is mounted at
+    :type proc_dir:     ``str``
+    """
+
+    def __init__(self, proc_dir='/proc'):
+        self.proc_dir = proc_dir
+        self._procs = None
+        self._names = {}
+        self._lookups = {}
+        self._lock = threading.Lock()
+
+    def _read_process(self, pid):
+        piddir = os.path.join(self.proc_dir, pid)
+        try:
+            with open(os.path.join(piddir, 'cmdline'), 'rb') as cfile:
+                cmdline = cfile.read()
+            with open(os.path.join(piddir, 'comm'), 'rb') as cfile:
+                name = cfile.read()
+        except OSError:
+            # the process exited while the table was being read
+            return None
+        return (name.decode('utf-8', 'ignore').strip(),
+                cmdline.decode('utf-8', 'ignore').strip())
+
+    def _load(self):
+        with self._lock:
+            if self._procs is not None:
+                return self._procs
+            try:
+                pids = [p for p in os.listdir(self.proc_dir) if p.isdigit()]
+            except OSError:
+                pids = []
+            procs = {}
+            with ThreadPoolExecutor(PROC_WORKERS) as pool:
+                for pid, proc in zip(pids, pool.map(self._read_process, pids,
+                                                    chunksize=64)):
+                    if proc is None:
+                        continue
+                    procs[pid] = proc
+                    self._names.setdefault(proc[0], []).append(pid)
+            self._procs = procs
+            return procs
+
+    @property
+    def pids(self):
+        """The PIDs of all processes in the table, in the order /proc lists
+        them
+        """
+        return list(self._load())
+
+    def get_cmdline(self, pid):
+        """Get the command line of a process, with its arguments separated by
+        NUL characters as in /proc/<pid>/cmdline
+
+        :param pid:     The PID of the process
+        :type pid:      ``str``
+
+        :returns:   The command line, or None if the process is not known
+        :rtype:     ``str``
+        """
+        proc = self._load().get(str(pid))
+        return proc[1] if proc else None
+
+    def get_pids_by_name(self, name):
+        """Get the PIDs of the processes with a given name, as found in
+        /proc/<pid>/comm
+
+        :param name:    The name of the processes
+        :type name:     ``str``
+
+        :returns:   The PIDs of the processes
+        :rtype:     ``list``
+        """
+        self._load()
+        return list(self._names.get(name, []))
+
+    def get_pids(self, process):
+        """Get the PIDs of the processes whose command line includes a given
+        string
+
+        :param process:     The string to look for
+        :type process:      ``str``
+
+        :returns:   The PIDs of the processes
+        :rtype:     ``list``
+        """
+        procs = self._load()
+        with self._lock:
+            pids = self._lookups.get(process)
+            if pids is None:
+                pids = self._lookups[process] = [
+                    pid for pid, proc in procs.items() if process in proc[1]
+                ]
+        return list(pids)
+
+    def check_process(self, process):
+        """Check if any process has a command line including a given string
+
+        :param process:     The string to look for
+        :type process:      ``str``
+
+        :returns:   True if such a process exists
+        :rtype:     ``bool``
+        """
+        return bool(self.get_pids(process))
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,126 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Cost-aware ordering of plugin execution for sos report """
+
+import json
+import logging
+import os
+
+from datetime import timedelta
+
+RUNTIME_HISTORY_PATH = '/var/lib/sos/plugin_runtimes.json'
+
+# weight given to the most recent run time when updating the history
+HISTORY_WEIGHT = 0.5
+
+
+class PluginScheduler():
+    """Orders plugins for collection so that the plugins expected to take the
+    longest are started first, instead of in alphabetical load order. This
+    keeps a long running plugin such as `logs` from being started last and
+    leaving every other collection thread idle while it finishes.
+
+    The expected run time of a plugin is taken from the run times recorded by
+    previous sos report executions on this host, and falls back to the
+    plugin's static ``cost_hint`` when there is no history for it.
+
+    :param path:    The file run time history is loaded from and saved to
+    :type path:     ``str``
+    """
+
+    def __init__(self, path=RUNTIME_HISTORY_PATH):
+        self.path = path
+        self.soslog = logging.getLogger('sos')
+        self.history = {}
+        self.load()
+
+    def load(self):
+        """Load run time history from disk. A missing or unreadable history
+        file is not an error, it simply means that cost hints will be used.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as hfile:
+                history = json.load(hfile)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as err:
+            self.soslog.debug(f"Unable to load plugin run time history from "
+                              f"{self.path}: {err}")
+            return
+        if not isinstance(history, dict):
+            return
+        for plugname, runtime in history.items():
+            if isinstance(runtime, (int, float)) and runtime >= 0:
+                self.history[plugname] = float(runtime)
+
+    def save(self):
+        """Write the current run time history to disk, replacing the previous
+        history file atomically
+        """
+        _tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(_tmp, 'w', encoding='utf-8') as hfile:
+                json.dump(self.history, hfile, indent=4, sort_keys=True)
+            os.replace(_tmp, self.path)
+        except OSError as err:
+            self.soslog.debug(f"Unable to save plugin run time history to "
+                              f"{self.path}: {err}")
+
+    def expected_run_time(self, plugname, plugin):
+        """Get the expected run time of a plugin, in seconds
+
+        :param plugname:    The name of the plugin
+        :type plugname:     ``str``
+
+        :param plugin:      The loaded plugin instance
+        :type plugin:       ``Plugin``
+
+        :returns:   The expected run time, and where it was taken from
+        :rtype:     ``tuple`` of (``float``, ``str``)
+        """
+        if plugname in self.history:
+            return self.history[plugname], 'history'
+        return float(getattr(plugin, 'cost_hint', 0) or 0), 'hint'
+
+    def order(self, plugins):
+        """Order plugins longest-expected-first. Plugins with the same
+        expected run time keep their relative load order.
+
+        :param plugins: The plugins to order
+        :type plugins:  ``list`` of (``str``, ``Plugin``) tuples
+
+        :returns:   The plugins in the order they should be started
+        :rtype:     ``list`` of (``str``, ``Plugin``) tuples
+        """
+        return sorted(
+            plugins,
+            key=lambda p: self.expected_run_time(p[0], p[1])[0],
+            reverse=True
+        )
+
+    def record(self, plugname, run_time):
+        """Record the run time of a plugin from the current execution
+
+        :param plugname:    The name of the plugin
+        :type plugname:     ``str``
+
+        :param run_time:    How long the plugin took to collect
+        :type run_time:     ``timedelta`` or ``float``
+        """
+        if isinstance(run_time, timedelta):
+            run_time = run_time.total_seconds()
+        if not isinstance(run_time, (int, float)) or run_time < 0:
+            return
+        if plugname in self.history:
+            run_time = (HISTORY_WEIGHT * run_time +
+                        (1 - HISTORY_WEIGHT) * self.history[plugname])
+        self.history[plugname] = round(run_time, 3)
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,144 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Timeline tracing of sos report executions """
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+class Tracer():
+    """Records the time spent in each phase of a sos report execution as
+    spans on a timeline, and writes them in the Trace Event Format that is
+    read by chrome://tracing and Perfetto.
+
+    Each span is recorded against the thread it ran in, so that idle worker
+    threads and the plugins on the critical path of an execution can be
+    spotted at a glance.
+
+    When no trace file is given, the tracer is disabled and records nothing.
+
+    :param path:    The file the trace is written to
+    :type path:     ``str``
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = bool(path)
+        self.events = []
+        self.soslog = logging.getLogger('sos')
+        self._threads = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def now():
+        """Get the current time, on the clock spans are recorded with
+
+        :returns:   Seconds since an arbitrary point in time
+        :rtype:     ``float``
+        """
+        return time.perf_counter()
+
+    def add_span(self, name, start, end, cat='sos', args=None):
+        """Record a span that ran in the current thread
+
+        :param name:    The name of the span
+        :type name:     ``str``
+
+        :param start:   When the span started, as returned by ``now()``
+        :type start:    ``float``
+
+        :param end:     When the span ended, as returned by ``now()``
+        :type end:      ``float``
+
+        :param cat:     The category of the span, e.g. the plugin it belongs
+                        to
+        :type cat:      ``str``
+
+        :param args:    Additional details to show for the span
+        :type args:     ``dict``
+        """
+        if not self.enabled:
+            return
+        tid = threading.get_ident()
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': round(start * 1000000, 3),
+            'dur': round((end - start) * 1000000, 3),
+            'pid': self._pid,
+            'tid': tid
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            if tid not in self._threads:
+                self._threads[tid] = threading.current_thread().name
+            self.events.append(event)
+
+    def span(self, name, cat='sos', **args):
+        """Get a context manager that records a span for the time spent in
+        its context
+
+        :param name:    The name of the span
+        :type name:     ``str``
+
+        :param cat:     The category of the span
+        :type cat:      ``str``
+
+        Any other keyword argument is shown as a detail of the span.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._span(name, cat, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, cat, args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, self.now(), cat, args)
+
+    def get_trace(self):
+        """Get the trace recorded so far
+
+        :returns:   The trace, in the JSON object format of the Trace Event
+                    Format
+        :rtype:     ``dict``
+        """
+        with self._lock:
+            events = [{
+                'name': 'process_name', 'ph': 'M', 'pid': self._pid,
+                'args': {'name': 'sos report'}
+            }]
+            events.extend({
+                'name': 'thread_name', 'ph': 'M', 'pid': self._pid,
+                'tid': tid, 'args': {'name': tname}
+            } for tid, tname in self._threads.items())
+            events.extend(self.events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self):
+        """Write the trace recorded so far to the trace file
+        """
+        if not self.enabled:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as tfile:
+                json.dump(self.get_trace(), tfile)
+        except (OSError, TypeError, ValueError) as err:
+            self.soslog.error(f"Unable to write trace to {self.path}: {err}")
+
+# vim: set et ts=4 sw=4 :
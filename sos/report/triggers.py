@@ -0,0 +1,145 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+
+""" Shared resolution of plugin enablement triggers for sos report """
+
+import fnmatch
+import os
+
+from sos.utilities import path_exists
+
+
+class TriggerResolver():
+    """Resolves the triggers plugins use to decide if they are enabled, i.e.
+    the files, packages, commands, kernel modules, services and containers
+    listed by their class attributes, for all plugins of a sos report
+    execution at once.
+
+    Every unique trigger is resolved only the first time any plugin asks
+    about it, and the answer is reused for every other plugin. Packages,
+    commands and kernel modules are resolved against indices that are built
+    once, instead of scanning the package list, every directory in ``PATH``
+    or the list of loaded modules for each lookup.
+
+    The resolver is only meant to be used while plugins are being loaded,
+    and stops answering once ``close()`` is called so that later checks made
+    by plugins see the current state of the system.
+
+    :param policy:  The loaded policy
+    :type policy:   ``Policy``
+
+    :param sysroot: The system root directory triggers are resolved in
+    :type sysroot:  ``str``
+    """
+
+    def __init__(self, policy, sysroot):
+        self.policy = policy
+        self.sysroot = sysroot
+        self.active = True
+        self._results = {}
+        self._path_dirs = None
+        self._packages = None
+        self._kernel_mods = None
+
+    def close(self):
+        """Stop resolving triggers and drop everything resolved so far
+        """
+        self.active = False
+        self._results = {}
+        self._path_dirs = None
+        self._packages = None
+        self._kernel_mods = None
+
+    def _resolve(self, kind, value, func):
+        key = (kind, value)
+        if key not in self._results:
+            self._results[key] = bool(func(value))
+        return self._results[key]
+
+    def _get_path_dirs(self):
+        """Build an index of the entries of every directory in ``PATH``, both
+        on the host and under the sysroot, as is searched by
+        ``is_executable()``
+        """
+        if self._path_dirs is None:
+            self._path_dirs = []
+            dirs = os.environ.get("PATH", "").split(os.path.pathsep)
+            if self.sysroot:
+                dirs += [
+                    os.path.join(self.sysroot, d.lstrip('/')) for d in dirs
+                ]
+            for pdir in dirs:
+                try:
+                    self._path_dirs.append((pdir, set(os.listdir(pdir))))
+                except OSError:
+                    continue
+        return self._path_dirs
+
+    def _is_executable(self, command):
+        candidates = [command]
+        if self.sysroot:
+            candidates.append(os.path.join(self.sysroot, command.lstrip('/')))
+        if any(os.access(path, os.X_OK) for path in candidates):
+            return True
+        if os.path.sep in command:
+            return any(
+                os.access(os.path.join(pdir, command), os.X_OK)
+                for pdir, _ in self._get_path_dirs()
+            )
+        return any(
+            os.access(os.path.join(pdir, command), os.X_OK)
+            for pdir, entries in self._get_path_dirs() if command in entries
+        )
+
+    def _is_installed(self, package):
+        if self._packages is None:
+            self._packages = set(self.policy.package_manager.packages)
+        if any(c in package for c in '*?['):
+            return bool(fnmatch.filter(self._packages, package))
+        return package in self._packages
+
+    def _is_module_loaded(self, module):
+        if self._kernel_mods is None:
+            self._kernel_mods = set(self.policy.kernel_mods)
+        return module in self._kernel_mods
+
+    def path_exists(self, path):
+        """Does `path` exist under the sysroot
+        """
+        return self._resolve(
+            'path', path, lambda p: path_exists(p, self.sysroot)
+        )
+
+    def is_installed(self, package):
+        """Is a package matching `package` installed
+        """
+        return self._resolve('package', package, self._is_installed)
+
+    def is_executable(self, command):
+        """Is `command` an executable on the ``PATH``
+        """
+        return self._resolve('command', command, self._is_executable)
+
+    def is_module_loaded(self, module):
+        """Is the kernel module `module` loaded
+        """
+        return self._resolve('kmod', module, self._is_module_loaded)
+
+    def is_service(self, service):
+        """Does the service `service` exist
+        """
+        return self._resolve('service', service,
+                             self.policy.init_system.is_service)
+
+    def container_exists(self, container, func):
+        """Does the container `container` exist, as checked by `func` the
+        first time it is asked about
+        """
+        return self._resolve('container', container, func)
+
+# vim: set et ts=4 sw=4 :
@@ -10,7 +10,9 @@ import os
 import pwd
 import re
 import inspect
-from subprocess import Popen, PIPE, STDOUT
+import selectors
+import signal
+from subprocess import Popen, PIPE, STDOUT, DEVNULL
 import logging
 import fnmatch
 import errno
@@ -23,6 +25,9 @@ import io
 from contextlib import closing
 from collections import deque
 
+from sos.forkserver import (ForkServer, ForkServerError, ForkServerProcess,
+                            CLONE_NEWNET, enter_netns, setns, wait_child)
+
 try:
     from packaging.version import parse as parse_version
 except ImportError:
@@ -48,16 +53,30 @@ recommended to install proper python3-magic package with the module.
 
 TIMEOUT_DEFAULT = 300
 
+# seconds between calls to the poller of a running command
+POLLER_INTERVAL = 0.1
+
+# seconds a timed out command is given to exit after SIGTERM before SIGKILL
+KILL_GRACE = 5
+
+# where `ip netns` keeps the named network namespaces, and their own
+# configuration files
+NETNS_RUN_DIR = '/run/netns'
+NETNS_ETC_DIR = '/etc/netns'
+
 __all__ = [
     'TIMEOUT_DEFAULT',
     'ImporterHelper',
     'SoSTimeoutError',
+    'TailBuffer',
     'TempFileUtil',
     'bold',
     'file_is_binary',
     'fileobj',
     'find',
     'get_human_readable',
+    'get_netns_devices',
+    'get_netns_path',
     'grep',
     'import_module',
     'is_executable',
@@ -210,19 +229,165 @@ def is_executable(command, sysroot=None):
     return any(os.access(path, os.X_OK) for path in candidates)
 
 
+def _peek_child(proc):
+    """Check if a child process has exited without reaping it, so that its
+    resource usage can still be collected by ``_reap_child()``
+
+    :param proc:    The child process
+    :type proc:     ``subprocess.Popen``
+
+    :returns:   The exit code of the process, or ``None`` if it is running
+    :rtype:     ``int`` or ``None``
+    """
+    if proc.returncode is not None or isinstance(proc, ForkServerProcess):
+        return proc.returncode
+    try:
+        info = os.waitid(os.P_PID, proc.pid,
+                         os.WEXITED | os.WNOHANG | os.WNOWAIT)
+    except ChildProcessError:
+        return proc.poll()
+    if info is None:
+        return None
+    if info.si_code == os.CLD_EXITED:
+        return info.si_status
+    return -info.si_status
+
+
+def _reap_child(proc):
+    """Wait for a child process to exit, then reap it and collect its
+    resource usage, including that of its reaped descendants
+
+    :param proc:    The child process
+    :type proc:     ``subprocess.Popen``
+
+    :returns:   The user and system CPU seconds, maximum resident set size in
+                KiB and bytes read from and written to storage by the
+                process, or ``None`` if it was already reaped
+    :rtype:     ``dict`` or ``None``
+    """
+    if isinstance(proc, ForkServerProcess):
+        # reaped by the fork server, which reports the usage
+        proc.wait()
+        return proc.rusage
+    if proc.returncode is not None:
+        return None
+    try:
+        _, proc.returncode, usage = wait_child(proc.pid)
+    except ChildProcessError:
+        proc.wait()
+        return None
+    return usage
+
+
+def _spawn_command(args, env, stdout, stderr, preexec_fn, chroot=None,
+                   cwd=None, runas=None, setpgid=True, netns=None):
+    """Start a command, through the fork server when it is running so that
+    sos does not need to fork itself, or else as a child of sos.
+
+    :returns:   The process of the command
+    :rtype:     ``ForkServerProcess`` or ``subprocess.Popen``
+    """
+    server = ForkServer.get()
+    if server is not None:
+        out_r = None
+        if stdout == PIPE:
+            out_r, out_w = os.pipe()
+        else:
+            out_w = stdout.fileno()
+        err_fd = out_w if stderr else os.open(os.devnull, os.O_WRONLY)
+        proc = None
+        try:
+            proc = server.spawn(args, env, out_w, err_fd, chroot=chroot,
+                                cwd=cwd, runas=runas, setpgid=setpgid,
+                                netns=netns)
+        except ForkServerError as err:
+            log.debug(f"Unable to use fork server: {err}")
+        finally:
+            if out_r is not None:
+                os.close(out_w)
+            if not stderr:
+                os.close(err_fd)
+            if out_r is not None and proc is None:
+                os.close(out_r)
+        if proc is not None:
+            if out_r is not None:
+                proc.stdout = os.fdopen(out_r, 'rb')
+            return proc
+    # pylint: disable=consider-using-with
+    return Popen(args, shell=False, stdout=stdout,
+                 stderr=STDOUT if stderr else DEVNULL, bufsize=-1, env=env,
+                 close_fds=True, preexec_fn=preexec_fn)
+
+
+def _kill_command(proc, job, group):
+    """Terminate a command, then kill it if it has not exited after
+    ``KILL_GRACE`` seconds
+
+    :param proc:    The process of the command
+    :type proc:     ``subprocess.Popen``
+
+    :param job:     The state of the command in the ``CommandReactor``
+    :type job:      ``_ReactorJob``
+
+    :param group:   Signal the process group the command leads, which
+                    includes any process it started, instead of only the
+                    command itself
+    :type group:    ``bool``
+    """
+    def _signal(sig):
+        try:
+            if group:
+                os.killpg(proc.pid, sig)
+            else:
+                os.kill(proc.pid, sig)
+        except OSError:
+            # the command and all its processes are already gone
+            pass
+
+    _signal(signal.SIGTERM)
+    if not job.done.wait(KILL_GRACE):
+        _signal(signal.SIGKILL)
+
+
 def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                            chroot=None, chdir=None, env=None, foreground=False,
                            binary=False, sizelimit=None, poller=None,
-                           to_file=False, runas=None):
-    # pylint: disable=too-many-locals,too-many-branches
+                           to_file=False, runas=None, watchdog=None,
+                           netns=None):
+    # pylint: disable=too-many-locals,too-many-branches,too-many-statements
     """Execute a command and return a dictionary of status and output,
     optionally changing root or current working directory before
     executing command.
+
+    If the command does not finish within `timeout` seconds, it is sent
+    SIGTERM, followed by SIGKILL if it is still running ``KILL_GRACE``
+    seconds later, and the output collected until then is returned with a
+    status of 124 and `timed_out` set. Unless `foreground` is set, the command
+    is run in its own process group, and any process it started is signalled
+    along with it.
+
+    If `watchdog` is set, it is called with the process of the command every
+    ``POLLER_INTERVAL`` seconds, and the command is killed the same way if it
+    returns a reason for it to be, which is returned as `hung` with a status
+    of 124. A command that does not exit even after SIGKILL is not waited
+    for.
+
+    If `to_file` is set, the output is written to that file instead of being
+    returned. When a `sizelimit` is also set, the output is streamed to the
+    file, which ends up holding only the last `sizelimit` MB of it. The file
+    is removed again if the command is not found or cannot be run.
+
+    If `netns` is set, the command is run in the network namespace at that
+    path, which its process enters right before it is executed.
     """
     # Change root or cwd for child only. Exceptions in the prexec_fn
     # closure are caught in the parent (chroot and chdir are bound from
     # the enclosing scope).
     def _child_prep_fn():
+        if not foreground:
+            os.setpgid(0, 0)
+        if netns:
+            enter_netns(netns)
         if chroot and chroot != '/':
             os.chroot(chroot)
         if runas:
@@ -232,12 +397,6 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
         if chdir:
             os.chdir(chdir)
 
-    def _check_poller(proc):
-        if poller() or proc.poll() == 124:
-            proc.terminate()
-            raise SoSTimeoutError
-        time.sleep(0.01)
-
     if runas:
         pwd_user = pwd.getpwnam(runas)
         env.update({
@@ -257,11 +416,6 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                 cmd_env[key] = value
             else:
                 cmd_env.pop(key, None)
-    # use /usr/bin/timeout to implement a timeout
-    if timeout and is_executable("timeout"):
-        command = (f"timeout {'--foreground' if foreground else ''} {timeout}s"
-                   f" {command}")
-
     args = shlex.split(command)
     # Expand arguments that are wildcard root paths.
     expanded_args = []
@@ -274,61 +428,96 @@ def sos_get_command_output(command, timeout=TIMEOUT_DEFAULT, stderr=False,
                 expanded_args.append(arg)
         else:
             expanded_args.append(arg)
-    if to_file:
+    sink = None
+    if to_file and sizelimit:
+        # stream the output to the file through a ring kept in the file, so
+        # that only its tail is kept without holding it in memory
+        # pylint: disable=consider-using-with
+        sink = open(to_file, 'w+b')
+        _output = PIPE
+    elif to_file:
         # pylint: disable=consider-using-with
         _output = open(to_file, 'w', encoding='utf-8')
     else:
         _output = PIPE
     try:
-        with Popen(expanded_args, shell=False, stdout=_output,
-                   stderr=STDOUT if stderr else PIPE,
-                   bufsize=-1, env=cmd_env, close_fds=True,
-                   preexec_fn=_child_prep_fn) as p:
-
-            if not to_file:
-                reader = AsyncReader(p.stdout, sizelimit, binary)
-            else:
-                reader = FakeReader(p, binary)
-
-            if poller:
-                while reader.running:
-                    _check_poller(p)
-            else:
-                try:
-                    # override timeout=0 to timeout=None, as Popen will treat
-                    # the former as a literal 0-second timeout
-                    p.wait(timeout if timeout else None)
-                except Exception:
-                    p.terminate()
-                    if to_file:
-                        _output.close()
-                    # until we separate timeouts from the `timeout` command
-                    # handle per-cmd timeouts via Plugin status checks
-                    reader.running = False
-                    return {'status': 124, 'output': reader.get_contents(),
-                            'truncated': reader.is_full}
-            if to_file:
+        p = _spawn_command(expanded_args, cmd_env, _output, stderr,
+                           _child_prep_fn, chroot=chroot, cwd=chdir,
+                           runas=runas, setpgid=not foreground,
+                           netns=netns)
+
+        reactor = CommandReactor.get()
+        job = reactor.add(p, p.stdout if _output == PIPE else None,
+                          sizelimit, binary, sink)
+        deadline = time.monotonic() + timeout if timeout else None
+        timed_out = False
+        hung = None
+        rusage = None
+        try:
+            while not job.done.is_set():
+                wait = POLLER_INTERVAL if poller or watchdog else None
+                if deadline:
+                    remaining = max(deadline - time.monotonic(), 0)
+                    wait = min(wait or remaining, remaining)
+                if job.done.wait(wait):
+                    break
+                if poller and poller():
+                    _kill_command(p, job, not foreground)
+                    raise SoSTimeoutError
+                if watchdog:
+                    hung = watchdog(p)
+                    if hung:
+                        _kill_command(p, job, not foreground)
+                        break
+                if deadline and time.monotonic() >= deadline:
+                    _kill_command(p, job, not foreground)
+                    timed_out = True
+                    break
+        finally:
+            # the pipe must not be closed while the reactor watches it
+            reactor.discard(job)
+            if sink:
+                job.get_contents()
+                sink.close()
+            elif to_file:
                 _output.close()
-
-            # wait for Popen to set the returncode
-            while p.poll() is None:
-                pass
-
-            if p.returncode in (126, 127):
-                stdout = b""
+            if p.stdout:
+                p.stdout.close()
+            if job.done.is_set() or _peek_child(p) is not None:
+                # reap the command, which also sets the returncode
+                rusage = _reap_child(p)
             else:
-                stdout = reader.get_contents()
-
-            return {
-                'status': p.returncode,
-                'output': stdout,
-                'truncated': reader.is_full
-            }
+                # the command survived SIGKILL, e.g. as it is blocked on I/O
+                # in the kernel, so reap it whenever it exits instead of
+                # holding up sos until then
+                threading.Thread(target=_reap_child, args=(p,), daemon=True,
+                                 name=f"sos-reap-{p.pid}").start()
+
+        if p.returncode in (126, 127) and not timed_out:
+            stdout = b""
+            if to_file:
+                os.unlink(to_file)
+        else:
+            stdout = job.get_contents()
+
+        return {
+            'status': 124 if timed_out or hung else p.returncode,
+            'output': stdout,
+            'truncated': job.is_full,
+            'timed_out': timed_out,
+            'hung': hung,
+            'rusage': rusage
+        }
     except OSError as e:
-        if to_file:
+        if sink:
+            sink.close()
+        elif to_file:
             _output.close()
+        if to_file:
+            os.unlink(to_file)
         if e.errno == errno.ENOENT:
-            return {'status': 127, 'output': "", 'truncated': ''}
+            return {'status': 127, 'output': b"", 'truncated': '',
+                    'timed_out': False, 'hung': None, 'rusage': None}
         raise e
 
 
@@ -361,6 +550,59 @@ def shell_out(cmd, timeout=30, chroot=None, runat=None):
                                   chroot=chroot, chdir=runat)['output']
 
 
+def get_netns_path(namespace):
+    """Get the path of a named network namespace that commands can be run in
+    by entering it directly, rather than through ``ip netns exec``.
+
+    ``ip netns exec`` also bind mounts the files under /etc/netns/<namespace>
+    over those of /etc for the command it runs, so a namespace that has such
+    files is not entered directly.
+
+    :param namespace:   The name of the network namespace
+    :type namespace:    ``str``
+
+    :returns:   The path of the namespace, or None if it cannot be entered
+                directly
+    :rtype:     ``str`` or ``None``
+    """
+    if not namespace or '/' in namespace or namespace in ('.', '..'):
+        return None
+    path = os.path.join(NETNS_RUN_DIR, namespace)
+    if not os.path.exists(path) or \
+            os.path.exists(os.path.join(NETNS_ETC_DIR, namespace)):
+        return None
+    return path
+
+
+def get_netns_devices(netns):
+    """Get the names of the network devices of a network namespace, read
+    from within the namespace by the calling thread, which is moved back to
+    its own namespace afterwards
+
+    :param netns:   The path of the network namespace
+    :type netns:    ``str``
+
+    :returns:   The names of the network devices in the namespace
+    :rtype:     ``list``
+
+    :raises:    ``OSError`` if the namespace could not be entered
+    """
+    own_ns = os.open('/proc/thread-self/ns/net', os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        enter_netns(netns)
+        try:
+            # /proc/net follows the namespace of the thread reading it, unlike
+            # /sys/class/net which follows that of the mount of /sys
+            with open('/proc/thread-self/net/dev', 'r',
+                      encoding='utf-8') as devfile:
+                lines = devfile.readlines()[2:]
+        finally:
+            setns(own_ns, CLONE_NEWNET)
+    finally:
+        os.close(own_ns)
+    return [line.partition(':')[0].strip() for line in lines]
+
+
 def get_human_readable(size, precision=2):
     # Credit to Pavan Gupta https://stackoverflow.com/questions/5194057/
     suffixes = ['B', 'KiB', 'MiB', 'GiB', 'TiB']
@@ -474,86 +716,327 @@ def recursive_dict_values_by_key(dobj, keys=[]):
     return [d for d in _items if d not in _filt]
 
 
-class FakeReader():
-    """Used as a replacement AsyncReader for when we are writing directly to
-    disk, and allows us to keep more simplified flows for executing,
-    monitoring, and collecting command output.
-    """
+class TailBuffer():
+    """A buffer that keeps, byte for byte, the last `size` bytes written to
+    it, as a ring that is held in memory or, when `fileobj` is given, in that
+    file so that output is spilled to disk instead of being kept in memory.
 
-    def __init__(self, process, binary):
-        self.process = process
-        self.binary = binary
+    Without a `size`, everything written to the buffer is kept.
 
-    @property
-    def is_full(self):
-        return False
+    :param size:    The number of bytes to keep
+    :type size:     ``int``
 
-    def get_contents(self):
-        return '' if not self.binary else b''
+    :param fileobj: The file to keep the buffer in, opened for both reading
+                    and writing
+    :type fileobj:  A binary file object
+    """
+
+    def __init__(self, size=None, fileobj=None):
+        self.size = size or None
+        self.fileobj = fileobj
+        self.written = 0
+        self._buf = bytearray()
+        # where the next byte is stored, which is also where the oldest byte
+        # is once the ring has wrapped
+        self._pos = 0
 
     @property
-    def running(self):
-        return self.process.poll() is None
+    def truncated(self):
+        """Was some of the data written to the buffer dropped"""
+        return bool(self.size) and self.written > self.size
+
+    def _store(self, offset, data):
+        if self.fileobj is None:
+            self._buf[offset:offset + len(data)] = data
+            return
+        while data:
+            count = os.pwrite(self.fileobj.fileno(), data, offset)
+            data = data[count:]
+            offset += count
+
+    def write(self, data):
+        """Add data to the buffer, dropping the oldest data it holds if it
+        would otherwise grow over its size
+        """
+        data = memoryview(data)
+        self.written += len(data)
+        if not self.size:
+            self._store(self._pos, data)
+            self._pos += len(data)
+            return
+        if len(data) > self.size:
+            skip = len(data) - self.size
+            self._pos = (self._pos + skip) % self.size
+            data = data[skip:]
+        while data:
+            count = min(len(data), self.size - self._pos)
+            self._store(self._pos, data[:count])
+            self._pos = (self._pos + count) % self.size
+            data = data[count:]
+
+    def _rotate_file(self):
+        path = self.fileobj.name
+        fd = self.fileobj.fileno()
+        with open(f"{path}.tail", 'wb') as tfile:
+            for start, end in ((self._pos, self.size), (0, self._pos)):
+                while start < end:
+                    data = os.pread(fd, min(end - start, 1048576), start)
+                    if not data:
+                        break
+                    tfile.write(data)
+                    start += len(data)
+        os.replace(f"{path}.tail", path)
+
+    def getvalue(self):
+        """Put the contents of the buffer back in the order they were written
+        in, oldest first, once all data was written to the buffer. For a
+        buffer held in memory, the contents are returned as a ``bytearray``
+        without being copied.
+        """
+        if self.truncated and self._pos:
+            if self.fileobj is not None:
+                self._rotate_file()
+            else:
+                head = self._buf[:self._pos]
+                del self._buf[:self._pos]
+                self._buf += head
+            self._pos = 0
+        return self._buf
 
 
-class AsyncReader(threading.Thread):
-    """Used to limit command output to a given size without deadlocking
-    sos.
+class _ReactorJob():
+    """The state of a command monitored by a ``CommandReactor``, which
+    compiles the output of the command into a ``TailBuffer`` that is limited
+    to a given size, keeping the most recent output.
 
-    Takes a sizelimit value in MB, and will compile stdout from Popen into a
-    string that is limited to the given sizelimit.
+    Takes a sizelimit value in MB. If `sink` is given, the output is streamed
+    to that file instead of being kept in memory.
     """
 
-    def __init__(self, channel, sizelimit, binary):
-        super().__init__()
+    def __init__(self, proc, channel, sizelimit, binary, sink=None):
+        self.proc = proc
         self.chan = channel
         self.binary = binary
-        self.chunksize = 2048
-        self.slots = None
-        if sizelimit:
-            sizelimit = sizelimit * 1048576  # convert to bytes
-            self.slots = int(sizelimit / self.chunksize)
-        self.deque = deque(maxlen=self.slots)
-        self.running = True
-        self.start()
-
-    def run(self):
-        """Reads from the channel (pipe) that is the output pipe for a
-        called Popen. As we are reading from the pipe, the output is added
-        to a deque. After the size of the deque exceeds the sizelimit
-        earlier (older) entries are removed.
-
-        This means the returned output is chunksize-sensitive, but is not
-        really byte-sensitive.
-        """
-        try:
-            while True:
-                line = self.chan.read(self.chunksize)
-                if not line:
-                    # Pipe can remain open after output has completed
-                    break
-                self.deque.append(line)
-        except (ValueError, IOError):
-            # pipe has closed, meaning command output is done
-            pass
-        self.running = False
+        self.buffer = TailBuffer(
+            sizelimit * 1048576 if sizelimit else None, sink
+        )
+        self.pidfd = None
+        self.output_done = channel is None
+        self.exited = False
+        self.closed = False
+        # set once the command has exited and all its output has been read
+        self.done = threading.Event()
+        # set once the reactor no longer watches the command
+        self.released = threading.Event()
+
+    def feed(self, data):
+        """Add output of the command to the buffer"""
+        self.buffer.write(data)
 
     def get_contents(self):
-        """Returns the contents of the deque as a string"""
-        # block until command completes or timesout (separate from the plugin
-        # hitting a timeout)
-        while self.running:
-            time.sleep(0.01)
+        """Returns the buffered output as a string, or as bytes for binary
+        output, or empty if the output was streamed to a file. Must not be
+        called while the reactor still reads output for the command.
+        """
+        contents = self.buffer.getvalue()
+        if self.buffer.fileobj is not None:
+            contents = bytearray()
         if not self.binary:
-            return ''.join(ln.decode('utf-8', 'ignore') for ln in self.deque)
-        return b''.join(ln for ln in self.deque)
+            return contents.decode('utf-8', 'ignore')
+        return bytes(contents)
 
     @property
     def is_full(self):
-        """Checks if the deque is full, implying that output was truncated"""
-        if not self.slots:
-            return False
-        return len(self.deque) == self.slots
+        """Checks if the buffer is full, implying that output was truncated"""
+        return self.buffer.truncated
+
+
+class CommandReactor():
+    """Monitors every command run by sos from a single thread, instead of
+    using a reader thread per command and polling each command for its exit.
+
+    The output of all running commands is multiplexed with a selector, and
+    the exit of each command is delivered by the fork server that spawned it,
+    or through a pidfd where the kernel supports it. Otherwise, the exit
+    status of the remaining commands is checked without reaping them every
+    ``POLLER_INTERVAL`` seconds.
+
+    Use ``CommandReactor.get()`` to get the shared instance, which is started
+    the first time it is needed.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._requests = deque()
+        self._polled = set()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='sos-reactor')
+        self._thread.start()
+
+    @classmethod
+    def get(cls):
+        """Get the shared reactor, starting it if needed
+
+        :returns: The reactor
+        :rtype: ``CommandReactor``
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _wake(self):
+        try:
+            os.write(self._wake_w, b'\0')
+        except BlockingIOError:
+            # the reactor already has a pending wake up
+            pass
+
+    def add(self, proc, channel, sizelimit, binary, sink=None):
+        """Start monitoring a command
+
+        :param proc:        The process of the command
+        :type proc:         ``subprocess.Popen``
+
+        :param channel:     The pipe the output of the command is read from,
+                            or ``None`` if it is not read
+        :type channel:      A file object
+
+        :param sizelimit:   The size in MB of the output to keep
+        :type sizelimit:    ``int``
+
+        :param binary:      Is the output of the command binary
+        :type binary:       ``bool``
+
+        :param sink:        The file the output is streamed to instead of
+                            being kept in memory
+        :type sink:         A binary file object
+
+        :returns: The state of the monitored command
+        :rtype: ``_ReactorJob``
+        """
+        job = _ReactorJob(proc, channel, sizelimit, binary, sink)
+        self._requests.append(('add', job))
+        self._wake()
+        return job
+
+    def _notify_exit(self, job):
+        self._requests.append(('exited', job))
+        self._wake()
+
+    def discard(self, job):
+        """Stop monitoring a command, and wait until the reactor no longer
+        watches its pipe, after which the pipe can safely be closed
+
+        :param job: The state of the monitored command, as returned by
+                    ``add()``
+        :type job:  ``_ReactorJob``
+        """
+        if job.released.is_set():
+            return
+        self._requests.append(('discard', job))
+        self._wake()
+        job.released.wait()
+
+    def _run(self):
+        while True:
+            timeout = POLLER_INTERVAL if self._polled else None
+            for key, _ in self._selector.select(timeout):
+                try:
+                    if key.fileobj == self._wake_r:
+                        self._handle_requests()
+                    elif key.data[0] == 'output':
+                        self._read(key.data[1])
+                    else:
+                        self._set_exited(key.data[1])
+                except Exception as err:
+                    log.error(f"Error while monitoring commands: {err}")
+            for job in list(self._polled):
+                if _peek_child(job.proc) is not None:
+                    self._set_exited(job)
+
+    def _handle_requests(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._requests:
+            action, job = self._requests.popleft()
+            if action == 'add':
+                self._watch(job)
+            elif action == 'exited':
+                if not job.closed:
+                    self._set_exited(job)
+            else:
+                self._release(job)
+
+    def _watch(self, job):
+        if job.closed:
+            return
+        if job.chan is not None:
+            os.set_blocking(job.chan.fileno(), False)
+            self._selector.register(job.chan.fileno(), selectors.EVENT_READ,
+                                    ('output', job))
+        if isinstance(job.proc, ForkServerProcess):
+            job.proc.add_exit_callback(lambda: self._notify_exit(job))
+            return
+        try:
+            job.pidfd = os.pidfd_open(job.proc.pid)
+            self._selector.register(job.pidfd, selectors.EVENT_READ,
+                                    ('exit', job))
+        except (AttributeError, OSError):
+            job.pidfd = None
+            self._polled.add(job)
+
+    def _read(self, job):
+        try:
+            data = os.read(job.chan.fileno(), 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if data:
+            job.feed(data)
+            return
+        # the pipe was closed by the command, so all output has been read
+        self._selector.unregister(job.chan.fileno())
+        job.output_done = True
+        self._check_done(job)
+
+    def _set_exited(self, job):
+        if job.pidfd is not None:
+            self._selector.unregister(job.pidfd)
+            os.close(job.pidfd)
+            job.pidfd = None
+        self._polled.discard(job)
+        job.exited = True
+        self._check_done(job)
+
+    def _check_done(self, job):
+        if job.output_done and job.exited:
+            job.closed = True
+            job.done.set()
+            job.released.set()
+
+    def _release(self, job):
+        if not job.closed:
+            job.closed = True
+            if job.chan is not None and not job.output_done:
+                self._selector.unregister(job.chan.fileno())
+            if job.pidfd is not None:
+                self._selector.unregister(job.pidfd)
+                os.close(job.pidfd)
+                job.pidfd = None
+            self._polled.discard(job)
+        job.released.set()
 
 
 class ImporterHelper:
@@ -6,12 +6,21 @@
 #
 # See the LICENSE file in the source distribution for further information.
 import unittest
+import gzip
+import hashlib
+import lzma
 import os
+import re
 import tarfile
 import tempfile
+import time
 import shutil
 
-from sos.archive import TarFileArchive
+from unittest.mock import patch
+
+from sos import archive
+from sos.archive import (TarFileArchive, EstimateArchive, BlockCompressor,
+                         HashingWriter, ArchiveIndexReader, P_FILE)
 from sos.utilities import tail
 from sos.policies import Policy
 
@@ -41,6 +50,12 @@ class TarFileArchiveTest(unittest.TestCase):
 
         self.check_for_file('test/tests/unittests/ziptest')
 
+    def test_add_file_missing(self):
+        self.tf.add_file('tests/unittests/nonexistent')
+        self.assertFalse(os.path.exists(
+            self.tf.dest_path('tests/unittests/nonexistent')
+        ))
+
     def test_add_node_dev_null(self):
         st = os.lstat('/dev/null')
         dev_maj = os.major(st.st_rdev)
@@ -103,6 +118,19 @@ class TarFileArchiveTest(unittest.TestCase):
         afp = self.tf.open_file('tests/string_test.txt')
         self.assertEqual('this is my new content', afp.read())
 
+    def test_file_subs(self):
+        self.tf.add_string('Password=secret\nuser=admin\n',
+                           'tests/string_test.txt')
+        counts = self.tf.do_file_subs('tests/string_test.txt', [
+            (r'(password=).*', r'\1********', re.I),
+            (r'admin', 'someone', 0),
+            (r'nomatch', 'x', 0)
+        ])
+        self.assertEqual(counts, [1, 1, 0])
+
+        afp = self.tf.open_file('tests/string_test.txt')
+        self.assertEqual('Password=********\nuser=someone\n', afp.read())
+
     def test_make_link(self):
         self.tf.add_file('tests/ziptest')
         self.tf.add_link('tests/ziptest', 'link_name')
@@ -113,6 +141,264 @@ class TarFileArchiveTest(unittest.TestCase):
     def test_compress(self):
         self.tf.finalize("auto")
 
+    def test_stream(self):
+        self.tf.makedirs('sos_commands/foo')
+        self.tf.add_string('foo output', 'sos_commands/foo/foo_-a')
+        self.tf.add_string('ps output', 'sos_commands/foo/ps_aux')
+        self.tf.add_link('foo_-a', 'sos_commands/foo/foo')
+        self.tf.start_stream('auto', hold=['sos_commands/foo/ps_*'])
+        self.tf.stream_dir('sos_commands/foo')
+        self.tf.add_string('version', 'version.txt')
+        # streamed content is removed from the cache, held content is not
+        for _ in range(100):
+            if not os.path.lexists(self.tf.dest_path('sos_commands/foo/foo')):
+                break
+            time.sleep(0.05)
+        self.assertFalse(os.path.lexists(
+            self.tf.dest_path('sos_commands/foo/foo_-a')))
+        self.tf.do_file_sub('sos_commands/foo/ps_aux', r'output', 'xxx')
+        self.tf.finalize('auto')
+        with tarfile.open(os.path.join(self.tmpdir, 'test.tar.xz')) as rtf:
+            names = rtf.getnames()
+            self.assertEqual(
+                rtf.extractfile('test/sos_commands/foo/foo_-a').read(),
+                b'foo output')
+            self.assertEqual(
+                rtf.extractfile('test/sos_commands/foo/ps_aux').read(),
+                b'ps xxx')
+            self.assertTrue(rtf.getmember('test/sos_commands/foo/foo').issym())
+        self.assertEqual(names.count('test/sos_commands/foo/foo_-a'), 1)
+        self.assertEqual(names.count('test/sos_commands/foo/ps_aux'), 1)
+        self.assertIn('test/version.txt', names)
+
+    def test_checksum(self):
+        self.tf.set_hash_name('sha256')
+        self.tf.add_string('content', 'foo')
+        self.tf.finalize('auto')
+        with open(os.path.join(self.tmpdir, 'test.tar.xz'), 'rb') as afile:
+            self.assertEqual(self.tf.get_checksum(),
+                             hashlib.sha256(afile.read()).hexdigest())
+
+    def test_no_checksum(self):
+        self.tf.finalize('auto')
+        self.assertIsNone(self.tf.get_checksum())
+
+    @unittest.skipIf(shutil.which('gpg') is None, 'gpg is not installed')
+    def test_encrypted_checksum(self):
+        self.tf.enc_opts = {'encrypt': True, 'key': None,
+                            'password': 'secret'}
+        self.tf.set_hash_name('sha256')
+        path = self.tf.finalize('auto')
+        self.assertTrue(path.endswith('.tar.xz.gpg'))
+        with open(path, 'rb') as afile:
+            self.assertEqual(self.tf.get_checksum(),
+                             hashlib.sha256(afile.read()).hexdigest())
+
+    @unittest.skipIf(shutil.which('gpg') is None, 'gpg is not installed')
+    def test_encrypt_error(self):
+        self.tf.enc_opts = {'encrypt': True, 'key': 'sos-no-such-key',
+                            'password': None}
+        path = self.tf._build_archive('auto')
+        with tempfile.TemporaryFile() as stderr:
+            saved = os.dup(2)
+            os.dup2(stderr.fileno(), 2)
+            try:
+                with self.assertRaises(Exception) as err:
+                    self.tf._encrypt(path)
+            finally:
+                os.dup2(saved, 2)
+                os.close(saved)
+            stderr.seek(0)
+            # gpg's error is reported, and not written to the terminal
+            self.assertEqual(stderr.read(), b'')
+        self.assertIn('sos-no-such-key', str(err.exception))
+        self.assertFalse(os.path.exists(f"{path}.gpg"))
+
+    @patch.object(archive, 'COMPRESS_BLOCK_SIZE', 1024)
+    def test_index(self):
+        content = {}
+        for i in range(10):
+            content[f"sos_commands/foo/out{i}"] = os.urandom(300 * i).hex()
+            self.tf.add_string(content[f"sos_commands/foo/out{i}"],
+                               f"sos_commands/foo/out{i}")
+        self.tf.add_link('sos_commands/foo/out3', 'hostname')
+        self.tf.set_index(True)
+        self.tf.finalize('auto')
+        path = os.path.join(self.tmpdir, 'test.tar.xz')
+        reader = ArchiveIndexReader(path)
+        self.assertTrue(reader.has_index)
+        self.assertIn('test/hostname', reader)
+        self.assertNotIn('test/sos_commands/foo', reader)
+        for name, data in content.items():
+            self.assertEqual(reader.read(f"test/{name}").decode(), data)
+        self.assertEqual(reader.read('test/hostname').decode(),
+                         content['sos_commands/foo/out3'])
+        with self.assertRaises(KeyError):
+            reader.read('test/nothere')
+        # the archive is still a plain tar archive
+        with tarfile.open(path) as rtf:
+            self.assertEqual(rtf.extractfile('test/sos_commands/foo/out9')
+                             .read().decode(),
+                             content['sos_commands/foo/out9'])
+            self.assertEqual(rtf.getnames()[-1],
+                             'test/sos_reports/archive_index.json')
+
+    def test_no_index(self):
+        self.tf.add_string('content', 'foo')
+        self.tf.finalize('gzip')
+        reader = ArchiveIndexReader(os.path.join(self.tmpdir, 'test.tar.gz'))
+        self.assertFalse(reader.has_index)
+        self.assertNotIn('test/foo', reader)
+
+    @patch.object(archive, 'COMPRESS_BLOCK_SIZE', 1024)
+    @patch.object(archive, 'INDEX_PEEK_SIZE', 1024)
+    def test_no_index_blocks(self):
+        for i in range(10):
+            self.tf.add_string(os.urandom(300 * i).hex(), f"out{i}")
+        self.tf.finalize('auto')
+        path = os.path.join(self.tmpdir, 'test.tar.xz')
+        # the candidate blocks are only peeked at, never fully decompressed
+        with patch.object(ArchiveIndexReader, '_decompress') as decompress:
+            reader = ArchiveIndexReader(path)
+            decompress.assert_not_called()
+        self.assertFalse(reader.has_index)
+
+    @patch.object(archive, 'zstd', None)
+    def test_zstd_unavailable(self):
+        self.tf.finalize('zstd')
+        self.check_for_file('test')
+
+    @patch.object(archive, 'COMPRESS_BLOCK_SIZE', 1024)
+    def test_compress_blocks(self):
+        content = os.urandom(5000).hex()
+        self.tf._threads = 4
+        self.tf.add_string(content, 'big')
+        self.tf.finalize('gzip')
+        with tarfile.open(os.path.join(self.tmpdir, 'test.tar.gz')) as rtf:
+            self.assertEqual(rtf.extractfile('test/big').read().decode(),
+                             content)
+
+
+class BlockCompressorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    @patch.object(archive, 'COMPRESS_BLOCK_SIZE', 100)
+    def test_blocks(self):
+        data = os.urandom(1050)
+        for method, decomp in (('xz', lzma), ('gz', gzip)):
+            path = os.path.join(self.tmpdir, f"out.{method}")
+            with BlockCompressor(HashingWriter(path), method,
+                                 threads=3) as comp:
+                comp.write(data[:10])
+                comp.write(data[10:])
+                self.assertEqual(comp.tell(), 1050)
+            with open(path, 'rb') as cfile:
+                self.assertEqual(decomp.decompress(cfile.read()), data)
+            # one stream per block
+            if method == 'gz':
+                with open(path, 'rb') as cfile:
+                    self.assertEqual(cfile.read().count(b'\x1f\x8b\x08'),
+                                     11)
+
+    @unittest.skipIf(archive.zstd is None, 'zstd is not available')
+    @patch.object(archive, 'COMPRESS_BLOCK_SIZE', 100)
+    def test_zstd(self):
+        data = os.urandom(1050)
+        path = os.path.join(self.tmpdir, 'out.zst')
+        with BlockCompressor(HashingWriter(path), 'zst', threads=3) as comp:
+            comp.write(data)
+        with open(path, 'rb') as cfile:
+            self.assertEqual(archive.zstd.decompress(cfile.read()), data)
+
+    def test_hashing_writer(self):
+        path = os.path.join(self.tmpdir, 'out')
+        with HashingWriter(path, 'md5') as output:
+            output.write(b'foo')
+            output.write(b'bar')
+        self.assertEqual(output.hexdigest(),
+                         hashlib.md5(b'foobar').hexdigest())
+        with open(path, 'rb') as ofile:
+            self.assertEqual(ofile.read(), b'foobar')
+        with HashingWriter(path) as output:
+            output.write(b'foo')
+        self.assertIsNone(output.hexdigest())
+
+    def test_empty(self):
+        path = os.path.join(self.tmpdir, 'out.xz')
+        BlockCompressor(HashingWriter(path), 'xz').close()
+        with open(path, 'rb') as cfile:
+            self.assertEqual(lzma.decompress(cfile.read()), b'')
+
+    def test_bad_method(self):
+        with self.assertRaises(ValueError):
+            BlockCompressor(None, 'bz2')
+        with patch.object(archive, 'zstd', None):
+            with self.assertRaises(ValueError):
+                BlockCompressor(None, 'zst')
+
+
+class EstimateArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        enc = {'encrypt': False}
+        self.ea = EstimateArchive('test', self.tmpdir, Policy(), 1, enc, '/')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_plugin_sizes(self):
+        size = os.stat('tests/unittests/ziptest').st_size
+        foo = self.ea.for_plugin('foo')
+        bar = self.ea.for_plugin('bar')
+        foo.add_file('tests/unittests/ziptest')
+        foo.add_string('a' * 100, 'sos_commands/foo/out')
+        bar.add_binary(b'b' * 10, 'sos_commands/bar/out')
+        # already collected by foo, so not accounted to bar
+        bar.add_file('tests/unittests/ziptest')
+        self.assertEqual(self.ea.get_sizes('foo'), {
+            'tests/unittests/ziptest': size,
+            'sos_commands/foo/out': 100
+        })
+        self.assertEqual(self.ea.get_sizes('bar'),
+                         {'sos_commands/bar/out': 10})
+        dest = self.ea.dest_path('sos_commands/foo/out')
+        self.assertEqual(os.stat(dest).st_size, 0)
+
+    def test_add_file_unlocked(self):
+        def get_src_size(src):
+            # other plugins can add to the archive while a source is measured
+            self.assertFalse(EstimateArchive._path_lock.locked())
+            return 7
+
+        foo = self.ea.for_plugin('foo')
+        with patch.object(EstimateArchive, '_get_src_size',
+                          side_effect=get_src_size):
+            foo.add_file('/proc/self/status')
+        self.assertEqual(self.ea.get_sizes('foo'), {'proc/self/status': 7})
+
+    def test_direct_writes(self):
+        foo = self.ea.for_plugin('foo')
+        dest = foo.check_path('sos_commands/foo/cmd', P_FILE)
+        with open(dest, 'w', encoding='utf-8') as f:
+            f.write('x' * 42)
+        self.assertEqual(self.ea.get_sizes('foo'),
+                         {'sos_commands/foo/cmd': 42})
+        self.assertEqual(os.stat(dest).st_size, 0)
+        self.ea.discard_collected()
+        self.assertEqual(os.listdir(self.ea.get_archive_path()), [])
+
+    def test_archive_content_kept(self):
+        self.ea.add_string('version', 'version.txt')
+        self.assertEqual(self.ea.get_sizes(None), {})
+        with self.ea.open_file('version.txt') as f:
+            self.assertEqual(f.read(), 'version')
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,135 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import os
+import subprocess
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from sos.report import breaker
+from sos.report.breaker import HangBreaker, get_process_state
+from sos.utilities import sos_get_command_output
+
+MOUNTINFO = """\
+22 1 253:0 / / rw,relatime shared:1 - xfs /dev/mapper/root rw
+40 22 0:45 / /mnt/nfs rw,relatime shared:2 - nfs4 srv:/export rw
+41 22 0:46 / /mnt/my\\040share rw,relatime shared:3 - cifs //srv/s rw
+42 22 253:1 / /var rw,relatime shared:4 - xfs /dev/mapper/var rw
+"""
+
+# a pid that does not exist, so that hangs are attributed by wchan only
+NO_PID = 2 ** 22 + 1
+
+
+class HangBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.mountinfo = os.path.join(self.tmpdir, 'mountinfo')
+        with open(self.mountinfo, 'w', encoding='utf-8') as mfile:
+            mfile.write(MOUNTINFO)
+        self.patcher = patch.object(breaker, 'MOUNTINFO_PATH',
+                                    self.mountinfo)
+        self.patcher.start()
+        self.breaker = HangBreaker()
+
+    def tearDown(self):
+        self.patcher.stop()
+        os.unlink(self.mountinfo)
+        os.rmdir(self.tmpdir)
+
+    def test_process_state(self):
+        state, _ = get_process_state(os.getpid())
+        self.assertIn(state, ('R', 'S'))
+        self.assertEqual(get_process_state(NO_PID), ('', ''))
+
+    def test_get_mounts(self):
+        mounts = HangBreaker.get_mounts()
+        self.assertEqual(mounts[-1], ('/', 'xfs'))
+        self.assertIn(('/mnt/my share', 'cifs'), mounts)
+
+    def test_nothing_tripped(self):
+        self.assertIsNone(self.breaker.check_command('df -al'))
+        self.assertIsNone(self.breaker.check_path('/mnt/nfs/file'))
+
+    def test_trip_by_subsystem(self):
+        reason = self.breaker.trip(NO_PID, 'df -al', 'rpc_wait_bit_killable')
+        self.assertIn('/mnt/nfs', reason)
+        self.assertEqual(self.breaker.tripped[0]['mounts'], ['/mnt/nfs'])
+        self.assertEqual(self.breaker.tripped[0]['subsystem'], 'nfs')
+        self.assertEqual(self.breaker.check_path('/mnt/nfs/a/b'), reason)
+        self.assertIsNone(self.breaker.check_path('/mnt/nfsother'))
+        self.assertIsNone(self.breaker.check_path('/var/log/messages'))
+        self.assertEqual(self.breaker.check_command('ls -l /mnt/nfs'), reason)
+        self.assertEqual(self.breaker.check_command('lsof -b'), reason)
+        self.assertIsNone(self.breaker.check_command('ls -l /var'))
+
+    def test_trip_unattributed(self):
+        reason = self.breaker.trip(NO_PID, 'sg_inq /dev/sda', 'some_wait')
+        self.assertEqual(self.breaker.check_command('sg_inq /dev/sdb'),
+                         reason)
+        self.assertIsNone(self.breaker.check_command('df -al'))
+        self.assertIsNone(self.breaker.check_path('/mnt/nfs/a'))
+
+    def test_check_command_root(self):
+        reason = self.breaker.trip(NO_PID, 'ls /mnt/nfs', 'nfs_wait_on_req')
+        self.assertEqual(self.breaker.check_command('ls /nfs', root='/mnt'),
+                         reason)
+
+    def test_trip_process_paths(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dirs = {}
+            with open(self.mountinfo, 'a', encoding='utf-8') as mfile:
+                for i, (name, fstype) in enumerate((('sos', 'nfs4'),
+                                                    ('data', 'nfs4'),
+                                                    ('local', 'xfs'))):
+                    dirs[name] = os.path.join(tmpdir, name)
+                    os.mkdir(dirs[name])
+                    mfile.write(f"{50 + i} 22 0:{50 + i} / {dirs[name]} rw "
+                                f"- {fstype} srv:/{name} rw\n")
+            hbreaker = HangBreaker(tmpdir=dirs['sos'])
+            out = os.path.join(dirs['sos'], 'out')
+            with open(out, 'w', encoding='utf-8') as ofile, \
+                    open(os.path.join(dirs['data'], 'f'), 'w',
+                         encoding='utf-8') as dfile:
+                with subprocess.Popen(['sleep', '30'], stdout=ofile,
+                                      cwd=dirs['local'],
+                                      pass_fds=[dfile.fileno()]) as proc:
+                    try:
+                        hbreaker.trip(proc.pid, 'sleep 30',
+                                      'rpc_wait_bit_killable')
+                    finally:
+                        proc.kill()
+        # neither its output file in the sos tmpdir nor its working
+        # directory on a local filesystem are what an NFS wait hangs on
+        self.assertEqual(hbreaker.tripped[0]['mounts'], [dirs['data']])
+
+    def test_skip(self):
+        self.breaker.skip('file', '/mnt/nfs/a', 'hung', 'nfs')
+        self.assertEqual(self.breaker.skipped, [{
+            'type': 'file', 'item': '/mnt/nfs/a', 'reason': 'hung',
+            'plugin': 'nfs'
+        }])
+
+    def test_watchdog_stops_command(self):
+        result = sos_get_command_output(
+            "sleep 10", timeout=30, watchdog=lambda proc: 'hung on /mnt/nfs'
+        )
+        self.assertEqual(result['status'], 124)
+        self.assertEqual(result['hung'], 'hung on /mnt/nfs')
+        self.assertFalse(result['timed_out'])
+
+    def test_watch_running_command(self):
+        watch = self.breaker.watch('sleep 1')
+        result = sos_get_command_output("sleep 1", watchdog=watch)
+        self.assertEqual(result['status'], 0)
+        self.assertIsNone(result['hung'])
+        self.assertEqual(self.breaker.tripped, [])
+
+# vim: set et ts=4 sw=4 :
@@ -6,9 +6,17 @@
 #
 # See the LICENSE file in the source distribution for further information.
 
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
 import unittest
 
 from ipaddress import ip_interface
+from unittest.mock import patch, PropertyMock
+from sos import archive
+from sos.archive import TarFileArchive
 from sos.cleaner.parsers.ip_parser import SoSIPParser
 from sos.cleaner.parsers.mac_parser import SoSMacParser
 from sos.cleaner.parsers.hostname_parser import SoSHostnameParser
@@ -23,8 +31,10 @@ from sos.cleaner.mappings.ipv6_map import SoSIPv6Map
 from sos.cleaner.preppers import SoSPrepper
 from sos.cleaner.preppers.hostname import HostnamePrepper
 from sos.cleaner.preppers.ip import IPPrepper
+from sos.cleaner.archives import SoSObfuscationArchive
 from sos.cleaner.archives.sos import SoSReportArchive
 from sos.options import SoSOptions
+from sos.policies import Policy
 
 
 class CleanerMapTests(unittest.TestCase):
@@ -354,3 +364,66 @@ class PrepperTests(unittest.TestCase):
             [],
             self.ipv4_prepper.get_parser_file_list('foobar', self.archive)
         )
+
+
+class ObfuscationArchiveTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.arc_path = os.path.join(self.tmpdir, 'sosreport-test.tar.xz')
+        os.makedirs(os.path.join(self.tmpdir, 'sosreport-test'))
+        with open(os.path.join(self.tmpdir, 'sosreport-test', 'version.txt'),
+                  'w', encoding='utf-8') as vfile:
+            vfile.write('version')
+        with tarfile.open(self.arc_path, 'w:xz') as tar:
+            tar.add(os.path.join(self.tmpdir, 'sosreport-test'),
+                    arcname='sosreport-test')
+        self.archive = SoSReportArchive(self.arc_path, self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_compression(self):
+        self.assertEqual(self.archive.get_compression(), 'xz')
+        with patch.object(SoSObfuscationArchive, 'is_tarfile',
+                          new_callable=PropertyMock, return_value=True):
+            self.archive.archive_path = self.arc_path.replace('.xz', '.zst')
+            self.assertEqual(self.archive.get_compression(), 'zst')
+            self.archive.archive_path = self.arc_path.replace('.xz', '.gz')
+            self.assertEqual(self.archive.get_compression(), 'gz')
+
+    def test_remove_zst(self):
+        self.assertTrue(self.archive.should_remove_file('var/log/foo.zst'))
+
+    def test_indexed_file_content(self):
+        tf = TarFileArchive('sosreport-indexed', self.tmpdir, Policy(), 1,
+                            {'encrypt': False}, '/')
+        tf.add_string('indexed', 'etc/hosts')
+        tf.set_index(True)
+        arc = SoSReportArchive(tf.finalize('auto'), self.tmpdir)
+        self.assertTrue(arc.index.has_index)
+        self.assertEqual(arc.get_file_content('etc/hosts'), 'indexed')
+        self.assertEqual(arc.get_file_content('etc/nothere'), '')
+        arc.extract(quiet=True)
+        self.assertFalse(os.path.exists(os.path.join(
+            arc.extracted_path, 'sos_reports', 'archive_index.json')))
+
+    def test_build_checksum(self):
+        self.archive.extracted_path = os.path.join(self.tmpdir,
+                                                   'sosreport-test')
+        tarpath = self.archive.build_tar_file('gz', 'sha256')
+        with open(tarpath, 'rb') as tfile:
+            self.assertEqual(self.archive.checksum,
+                             hashlib.sha256(tfile.read()).hexdigest())
+        with tarfile.open(tarpath) as tar:
+            self.assertIn('sosreport-test/version.txt', tar.getnames())
+
+    @unittest.skipIf(archive.zstd is None, 'zstd is not available')
+    def test_build_zst(self):
+        self.archive.extracted_path = os.path.join(self.tmpdir,
+                                                   'sosreport-test')
+        tarpath = self.archive.build_tar_file('zst')
+        self.assertTrue(tarpath.endswith('-obfuscated.tar.zst'))
+        self.assertTrue(SoSReportArchive.check_is_type(tarpath))
+        with tarfile.open(tarpath) as tar:
+            self.assertIn('sosreport-test/version.txt', tar.getnames())
@@ -0,0 +1,119 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from sos.report import cmdcache
+from sos.report.cmdcache import CommandCache
+
+# a command whose output differs on every run
+CMD = "sh -c 'echo $$'"
+
+
+class CommandCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CommandCache()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_key(self):
+        self.assertEqual(CommandCache.get_key('ip  -o addr'),
+                         CommandCache.get_key('ip -o addr', sizelimit=0))
+        self.assertNotEqual(CommandCache.get_key('ip -o addr'),
+                            CommandCache.get_key('ip -o addr', stderr=True))
+        self.assertNotEqual(
+            CommandCache.get_key('ip -o addr'),
+            CommandCache.get_key('ip -o addr', env={'LC_ALL': 'C'})
+        )
+        self.assertNotEqual(CommandCache.get_key('ip -o addr'),
+                            CommandCache.get_key('ip -o addr', chroot='/h'))
+        self.assertNotEqual(
+            CommandCache.get_key('ip -o addr'),
+            CommandCache.get_key('ip -o addr', netns='/run/netns/ns1')
+        )
+
+    def test_run_once(self):
+        first = self.cache.run(CMD)
+        second = self.cache.run(CMD)
+        self.assertEqual(first['output'], second['output'])
+        self.assertTrue(second['cached'])
+        self.assertIsNone(second['rusage'])
+        self.assertFalse(first.get('cached', False))
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_result_copies(self):
+        first = self.cache.run(CMD)
+        first['filename'] = 'foo'
+        self.assertNotIn('filename', self.cache.run(CMD))
+
+    def test_changes(self):
+        first = self.cache.run(CMD)
+        self.cache.run('true', changes=True)
+        self.assertNotEqual(self.cache.run(CMD)['output'], first['output'])
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_concurrent(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.cache.run("sh -c 'sleep 0.2; echo $$'")['output']
+            )) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(self.cache.hits, 3)
+
+    def test_to_file(self):
+        path = os.path.join(self.tmpdir, 'first')
+        self.cache.run(CMD, to_file=path, sizelimit=25)
+        with open(path, encoding='utf-8') as ofile:
+            output = ofile.read()
+        path2 = os.path.join(self.tmpdir, 'second')
+        result = self.cache.run(CMD, to_file=path2, sizelimit=25)
+        self.assertTrue(result['cached'])
+        with open(path2, encoding='utf-8') as ofile:
+            self.assertEqual(ofile.read(), output)
+        # once the first file is changed, the command runs again
+        with open(path, 'a', encoding='utf-8') as ofile:
+            ofile.write('changed')
+        self.assertNotIn('cached', self.cache.run(CMD, sizelimit=25))
+
+    def test_memory_to_file(self):
+        output = self.cache.run(CMD)['output']
+        path = os.path.join(self.tmpdir, 'out')
+        result = self.cache.run(CMD, to_file=path)
+        self.assertEqual(result['output'], '')
+        with open(path, encoding='utf-8') as ofile:
+            self.assertEqual(ofile.read(), output)
+
+    def test_large_output_not_kept(self):
+        cmd = f"head -c {cmdcache.CACHE_MAX_OUTPUT + 1} /dev/zero"
+        self.cache.run(cmd, binary=True)
+        self.assertNotIn('cached', self.cache.run(cmd, binary=True))
+
+    def test_timed_out_not_kept(self):
+        self.assertTrue(self.cache.run('sleep 1', timeout=0.2)['timed_out'])
+        result = self.cache.run('sleep 1', timeout=30)
+        self.assertEqual(result['status'], 0)
+        self.assertNotIn('cached', result)
+
+    def test_killed_not_kept(self):
+        for cmd in ("sh -c 'kill -9 $$'", "sh -c 'exit 137'"):
+            self.cache.run(cmd)
+            self.assertNotIn('cached', self.cache.run(cmd))
+
+# vim: set et ts=4 sw=4 :
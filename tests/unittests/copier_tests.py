@@ -0,0 +1,84 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import threading
+import time
+import unittest
+
+from unittest.mock import patch
+
+from sos.report import copier
+from sos.report.copier import FileCopier
+
+
+@patch.object(copier, 'PROGRESS_INTERVAL', 0.05)
+class FileCopierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.copier = FileCopier(0.2)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        # let abandoned workers go
+        self.release.set()
+
+    def test_copy(self):
+        copied = []
+        self.assertTrue(self.copier.copy('/etc/a', lambda: copied.append(1),
+                                         'test'))
+        self.assertEqual(copied, [1])
+        self.assertEqual(self.copier.timed_out, [])
+
+    def test_copy_error(self):
+        def _fail():
+            raise OSError('failed')
+        with self.assertRaises(OSError):
+            self.copier.copy('/etc/a', _fail, 'test')
+
+    def test_blocked_copy_abandoned(self):
+        start = time.monotonic()
+        self.assertFalse(self.copier.copy('/sys/a/b', self.release.wait,
+                                          'test'))
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(self.copier.timed_out[0]['path'], '/sys/a/b')
+        self.assertEqual(self.copier.timed_out[0]['plugin'], 'test')
+        self.assertTrue(self.copier.check_path('/sys/a/b'))
+        self.assertFalse(self.copier.check_path('/sys/a/c'))
+        # the pool is not starved by the blocked worker
+        self.assertTrue(self.copier.copy('/etc/a', lambda: None, 'test'))
+
+    def test_skip_directory(self):
+        self.copier.copy('/sys/a/b', self.release.wait, 'test')
+        self.copier.copy('/sys/a/c', self.release.wait, 'test')
+        self.assertEqual(self.copier.skip_list,
+                         ['/sys/a/b', '/sys/a/c', '/sys/a/*'])
+        self.assertTrue(self.copier.check_path('/sys/a/d'))
+        self.assertFalse(self.copier.check_path('/sys/b'))
+
+    def test_progress_extends_deadline(self):
+        counter = iter(range(1000))
+        self.assertTrue(self.copier.copy(
+            '/var/log/a', lambda: self.release.wait(0.6), 'test',
+            progress=lambda: next(counter)
+        ))
+        self.assertEqual(self.copier.timed_out, [])
+
+    @patch.object(copier, 'SLOW_COPY', 0.1)
+    def test_slow_copy(self):
+        self.copier.copy('/var/log/a', lambda: time.sleep(0.15), 'test')
+        self.copier.copy('/var/log/b', lambda: None, 'test')
+        self.assertEqual([s['path'] for s in self.copier.slow],
+                         ['/var/log/a'])
+
+    def test_no_timeout(self):
+        _copier = FileCopier(0)
+        threads = []
+        _copier.copy('/etc/a', lambda: threads.append(
+            threading.current_thread()), 'test')
+        self.assertEqual(threads, [threading.current_thread()])
+
+# vim: set et ts=4 sw=4 :
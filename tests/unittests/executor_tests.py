@@ -0,0 +1,63 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import threading
+import unittest
+
+from sos.report.executor import CommandExecutor
+
+
+class CommandExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = CommandExecutor()
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def test_not_running_until_started(self):
+        self.assertFalse(self.executor.running)
+        with self.assertRaises(RuntimeError):
+            self.executor.submit(10, print)
+        self.executor.start(2)
+        self.assertTrue(self.executor.running)
+
+    def test_result_and_exception(self):
+        self.executor.start(2)
+        ok = self.executor.submit(10, sum, [1, 2, 3])
+        fail = self.executor.submit(10, int, 'not a number')
+        self.assertEqual(ok.result(timeout=5), 6)
+        with self.assertRaises(ValueError):
+            fail.result(timeout=5)
+
+    def test_priority_order(self):
+        # block the only worker so that everything else is queued before any
+        # of it can be run
+        order = []
+        gate = threading.Event()
+        self.executor.start(1)
+        self.executor.submit(0, gate.wait)
+        futures = [
+            self.executor.submit(prio, order.append, name)
+            for prio, name in ((50, 'lsof'), (10, 'ip'), (1, 'ps'),
+                               (10, 'ss'))
+        ]
+        gate.set()
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(order, ['ps', 'ip', 'ss', 'lsof'])
+
+    def test_shutdown(self):
+        self.executor.start(2)
+        self.executor.shutdown(wait=True)
+        self.assertFalse(self.executor.running)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
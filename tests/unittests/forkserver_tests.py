@@ -0,0 +1,84 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import errno
+import os
+import signal
+import unittest
+
+from unittest.mock import patch
+
+from sos import forkserver
+from sos.forkserver import ForkServer, ForkServerError
+from sos.utilities import sos_get_command_output
+
+
+class ForkServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ForkServer.start()
+
+    def tearDown(self):
+        ForkServer.stop()
+
+    def test_running(self):
+        self.assertIsNotNone(self.server)
+        self.assertIs(ForkServer.get(), self.server)
+
+    def test_spawn(self):
+        out_r, out_w = os.pipe()
+        try:
+            proc = self.server.spawn(['sh', '-c', 'echo $FOO; exit 3'],
+                                     {'FOO': 'bar', 'PATH': '/usr/bin:/bin'},
+                                     out_w, out_w, cwd='/')
+        finally:
+            os.close(out_w)
+        with os.fdopen(out_r, 'rb') as out:
+            self.assertEqual(out.read(), b'bar\n')
+        self.assertEqual(proc.wait(), 3)
+        self.assertGreater(proc.rusage['maxrss'], 0)
+
+    def test_spawn_not_found(self):
+        with self.assertRaises(OSError) as err:
+            self.server.spawn(['/nonexistent/command'], {}, 1, 2)
+        self.assertEqual(err.exception.errno, errno.ENOENT)
+
+    def test_socket_not_inherited(self):
+        result = sos_get_command_output("ls -l /proc/self/fd/")
+        self.assertEqual(result['status'], 0)
+        self.assertNotIn('socket:', result['output'])
+
+    @patch.object(forkserver, 'SPAWN_TIMEOUT', 0.2)
+    def test_spawn_timeout(self):
+        os.kill(self.server._helper.pid, signal.SIGSTOP)
+        try:
+            with self.assertRaises(ForkServerError):
+                self.server.spawn(['true'], {}, 1, 2)
+            self.assertIsNone(ForkServer.get())
+            # commands are run without the stalled helper
+            result = sos_get_command_output("echo executed")
+            self.assertEqual(result['output'], "executed\n")
+        finally:
+            os.kill(self.server._helper.pid, signal.SIGCONT)
+
+    def test_command_output(self):
+        result = sos_get_command_output("sh -c 'echo executed; exit 2'")
+        self.assertEqual(result['status'], 2)
+        self.assertEqual(result['output'], "executed\n")
+        self.assertIsNotNone(result['rusage'])
+
+    def test_stop(self):
+        ForkServer.stop()
+        self.assertIsNone(ForkServer.get())
+        result = sos_get_command_output("echo executed")
+        self.assertEqual(result['output'], "executed\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,103 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from unittest.mock import patch
+
+from sos.report.governor import ConcurrencyLimit, LoadGovernor
+
+
+class ConcurrencyLimitTest(unittest.TestCase):
+
+    def test_bounds(self):
+        limit = ConcurrencyLimit(2, 8)
+        self.assertEqual(limit.limit, 8)
+        self.assertEqual(limit.set_limit(20), 8)
+        self.assertEqual(limit.set_limit(0), 2)
+        self.assertEqual(ConcurrencyLimit(10, 4).floor, 4)
+
+    def test_slot_blocks_over_limit(self):
+        limit = ConcurrencyLimit(1, 2)
+        limit.set_limit(1)
+        started = threading.Event()
+
+        def _task():
+            with limit.slot():
+                started.set()
+
+        with limit.slot():
+            thread = threading.Thread(target=_task)
+            thread.start()
+            self.assertFalse(started.wait(0.2))
+        thread.join(5)
+        self.assertTrue(started.is_set())
+        self.assertEqual(limit.running, 0)
+
+
+class LoadGovernorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.limits = {'plugins': ConcurrencyLimit(1, 4)}
+        self.decisions = []
+        self.governor = LoadGovernor(self.limits, self.decisions)
+
+    def test_evaluate(self):
+        idle = {'cpu': 0.5, 'io': 0.0, 'memory': 0.0, 'load': 0.1}
+        busy = {'cpu': 20.0, 'io': 0.0, 'memory': 0.0, 'load': 0.1}
+        stressed = {'cpu': 0.5, 'io': 55.0, 'memory': 0.0, 'load': 0.1}
+        no_psi = {'cpu': None, 'io': None, 'memory': None, 'load': 3.0}
+        self.assertEqual(LoadGovernor.evaluate(idle)[0], 1)
+        self.assertEqual(LoadGovernor.evaluate(busy)[0], 0)
+        self.assertEqual(LoadGovernor.evaluate(stressed)[0], -1)
+        self.assertEqual(LoadGovernor.evaluate(no_psi)[0], -1)
+
+    def test_adjust_records_decisions(self):
+        stressed = {'cpu': 90.0, 'io': 0.0, 'memory': 0.0, 'load': 0.1}
+        idle = {'cpu': 0.0, 'io': 0.0, 'memory': 0.0, 'load': 0.1}
+        self.governor.adjust(stressed)
+        self.governor.adjust(stressed)
+        self.assertEqual(self.limits['plugins'].limit, 2)
+        self.governor.adjust(idle)
+        self.assertEqual(self.limits['plugins'].limit, 3)
+        self.assertEqual(len(self.decisions), 3)
+        self.assertEqual(self.decisions[-1]['limits'],
+                         {'plugins': {'from': 2, 'to': 3}})
+        # already at the ceiling, nothing to record
+        self.governor.adjust(idle)
+        self.governor.adjust(idle)
+        self.assertEqual(len(self.decisions), 4)
+
+    def test_sample(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmpdir, 'cpu'), 'w',
+                      encoding='utf-8') as pfile:
+                pfile.write("some avg10=12.50 avg60=1.00 avg300=0.00 "
+                            "total=100\n")
+            with open(os.path.join(tmpdir, 'loadavg'), 'w',
+                      encoding='utf-8') as lfile:
+                lfile.write("4.00 2.00 1.00 1/100 1000\n")
+            self.governor.ncpus = 4
+            with patch('sos.report.governor.PRESSURE_PATH', tmpdir), \
+                    patch('sos.report.governor.LOADAVG_PATH',
+                          os.path.join(tmpdir, 'loadavg')):
+                sample = self.governor.sample()
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(sample, {'cpu': 12.5, 'io': None, 'memory': None,
+                                  'load': 1.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,67 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import os
+import shutil
+import tempfile
+import unittest
+
+import sos.report.plugins
+from sos.report.plugins import (import_plugin, DebianPlugin,
+                                IndependentPlugin, RedHatPlugin)
+from sos.report.plugin_index import PluginIndex
+
+
+class PluginIndexTest(unittest.TestCase):
+
+    modules = ['logs', 'rpm']
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'plugin_index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _get_index(self, modules=None):
+        return PluginIndex(sos.report.plugins, modules or self.modules,
+                           self.path)
+
+    def test_unknown_module(self):
+        index = self._get_index()
+        self.assertIsNone(index.get('logs'))
+
+    def test_save_and_load(self):
+        index = self._get_index()
+        for module in self.modules:
+            index.add(module, import_plugin(module))
+        index.save()
+
+        index = self._get_index()
+        self.assertFalse(index.changed)
+        entries = index.get('rpm')
+        self.assertEqual([e.name() for e in entries], ['rpm'])
+        self.assertIn('packagemanager', entries[0].profiles)
+        self.assertIn('rpmq', entries[0].data['options'])
+        self.assertTrue(entries[0].is_subclass((RedHatPlugin,)))
+        self.assertFalse(entries[0].is_subclass((DebianPlugin,)))
+        self.assertTrue(any(
+            e.is_subclass((IndependentPlugin,)) for e in index.get('logs')
+        ))
+
+    def test_key_mismatch(self):
+        index = self._get_index()
+        index.add('rpm', import_plugin('rpm'))
+        index.save()
+        index = self._get_index(modules=['rpm', 'logs'])
+        self.assertIsNone(index.get('rpm'))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
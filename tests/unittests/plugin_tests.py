@@ -10,12 +10,19 @@ import os
 import tempfile
 import shutil
 import random
+import threading
 
 from io import StringIO
 from string import ascii_lowercase
+from unittest.mock import patch
+from sos.report import copier
+from sos.report.cmdcache import CommandCache
+from sos.report.copier import FileCopier
 from sos.report.plugins import (Plugin, regex_findall,
-                                _mangle_command, PluginOpt)
+                                _mangle_command, _split_netns_command,
+                                PluginOpt, SoSCommand)
 from sos.archive import TarFileArchive
+from sos.component import SoSMetadata
 from sos.policies.distros import LinuxPolicy
 from sos.policies.init_systems import InitSystem
 
@@ -166,6 +173,33 @@ class PluginToolTests(unittest.TestCase):
         expected = longcmd[0:name_max].replace(' ', '_')
         self.assertEqual(expected, _mangle_command(longcmd, name_max))
 
+    def test_split_netns_command(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.mkdir(os.path.join(tmpdir, 'run'))
+            os.mkdir(os.path.join(tmpdir, 'etc'))
+            for name in ('ns1', 'ns2'):
+                with open(os.path.join(tmpdir, 'run', name), 'w'):
+                    pass
+            os.mkdir(os.path.join(tmpdir, 'etc', 'ns2'))
+            with patch.multiple('sos.utilities',
+                                NETNS_RUN_DIR=os.path.join(tmpdir, 'run'),
+                                NETNS_ETC_DIR=os.path.join(tmpdir, 'etc')):
+                self.assertEqual(
+                    _split_netns_command("ip netns exec ns1 ip -o addr"),
+                    (os.path.join(tmpdir, 'run', 'ns1'), "ip -o addr")
+                )
+                # namespaces with their own /etc files are left to `ip`
+                self.assertEqual(
+                    _split_netns_command("ip netns exec ns2 ss -tan"),
+                    (None, "ip netns exec ns2 ss -tan")
+                )
+                self.assertEqual(
+                    _split_netns_command("ip netns exec ns3 ss -tan"),
+                    (None, "ip netns exec ns3 ss -tan")
+                )
+                self.assertEqual(_split_netns_command("ip netns"),
+                                 (None, "ip netns"))
+
 
 class PluginTests(unittest.TestCase):
 
@@ -285,6 +319,38 @@ class PluginTests(unittest.TestCase):
             self.mp.archive.m["tests/unittests/plugin_tests.py"],
             'tests/unittests/plugin_tests.py')
 
+    @patch.object(copier, 'PROGRESS_INTERVAL', 0.05)
+    def test_copy_file_abandoned(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        archive = TarFileArchive('test', tmpdir, self.mp.policy, 1,
+                                 {'encrypt': False}, '/')
+        self.mp.archive = archive
+        self.mp.commons['file_copier'] = FileCopier(0.2)
+        release = threading.Event()
+        finished = threading.Event()
+        stage_file = archive.stage_file
+
+        def _blocked_stage(src, staged):
+            release.wait()
+            try:
+                return stage_file(src, staged)
+            finally:
+                finished.set()
+
+        self.mp._do_copy_path("tests/unittests/test.txt")
+        with patch.object(archive, 'stage_file', side_effect=_blocked_stage):
+            self.mp._do_copy_path("tests/unittests/tail_test.txt")
+        # the abandoned copy is not in the archive, not even once it finishes
+        release.set()
+        finished.wait(5)
+        self.assertTrue(os.path.exists(
+            archive.dest_path("tests/unittests/test.txt")))
+        self.assertFalse(os.path.exists(
+            archive.dest_path("tests/unittests/tail_test.txt")))
+        self.assertEqual([c['srcpath'] for c in self.mp.copied_files],
+                         ["tests/unittests/test.txt"])
+
     def test_copy_dir_bad_path(self):
         self.mp._do_copy_path("not_here_tests")
         self.assertEqual(self.mp.archive.m, {})
@@ -326,6 +392,65 @@ class PluginTests(unittest.TestCase):
         self.assertEqual(p.default_environment['GREATESTSPORT'], 'hockey')
         self.assertEqual(p.default_environment['TORVALDS'], 'Linus')
 
+    def test_cmd_tiers(self):
+        self.mp.collect_cmds = [
+            SoSCommand(cmd='ps', priority=1, changes=False),
+            SoSCommand(cmd='ip a', priority=10, changes=False),
+            SoSCommand(cmd='ip r', priority=10, changes=False),
+            SoSCommand(cmd='modprobe x', priority=10, changes=True),
+            SoSCommand(cmd='ip l', priority=10, changes=False),
+            SoSCommand(cmd='mstdump', priority=10, changes=False,
+                       cache=False),
+            SoSCommand(cmd='lsof', priority=50, changes=False)
+        ]
+        tiers = [[c.cmd for c in t] for t in self.mp._get_cmd_tiers()]
+        self.assertEqual(tiers, [['ps'], ['ip a', 'ip r'], ['modprobe x'],
+                                 ['ip l'], ['mstdump'], ['lsof']])
+
+    def test_add_cmd_output_uncached(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        archive = TarFileArchive('test', tmpdir, self.mp.policy, 1,
+                                 {'encrypt': False}, '/')
+        self.mp.archive = archive
+        self.mp.commons['cmd_cache'] = CommandCache()
+        self.mp.commons['cmddir'] = 'sos_commands'
+        self.mp.commons['cmdlineopts'].cmd_timeout = 30
+        self.mp.commons['cmdlineopts'].chroot = 'auto'
+        self.mp.sysroot = '/'
+        # a command whose output differs on every run
+        cmd = "sh -c 'echo $$'"
+        for _ in range(2):
+            self.mp.add_cmd_output(cmd, cache=False)
+        for _ in range(2):
+            self.mp.add_cmd_output(cmd, subdir='cached')
+        self.mp._collect_cmds()
+        outputs = {}
+        for dirpath, _, files in os.walk(archive.get_archive_path()):
+            for name in files:
+                with open(os.path.join(dirpath, name),
+                          encoding='utf-8') as ofile:
+                    outputs.setdefault(os.path.basename(dirpath),
+                                       set()).add(ofile.read())
+        self.assertEqual(len(outputs['mockplugin']), 2)
+        self.assertEqual(len(outputs['cached']), 1)
+
+    def test_cmd_resource_usage(self):
+        self.mp.manifest = SoSMetadata()
+        self.mp.manifest.add_list('commands', [
+            {'exec': 'ps', 'rusage': {'utime': 0.5, 'stime': 0.25,
+                                      'maxrss': 2048, 'read_bytes': 10,
+                                      'write_bytes': 0}},
+            {'exec': 'lsof', 'rusage': {'utime': 1.0, 'stime': 0.5,
+                                        'maxrss': 4096, 'read_bytes': None,
+                                        'write_bytes': 20}},
+            {'exec': 'ip a', 'rusage': None}
+        ])
+        self.assertEqual(self.mp.get_cmd_resource_usage(), {
+            'commands': 2, 'utime': 1.5, 'stime': 0.75, 'maxrss': 4096,
+            'read_bytes': 10, 'write_bytes': 20
+        })
+
 
 class AddCopySpecTests(unittest.TestCase):
 
@@ -409,6 +534,15 @@ class AddCopySpecTests(unittest.TestCase):
         ], 1)
         self.assertEqual(len(self.mp.copy_paths), 2)
 
+    def test_process_files(self):
+        self.mp.sysroot = '/'
+        self.mp.add_forbidden_path('/proc/1/limits')
+        self.mp.add_process_files(['status', 'limits'], pids=['1', '2'])
+        self.assertEqual(self.mp.process_files, [
+            '/proc/1/status', '/proc/2/status', '/proc/2/limits'
+        ])
+        self.assertEqual(self.mp.copy_paths, set())
+
 
 class CheckEnabledTests(unittest.TestCase):
 
@@ -472,6 +606,20 @@ class RegexSubTests(unittest.TestCase):
         self.assertEqual(1, replacements)
         self.assertTrue("foobar" in self.mp.archive.m.get(j('tail_test.txt')))
 
+    def test_batched_replacements(self):
+        self.mp.sysroot = '/'
+        self.mp.add_copy_spec(j("tail_test.txt"))
+        self.mp.collect_plugin()
+        with self.mp.batch_file_subs():
+            self.assertEqual(0, self.mp.do_file_sub(
+                j("tail_test.txt"), r"(tail)", "foobar"))
+            self.mp.do_file_sub(j("tail_test.txt"), r"(foobar)", "baz")
+            self.assertEqual(self.mp.archive.m.get(j('tail_test.txt')),
+                             j('tail_test.txt'))
+        content = self.mp.archive.m.get(j('tail_test.txt'))
+        self.assertTrue("baz" in content)
+        self.assertFalse("foobar" in content)
+
 
 if __name__ == "__main__":
     unittest.main()
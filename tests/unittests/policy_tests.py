@@ -7,6 +7,8 @@
 # See the LICENSE file in the source distribution for further information.
 import unittest
 
+from unittest.mock import patch
+
 from avocado.utils import distro
 
 from sos.policies import Policy, import_policy
@@ -107,6 +109,40 @@ class PackageManagerTests(unittest.TestCase):
     def test_default_pkg_by_name(self):
         self.assertEqual(self.pm.pkg_by_name('foo'), None)
 
+    def test_default_pkgs_by_paths(self):
+        self.assertEqual(self.pm.pkgs_by_paths(['/bin/foo']),
+                         {'/bin/foo': 'unknown'})
+
+
+class PathOwnersTests(unittest.TestCase):
+
+    def test_rpm_pkgs_by_paths(self):
+        pm = RpmPackageManager()
+        out = ("/usr/bin/ls|coreutils-9.3-1.x86_64\n"
+               "/usr/bin/cat|coreutils-9.3-1.x86_64\n"
+               "file /opt/foo is not owned by any package\n")
+        with patch.object(pm, 'exec_cmd', return_value=out) as exec_cmd:
+            owners = pm.pkgs_by_paths(['/usr/bin/ls', '/opt/foo',
+                                       '/usr/bin/ls'])
+        exec_cmd.assert_called_once()
+        self.assertEqual(owners, {
+            '/usr/bin/ls': ['coreutils-9.3-1.x86_64'],
+            '/opt/foo': 'unknown'
+        })
+
+    def test_dpkg_pkgs_by_paths(self):
+        pm = DpkgPackageManager()
+        out = ("coreutils: /bin/ls\n"
+               "diversion by dash from: /bin/sh\n"
+               "dash: /bin/sh\n")
+        with patch.object(pm, 'exec_cmd', return_value=out):
+            owners = pm.pkgs_by_paths(['/bin/ls', '/bin/sh', '/opt/foo'])
+        self.assertEqual(owners, {
+            '/bin/ls': ['coreutils: /bin/ls'],
+            '/bin/sh': ['dash: /bin/sh'],
+            '/opt/foo': 'unknown'
+        })
+
 
 class RpmPackageManagerTests(unittest.TestCase):
 
@@ -0,0 +1,76 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import os
+import shutil
+import tempfile
+import unittest
+
+from sos.report.procsnap import ProcessTable
+
+PROCESSES = {
+    '1': ('systemd', b'/usr/lib/systemd/systemd\x00--system\x00'),
+    '42': ('sshd', b'sshd: /usr/sbin/sshd -D\x00'),
+    '43': ('sshd', b'sshd: user [priv]\x00'),
+    '100': ('kworker/0:1', b''),
+}
+
+
+class ProcessTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proc_dir = tempfile.mkdtemp()
+        for pid, (name, cmdline) in PROCESSES.items():
+            os.mkdir(os.path.join(self.proc_dir, pid))
+            with open(os.path.join(self.proc_dir, pid, 'comm'), 'w',
+                      encoding='utf-8') as pfile:
+                pfile.write(f"{name}\n")
+            with open(os.path.join(self.proc_dir, pid, 'cmdline'),
+                      'wb') as pfile:
+                pfile.write(cmdline)
+        # not a process
+        os.mkdir(os.path.join(self.proc_dir, 'sys'))
+        # a process that exited while /proc was read
+        os.mkdir(os.path.join(self.proc_dir, '200'))
+        self.table = ProcessTable(self.proc_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.proc_dir)
+
+    def test_pids(self):
+        self.assertEqual(sorted(self.table.pids, key=int),
+                         ['1', '42', '43', '100'])
+
+    def test_get_pids(self):
+        self.assertEqual(sorted(self.table.get_pids('sshd')), ['42', '43'])
+        self.assertEqual(self.table.get_pids('systemd'), ['1'])
+        self.assertEqual(self.table.get_pids('nothere'), [])
+
+    def test_get_pids_by_name(self):
+        self.assertEqual(sorted(self.table.get_pids_by_name('sshd')),
+                         ['42', '43'])
+        self.assertEqual(self.table.get_pids_by_name('sshd: user'), [])
+
+    def test_check_process(self):
+        self.assertTrue(self.table.check_process('--system'))
+        self.assertFalse(self.table.check_process('kworker'))
+
+    def test_get_cmdline(self):
+        self.assertEqual(self.table.get_cmdline(1),
+                         '/usr/lib/systemd/systemd\x00--system\x00')
+        self.assertIsNone(self.table.get_cmdline(200))
+
+    def test_read_once(self):
+        self.table.get_pids('sshd')
+        shutil.rmtree(os.path.join(self.proc_dir, '42'))
+        self.assertEqual(sorted(self.table.get_pids('sshd')), ['42', '43'])
+
+    def test_missing_proc(self):
+        table = ProcessTable(os.path.join(self.proc_dir, 'nothere'))
+        self.assertEqual(table.pids, [])
+
+# vim: set et ts=4 sw=4 :
@@ -0,0 +1,87 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import logging
+import threading
+import time
+import unittest
+
+from types import SimpleNamespace
+
+from sos.component import SoSMetadata
+from sos.report import SoSReport
+from sos.report.tracer import Tracer
+
+
+class FakePlugin():
+
+    def __init__(self, name, serial_setup=False):
+        self.name = name
+        self.serial_setup = serial_setup
+        self.archive = None
+        self.manifest = None
+        self._env_vars = {f"{name.upper()}_ENV"}
+        self.setup_thread = None
+
+    def set_plugin_manifest(self, manifest):
+        self.manifest = manifest
+
+    def add_default_collections(self):
+        pass
+
+    def setup(self):
+        self.setup_thread = threading.current_thread()
+        # let the other plugins start their setup meanwhile
+        time.sleep(0.1)
+
+
+class FakePackageManager():
+
+    def __init__(self):
+        self.loaded = False
+
+    def load_packages(self):
+        self.loaded = True
+
+
+class ReportSetupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.report = SoSReport.__new__(SoSReport)
+        self.report.ui_log = logging.getLogger('sos_ui_test')
+        self.report.opts = SimpleNamespace(threads=4, estimate_only=False,
+                                           verify=False)
+        self.report.archive = object()
+        self.report.tracer = Tracer()
+        self.report.env_vars = set()
+        self.report.report_md = SoSMetadata()
+        self.report.report_md.add_section('plugins')
+        self.report.policy = SimpleNamespace(
+            package_manager=FakePackageManager()
+        )
+        self.plugins = [FakePlugin(f"plug{i}") for i in range(4)]
+        self.plugins.append(FakePlugin('serial', serial_setup=True))
+        self.report.loaded_plugins = [(p.name, p) for p in self.plugins]
+
+    def test_concurrent_setup(self):
+        start = time.monotonic()
+        self.report.setup()
+        # the four parallel plugins did not run one after another
+        self.assertLess(time.monotonic() - start, 0.45)
+        self.assertTrue(self.report.policy.package_manager.loaded)
+        main = threading.current_thread()
+        self.assertIs(self.plugins[-1].setup_thread, main)
+        for plug in self.plugins[:-1]:
+            self.assertIsNotNone(plug.setup_thread)
+            self.assertIsNot(plug.setup_thread, main)
+        for plug in self.plugins:
+            self.assertIs(plug.archive, self.report.archive)
+            self.assertIn('setup_time', plug.manifest._values)
+        self.assertEqual(self.report.env_vars,
+                         {f"{p.name.upper()}_ENV" for p in self.plugins})
+
+# vim: set et ts=4 sw=4 :
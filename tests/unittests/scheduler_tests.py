@@ -0,0 +1,70 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import json
+import os
+import tempfile
+import unittest
+
+from datetime import timedelta
+
+from sos.report.scheduler import PluginScheduler
+
+
+class FakePlugin():
+
+    def __init__(self, cost_hint=1):
+        self.cost_hint = cost_hint
+
+
+class PluginSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'plugin_runtimes.json')
+
+    def tearDown(self):
+        for f in os.listdir(self.tmpdir):
+            os.unlink(os.path.join(self.tmpdir, f))
+        os.rmdir(self.tmpdir)
+
+    def test_order_by_cost_hint(self):
+        sched = PluginScheduler(self.path)
+        plugs = [('alpha', FakePlugin()), ('logs', FakePlugin(60)),
+                 ('beta', FakePlugin()), ('rpm', FakePlugin(30))]
+        order = [p[0] for p in sched.order(plugs)]
+        self.assertEqual(order, ['logs', 'rpm', 'alpha', 'beta'])
+
+    def test_history_overrides_cost_hint(self):
+        with open(self.path, 'w', encoding='utf-8') as hfile:
+            json.dump({'alpha': 120.0}, hfile)
+        sched = PluginScheduler(self.path)
+        plugs = [('alpha', FakePlugin()), ('logs', FakePlugin(60))]
+        order = [p[0] for p in sched.order(plugs)]
+        self.assertEqual(order, ['alpha', 'logs'])
+        self.assertEqual(sched.expected_run_time('alpha', plugs[0][1]),
+                         (120.0, 'history'))
+        self.assertEqual(sched.expected_run_time('logs', plugs[1][1]),
+                         (60.0, 'hint'))
+
+    def test_record_and_save(self):
+        sched = PluginScheduler(self.path)
+        sched.record('alpha', timedelta(seconds=10))
+        sched.record('alpha', 20)
+        sched.save()
+        self.assertEqual(PluginScheduler(self.path).history, {'alpha': 15.0})
+
+    def test_unreadable_history(self):
+        with open(self.path, 'w', encoding='utf-8') as hfile:
+            hfile.write('not json')
+        self.assertEqual(PluginScheduler(self.path).history, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
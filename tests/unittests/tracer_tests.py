@@ -0,0 +1,79 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from sos.report.tracer import Tracer
+
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'trace.json')
+
+    def tearDown(self):
+        for f in os.listdir(self.tmpdir):
+            os.unlink(os.path.join(self.tmpdir, f))
+        os.rmdir(self.tmpdir)
+
+    def test_disabled(self):
+        tracer = Tracer()
+        with tracer.span('collect', cat='kernel'):
+            pass
+        tracer.add_span('policy load', 0, 1)
+        tracer.save()
+        self.assertEqual(tracer.events, [])
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_span(self):
+        tracer = Tracer(self.path)
+        with tracer.span('command', cat='kernel', cmd='uname -a'):
+            pass
+        tracer.add_span('policy load', 1, 1.5)
+        self.assertEqual(len(tracer.events), 2)
+        event = tracer.events[0]
+        self.assertEqual(event['name'], 'command')
+        self.assertEqual(event['cat'], 'kernel')
+        self.assertEqual(event['ph'], 'X')
+        self.assertEqual(event['args'], {'cmd': 'uname -a'})
+        self.assertEqual(event['tid'], threading.get_ident())
+        self.assertEqual(tracer.events[1]['ts'], 1000000)
+        self.assertEqual(tracer.events[1]['dur'], 500000)
+
+    def test_span_on_error(self):
+        tracer = Tracer(self.path)
+        with self.assertRaises(ValueError):
+            with tracer.span('setup'):
+                raise ValueError
+        self.assertEqual(tracer.events[0]['name'], 'setup')
+
+    def test_save(self):
+        tracer = Tracer(self.path)
+        thread = threading.Thread(target=tracer.add_span, name='worker',
+                                  args=('collect', 0, 1))
+        thread.start()
+        thread.join()
+        tracer.save()
+        with open(self.path, 'r', encoding='utf-8') as tfile:
+            trace = json.load(tfile)
+        names = {
+            e['args']['name'] for e in trace['traceEvents']
+            if e['name'] == 'thread_name'
+        }
+        self.assertEqual(names, {'worker'})
+        self.assertIn('collect', [e['name'] for e in trace['traceEvents']])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
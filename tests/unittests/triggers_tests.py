@@ -0,0 +1,78 @@
+# This file is part of the sos project: https://github.com/sosreport/sos
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# version 2 of the GNU General Public License.
+#
+# See the LICENSE file in the source distribution for further information.
+import unittest
+
+from sos.report.triggers import TriggerResolver
+from sos.utilities import is_executable
+
+
+class MockPackageManager():
+
+    packages = {'kernel': {}, 'kernel-core': {}, 'openssh-server': {}}
+
+
+class MockInitSystem():
+
+    def __init__(self):
+        self.calls = 0
+
+    def is_service(self, name):
+        self.calls += 1
+        return name == 'sshd'
+
+
+class MockPolicy():
+
+    def __init__(self):
+        self.package_manager = MockPackageManager()
+        self.init_system = MockInitSystem()
+        self.kernel_mods = ['ext4', 'xfs']
+
+
+class TriggerResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = MockPolicy()
+        self.resolver = TriggerResolver(self.policy, '/')
+
+    def test_packages(self):
+        self.assertTrue(self.resolver.is_installed('kernel'))
+        self.assertTrue(self.resolver.is_installed('openssh*'))
+        self.assertFalse(self.resolver.is_installed('kernel-rt'))
+        self.assertFalse(self.resolver.is_installed('kern'))
+
+    def test_commands(self):
+        for cmd in ('sh', 'true', '/usr/bin/timeout', 'not_a_command_at_all'):
+            self.assertEqual(self.resolver.is_executable(cmd),
+                             is_executable(cmd, '/'))
+
+    def test_kernel_mods(self):
+        self.assertTrue(self.resolver.is_module_loaded('xfs'))
+        self.assertFalse(self.resolver.is_module_loaded('btrfs'))
+
+    def test_paths(self):
+        self.assertTrue(self.resolver.path_exists(__file__))
+        self.assertFalse(self.resolver.path_exists('/this/does/not/exist'))
+
+    def test_resolved_once(self):
+        for _ in range(3):
+            self.assertTrue(self.resolver.is_service('sshd'))
+        self.assertEqual(self.policy.init_system.calls, 1)
+
+    def test_close(self):
+        self.resolver.is_service('sshd')
+        self.resolver.close()
+        self.assertFalse(self.resolver.active)
+        self.resolver.is_service('sshd')
+        self.assertEqual(self.policy.init_system.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: set et ts=4 sw=4 :
@@ -6,13 +6,15 @@
 #
 # See the LICENSE file in the source distribution for further information.
 import os.path
+import tempfile
 import unittest
 
 # PYCOMPAT
 from io import StringIO
 
 from sos.utilities import (grep, is_executable, sos_get_command_output,
-                           find, tail, shell_out)
+                           find, tail, shell_out, SoSTimeoutError,
+                           TailBuffer, get_netns_devices)
 
 TEST_DIR = os.path.dirname(__file__)
 
@@ -83,10 +85,148 @@ class ExecutableTest(unittest.TestCase):
         self.assertEqual(result['status'], 0)
         self.assertTrue(result['output'].strip().endswith(TEST_DIR))
 
+    def test_output_rusage(self):
+        cmd = "/bin/bash -c 'head -c 1000000 /dev/zero | md5sum; exit 3'"
+        result = sos_get_command_output(cmd)
+        self.assertEqual(result['status'], 3)
+        rusage = result['rusage']
+        self.assertGreater(rusage['maxrss'], 0)
+        self.assertGreaterEqual(rusage['utime'] + rusage['stime'], 0)
+        self.assertIn('read_bytes', rusage)
+        self.assertIn('write_bytes', rusage)
+
+    def test_output_rusage_poller(self):
+        result = sos_get_command_output("echo executed",
+                                        poller=lambda: False)
+        self.assertEqual(result['status'], 0)
+        self.assertEqual(result['output'], "executed\n")
+        self.assertGreater(result['rusage']['maxrss'], 0)
+
+    def test_output_sizelimit(self):
+        result = sos_get_command_output("head -c 3000000 /dev/zero",
+                                        sizelimit=1, binary=True)
+        self.assertEqual(result['status'], 0)
+        self.assertTrue(result['truncated'])
+        self.assertLessEqual(len(result['output']), 1048576)
+
+    def test_output_sizelimit_exact(self):
+        result = sos_get_command_output(
+            "sh -c 'head -c 1048576 /dev/zero; echo tail'", sizelimit=1,
+            binary=True
+        )
+        self.assertTrue(result['truncated'])
+        self.assertEqual(len(result['output']), 1048576)
+        self.assertTrue(result['output'].endswith(b'\0tail\n'))
+
+    def test_output_to_file_sizelimit(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'out')
+            result = sos_get_command_output(
+                "sh -c 'head -c 1048576 /dev/zero; echo tail'", sizelimit=1,
+                to_file=path
+            )
+            self.assertEqual(result['output'], '')
+            self.assertTrue(result['truncated'])
+            with open(path, 'rb') as ofile:
+                content = ofile.read()
+        self.assertEqual(len(content), 1048576)
+        self.assertTrue(content.endswith(b'\0tail\n'))
+
+    def test_output_to_file_not_found(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'out')
+            for limit in (None, 1):
+                result = sos_get_command_output("sos-no-such-command",
+                                                sizelimit=limit, to_file=path)
+                self.assertEqual(result['status'], 127)
+                self.assertFalse(os.path.exists(path))
+
+    def test_output_poller_timeout(self):
+        with self.assertRaises(SoSTimeoutError):
+            sos_get_command_output("sleep 10", poller=lambda: True)
+
+    def test_output_timeout(self):
+        result = sos_get_command_output("sh -c 'echo partial; sleep 10'",
+                                        timeout=1)
+        self.assertEqual(result['status'], 124)
+        self.assertTrue(result['timed_out'])
+        self.assertEqual(result['output'], "partial\n")
+
+    def test_output_status_124(self):
+        result = sos_get_command_output("sh -c 'exit 124'")
+        self.assertEqual(result['status'], 124)
+        self.assertFalse(result['timed_out'])
+
     def test_shell_out(self):
         self.assertEqual("executed\n", shell_out('echo executed'))
 
 
+class TailBufferTest(unittest.TestCase):
+
+    def test_unlimited(self):
+        buf = TailBuffer()
+        buf.write(b'abc')
+        buf.write(b'def')
+        self.assertFalse(buf.truncated)
+        self.assertEqual(buf.getvalue(), b'abcdef')
+
+    def test_keeps_tail(self):
+        buf = TailBuffer(4)
+        for data in (b'ab', b'cde', b'f'):
+            buf.write(data)
+        self.assertTrue(buf.truncated)
+        self.assertEqual(buf.getvalue(), b'cdef')
+
+    def test_write_over_size(self):
+        buf = TailBuffer(4)
+        buf.write(b'a')
+        buf.write(b'bcdefgh')
+        self.assertEqual(buf.getvalue(), b'efgh')
+
+    def test_not_truncated_at_size(self):
+        buf = TailBuffer(4)
+        buf.write(b'abcd')
+        self.assertFalse(buf.truncated)
+        self.assertEqual(buf.getvalue(), b'abcd')
+
+    def test_file(self):
+        with tempfile.NamedTemporaryFile() as tfile:
+            buf = TailBuffer(4, tfile)
+            for data in (b'ab', b'cde', b'f'):
+                buf.write(data)
+            buf.getvalue()
+            with open(tfile.name, 'rb') as rfile:
+                self.assertEqual(rfile.read(), b'cdef')
+
+
+class NetnsTest(unittest.TestCase):
+
+    def setUp(self):
+        # the current network namespace, which can be entered by anyone
+        # allowed to enter network namespaces at all
+        self.netns = f"/proc/{os.getpid()}/ns/net"
+        try:
+            get_netns_devices(self.netns)
+        except OSError as err:
+            self.skipTest(f"unable to enter network namespaces: {err}")
+
+    def test_get_devices(self):
+        devices = get_netns_devices(self.netns)
+        self.assertIn('lo', devices)
+        self.assertEqual(sorted(devices), sorted(os.listdir('/sys/class/net')))
+
+    def test_thread_restored(self):
+        before = os.readlink('/proc/thread-self/ns/net')
+        get_netns_devices(self.netns)
+        self.assertEqual(os.readlink('/proc/thread-self/ns/net'), before)
+
+    def test_command_in_netns(self):
+        result = sos_get_command_output("cat /proc/net/dev",
+                                        netns=self.netns)
+        self.assertEqual(result['status'], 0)
+        self.assertIn('lo:', result['output'])
+
+
 class FindTest(unittest.TestCase):
 
     def test_find_leaf(self):